@@ -131,6 +131,14 @@ def start_cli():
     )
     parser_compile.add_argument("-x", help="Resize volume X")
     parser_compile.add_argument("-z", help="Resize volume Z")
+    parser_compile.add_argument(
+        "--workers",
+        type=check_positive_factory("workers"),
+        help="Amount of processes to run independent connection types on",
+    )
+    parser_compile.add_argument(
+        "--seed", type=int, help="Base seed of the connection types"
+    )
 
     # Run subparser
     parser_run.add_argument(
@@ -143,6 +151,12 @@ def start_cli():
     )
     parser_run.add_argument("-x", help="Resize volume X")
     parser_run.add_argument("-z", help="Resize volume Z")
+    parser_run.add_argument(
+        "--workers",
+        type=check_positive_factory("workers"),
+        help="Amount of processes to run independent connection types on",
+    )
+    parser_run.add_argument("--seed", type=int, help="Base seed of the connection types")
 
     # Simulate subparser
     parser_sim.add_argument(
@@ -236,7 +250,7 @@ def start_cli():
         if (
             cl_args.task == "compile" or cl_args.task == "run"
         ):  # Do we need to compile a network architecture?
-            scaffoldInstance.compile_network()
+            scaffoldInstance.compile_network(workers=cl_args.workers, seed=cl_args.seed)
             if cl_args.p:  # Is a plot requested?
                 scaffoldInstance.plot_network_cache()
 
@@ -634,7 +648,7 @@ def repl_voxelize(morphology_repository, args):
     """
     m = morphology_repository.get_morphology(args.name)
     m.voxelize(args.voxels)
-    morphology_repository.store_voxel_cloud(m, overwrite=True)
+    morphology_repository.store_voxel_cloud(m, args.voxels, overwrite=True)
 
 
 def repl_view_hdf5(handle, args):
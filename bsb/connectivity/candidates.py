@@ -0,0 +1,193 @@
+"""
+Spatial queries that find the candidate partners of cells for connection strategies.
+
+The queries return the candidates of all query points at once as a
+:class:`CandidateList` so that strategies only have to sample the candidates instead
+of measuring the distance to every other cell.
+"""
+
+import numpy as np
+from sklearn.neighbors import KDTree
+
+# Relative margin on the search radius of tree queries, the exact criterion is applied
+# to the candidates afterwards.
+_MARGIN = 1e-9
+
+
+class CandidateList:
+    """
+    Candidate partners of a series of query points, in compressed sparse row format.
+    The candidates of the ``i``-th query point are
+    ``indices[indptr[i]:indptr[i + 1]]``, in ascending order.
+    """
+
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=int)
+        self.indices = np.asarray(indices, dtype=int)
+
+    @classmethod
+    def from_rows(cls, rows, indices, n):
+        """
+        Create a candidate list from the query point index and candidate index of each
+        candidate pair.
+
+        :param rows: Index of the query point of each pair.
+        :param indices: Index of the candidate of each pair.
+        :param n: Number of query points.
+        """
+        rows = np.asarray(rows, dtype=int)
+        indices = np.asarray(indices, dtype=int)
+        # Sort the pairs on a single integer key that orders them by row, then index.
+        stride = indices.max() + 1 if len(indices) else 1
+        keys = rows * stride + indices
+        keys.sort()
+        indptr = np.zeros(n + 1, dtype=int)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(indptr, keys % stride)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, i):
+        return self.indices[self.indptr[i] : self.indptr[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def counts(self):
+        """
+        Number of candidates of each query point.
+        """
+        return np.diff(self.indptr)
+
+    @property
+    def rows(self):
+        """
+        Index of the query point of each candidate.
+        """
+        return np.repeat(np.arange(len(self)), self.counts)
+
+    def pairs(self):
+        """
+        Return an (N, 2) array of query point and candidate indices.
+        """
+        return np.column_stack((self.rows, self.indices))
+
+    def select(self, mask):
+        """
+        Return a candidate list with only the candidates where ``mask`` is ``True``.
+
+        :param mask: Boolean array with an element for each candidate.
+        """
+        indptr = np.zeros(len(self) + 1, dtype=int)
+        np.cumsum(np.bincount(self.rows[mask], minlength=len(self)), out=indptr[1:])
+        return CandidateList(indptr, self.indices[mask])
+
+
+def _from_tree_query(results, n):
+    counts = np.fromiter(map(len, results), dtype=int, count=n)
+    indices = np.concatenate(results) if n else np.empty(0, dtype=int)
+    return CandidateList.from_rows(np.repeat(np.arange(n), counts), indices, n)
+
+
+def radius_candidates(points, queries, radius, tree=None, strict=False):
+    """
+    Find the points within a euclidean distance ``radius`` of each query point.
+
+    :param points: (N, D) array of candidate points.
+    :param queries: (M, D) array of query points.
+    :param radius: Maximum distance.
+    :param tree: Optional prebuilt KDTree of ``points``.
+    :param strict: Exclude the points at exactly ``radius``.
+    :rtype: :class:`.CandidateList`
+    """
+    points = np.asarray(points, dtype=float)
+    queries = np.asarray(queries, dtype=float).reshape(-1, points.shape[1])
+    if not len(points) or not len(queries):
+        return CandidateList(np.zeros(len(queries) + 1), [])
+    if tree is None:
+        tree = KDTree(points)
+    results = tree.query_radius(queries, radius * (1 + _MARGIN))
+    candidates = _from_tree_query(results, len(queries))
+    sq_dist = np.sum((points[candidates.indices] - queries[candidates.rows]) ** 2, axis=1)
+    compare = np.less if strict else np.less_equal
+    return candidates.select(compare(sq_dist, radius ** 2))
+
+
+def box_candidates(points, queries, half_widths, strict=False):
+    """
+    Find the points within an axis aligned box around each query point: each
+    coordinate may differ at most the half width of the box along that axis.
+
+    :param points: (N, D) array of candidate points.
+    :param queries: (M, D) array of query points.
+    :param half_widths: Half width of the box along each axis, or a single half width.
+      Along axes with a half width of 0 only points with the same coordinate match.
+    :param strict: Exclude the points on the faces of the box, for all axes or per axis.
+    :type strict: bool or list of bool
+    :rtype: :class:`.CandidateList`
+    :raises: ValueError if a half width is negative.
+    """
+    points = np.asarray(points, dtype=float)
+    if points.ndim == 1:
+        return slab_candidates(points, queries, half_widths, strict=np.all(strict))
+    queries = np.asarray(queries, dtype=float).reshape(-1, points.shape[1])
+    half_widths = np.broadcast_to(np.asarray(half_widths, dtype=float), points.shape[1:])
+    strict = np.broadcast_to(np.asarray(strict, dtype=bool), points.shape[1:])
+    if np.any(half_widths < 0):
+        raise ValueError("Negative box half widths: {}".format(half_widths))
+    if not len(points) or not len(queries):
+        return CandidateList(np.zeros(len(queries) + 1), [])
+    # Scale each axis by the box size so that the box becomes a chebyshev ball. Axes
+    # without width aren't scaled, their exact matches are selected afterwards.
+    scale = np.where(half_widths > 0, half_widths, 1)
+    tree = KDTree(points / scale, metric="chebyshev")
+    results = tree.query_radius(queries / scale, 1 + _MARGIN)
+    candidates = _from_tree_query(results, len(queries))
+    offsets = np.abs(points[candidates.indices] - queries[candidates.rows])
+    inside = np.where(strict, offsets < half_widths, offsets <= half_widths)
+    return candidates.select(np.all(inside, axis=1))
+
+
+def slab_candidates(points, queries, half_width, strict=False):
+    """
+    Find the points within ``half_width`` of each query point along a single axis.
+
+    :param points: (N,) array of candidate coordinates.
+    :param queries: (M,) array of query coordinates.
+    :param half_width: Half width of the slab.
+    :param strict: Exclude the points on the edges of the slab.
+    :rtype: :class:`.CandidateList`
+    """
+    points = np.asarray(points, dtype=float)
+    queries = np.asarray(queries, dtype=float).reshape(-1)
+    order = np.argsort(points, kind="stable")
+    sorted_points = points[order]
+    low = np.searchsorted(
+        sorted_points, queries - half_width, side="right" if strict else "left"
+    )
+    high = np.searchsorted(
+        sorted_points, queries + half_width, side="left" if strict else "right"
+    )
+    counts = np.maximum(high - low, 0)
+    rows = np.repeat(np.arange(len(queries)), counts)
+    starts = np.repeat(low - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    sorted_indices = np.arange(len(rows)) + starts
+    return CandidateList.from_rows(rows, order[sorted_indices], len(queries))
+
+
+def get_cell_tree(scaffold, cell_type, positions):
+    """
+    Return the KDTree of the cells of a cell type from ``scaffold.trees.cells`` if it
+    was built from the given positions, or build a new one.
+
+    :param positions: (N, 3) array of the cell positions.
+    """
+    tree = scaffold.trees.cells.get_tree(cell_type.name)
+    if tree is not None:
+        data = np.asarray(tree.data)
+        if np.array_equal(data, positions):
+            return tree
+    return KDTree(positions)
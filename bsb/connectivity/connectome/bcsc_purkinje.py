@@ -1,5 +1,6 @@
 import numpy as np
 from ..strategy import ConnectionStrategy
+from ..candidates import box_candidates
 
 
 class ConnectomeBCSCPurkinje(ConnectionStrategy):
@@ -46,38 +47,20 @@ class ConnectomeBCSCPurkinje(ConnectionStrategy):
             bc_i = 0
             sc_i = 0
 
-            baskets_x = baskets[:, 2]
-            baskets_z = baskets[:, 4]
-            stellates_x = stellates[:, 2]
-            stellates_z = stellates[:, 4]
-            for (
-                p_id,
-                p_type,
-                p_x,
-                p_y,
-                p_z,
-            ) in (
-                purkinjes
-            ):  # for all Purkinje cells: calculate which basket and stellate cells can be connected, then choose 20 of them for each typology
+            # find all cells that satisfy the distance condition for both types
+            bc_candidate_list = box_candidates(
+                basketcells[:, [2, 4]], purkinjes[:, [2, 4]], [distz, distx], strict=True
+            )
+            sc_candidate_list = box_candidates(
+                stellates[:, [2, 4]], purkinjes[:, [2, 4]], [distx, distz], strict=True
+            )
+            for (p_id, p_type, p_x, p_y, p_z), good_bc, good_sc in zip(
+                purkinjes, bc_candidate_list, sc_candidate_list
+            ):  # for all Purkinje cells: choose 20 of the basket and stellate cells that can be connected for each typology
 
                 idx_bc = 1
                 idx_sc = 1
 
-                # find all cells that satisfy the distance condition for both types
-                bc_matrix = (np.absolute(baskets_z - p_z)).__lt__(distx) & (
-                    np.absolute(baskets_x - p_x)
-                ).__lt__(distz)
-                sc_matrix = (np.absolute(stellates_z - p_z)).__lt__(distz) & (
-                    np.absolute(stellates_x - p_x)
-                ).__lt__(distx)
-
-                good_bc = np.where(bc_matrix)[
-                    0
-                ]  # indexes of basket cells that can potentially be connected
-                good_sc = np.where(sc_matrix)[
-                    0
-                ]  # indexes of stellate cells that can potentially be connected
-
                 chosen_rand_bc = np.random.permutation(good_bc)
                 good_bc_matrix = basketcells[chosen_rand_bc]
                 chosen_rand_sc = np.random.permutation(good_sc)
@@ -1,5 +1,6 @@
 import numpy as np
 from ..strategy import ConnectionStrategy
+from ..candidates import box_candidates
 
 
 class ConnectomeGapJunctions(ConnectionStrategy):
@@ -24,33 +25,33 @@ class ConnectomeGapJunctions(ConnectionStrategy):
         divergence = self.divergence
 
         def gap_junctions(cells, d_xy, d_z, dc_gj):
-            gj_sc = np.zeros((cells.shape[0] * dc_gj, 2))
             gj_i = 0
             cells_x = cells[:, 2]
             cells_y = cells[:, 3]
             cells_z = cells[:, 4]
+            # find all cells that satisfy the distance condition: the cylinders
+            # around each cell are searched through their bounding boxes.
+            candidate_list = box_candidates(
+                cells[:, 2:5], cells[:, 2:5], [d_xy, d_xy, d_z], strict=True
+            )
+            rows, others = candidate_list.rows, candidate_list.indices
+            dz = np.absolute(cells_z[others] - cells_z[rows])
+            constraint_vector = (dz).__ne__(0) & (
+                np.sqrt(
+                    (cells_x[others] - cells_x[rows]) ** 2
+                    + (cells_y[others] - cells_y[rows]) ** 2
+                )
+            ).__lt__(d_xy)
+            candidate_list = candidate_list.select(constraint_vector)
+            # Each cell makes at most `dc_gj` of its candidate connections.
+            gj_sc = np.empty((np.minimum(candidate_list.counts, dc_gj).sum(), 2))
 
-            for (
-                id,
-                type,
-                x,
-                y,
-                z,
-            ) in (
-                cells
-            ):  # for each stellate cell calculate the distance with every other cell of the same type in the volume, then choose 4 of them
+            for (id, type, x, y, z), good_sc in zip(
+                cells, candidate_list
+            ):  # for each stellate cell take the cells of the same type within range, then choose 4 of them
 
                 idx = 1
 
-                # find all cells that satisfy the distance condition
-                constraint_vector = (
-                    (np.absolute(cells_z - z)).__lt__(d_z)
-                    & (np.absolute(cells_z - z)).__ne__(0)
-                    & (np.sqrt((cells_x - x) ** 2 + (cells_y - y) ** 2)).__lt__(d_xy)
-                )
-                good_sc = np.where(constraint_vector)[
-                    0
-                ]  # indexes of stellate cells that can potentially be connected
                 chosen_rand = np.random.permutation(good_sc)
                 candidates = cells[chosen_rand]
 
@@ -96,40 +97,21 @@ class ConnectomeGapJunctionsGolgi(ConnectionStrategy):
         def connectome_gj_goc(
             r_goc_vol, GoCaxon_x, GoCaxon_y, GoCaxon_z, golgicells, first_golgi
         ):
-            gj_goc = np.zeros((golgis.shape[0] ** 2, 2))
-            start_index = 0
-            golgi_x = golgicells[:, 2]
-            golgi_y = golgicells[:, 3]
-            golgi_z = golgicells[:, 4]
-            self_index = 0
-            for (
-                i
-            ) in (
-                golgicells
-            ):  # for each Golgi find all cells of the same type that, through their dendritic tree, fall into its axonal tree
-
-                bool_vector = (np.absolute(golgi_x - i[2])).__le__(
-                    r_goc_vol + (GoCaxon_x / 2.0)
-                )
-                bool_vector[self_index] = False  # Don't connect a golgi cell to itself
-                bool_vector = bool_vector & (np.absolute(golgi_y - i[3])).__le__(
-                    r_goc_vol + (GoCaxon_y / 2.0)
-                )
-                bool_vector = bool_vector & (np.absolute(golgi_z - i[4])).__le__(
-                    r_goc_vol + (GoCaxon_z / 2.0)
-                )
-
-                good_goc = np.where(bool_vector)[
-                    0
-                ]  # finds indexes of Golgi cells that satisfy all conditions
-
-                end_index = start_index + len(good_goc)
-                gj_goc[start_index:end_index, 0] = i[0]
-                gj_goc[start_index:end_index, 1] = golgicells[good_goc][:, 0]
-                start_index = end_index
-                self_index += 1
-
-            return gj_goc[0:end_index]
+            # for each Golgi find all cells of the same type that, through their
+            # dendritic tree, fall into its axonal tree
+            candidate_list = box_candidates(
+                golgicells[:, 2:5],
+                golgicells[:, 2:5],
+                r_goc_vol + np.array([GoCaxon_x, GoCaxon_y, GoCaxon_z]) / 2.0,
+            )
+            # Don't connect a golgi cell to itself
+            candidate_list = candidate_list.select(
+                candidate_list.indices != candidate_list.rows
+            )
+            gj_goc = np.empty((len(candidate_list.indices), 2))
+            gj_goc[:, 0] = golgicells[candidate_list.rows, 0]
+            gj_goc[:, 1] = golgicells[candidate_list.indices, 0]
+            return gj_goc
 
         result = connectome_gj_goc(
             r_goc_vol, GoCaxon_x, GoCaxon_y, GoCaxon_z, golgis, first_golgi
@@ -26,7 +26,7 @@ class ConnectomeGlomerulusGolgi(ConnectionStrategy):
                     + " (Requires the selection of morphologies to be moved from the connection module to the placement module)"
                 )
             mr = self.scaffold.morphology_repository
-            morphology = mr.get_morphology(morphologies[0])
+            morphology = mr.get_cached_morphology(morphologies[0])
             self.dendritic_compartments = morphology.get_compartments(["dendrites"])
             self.morphology = morphology
 
@@ -1,5 +1,6 @@
 import numpy as np, random
 from ..strategy import ConnectionStrategy
+from ..candidates import radius_candidates, get_cell_tree
 from ...exceptions import ConfigurationError, ConnectivityError
 
 
@@ -25,7 +26,7 @@ class ConnectomeGlomerulusGranule(ConnectionStrategy):
                     + " (Requires the selection of morphologies to be moved from the connection module to the placement module)"
                 )
             mr = self.scaffold.morphology_repository
-            morphology = mr.get_morphology(morphologies[0])
+            morphology = mr.get_cached_morphology(morphologies[0])
             dendritic_compartments = morphology.get_compartments(["dendrites"])
             dendrites = {}
             for c in dendritic_compartments:
@@ -52,51 +53,56 @@ class ConnectomeGlomerulusGranule(ConnectionStrategy):
             """
             Legacy code block to connect glomeruli to granule cells
             """
-            glom_x = glomeruli[:, 2]
-            glom_y = glomeruli[:, 3]
-            glom_z = glomeruli[:, 4]
             results = np.empty((granules.shape[0] * n_conn_glom, 2))
             next_index = 0
+            # Find all glomeruli at a maximum distance of `dendrite_length` of each
+            # granule cell.
+            tree = get_cell_tree(self.scaffold, from_cell_type, glomeruli[:, 2:5])
+            candidate_list = radius_candidates(
+                glomeruli[:, 2:5], granules[:, 2:5], dend_len, tree=tree, strict=True
+            )
+            offsets = (
+                glomeruli[candidate_list.indices, 2:5]
+                - granules[candidate_list.rows, 2:5]
+            )
+            distances = (
+                (offsets[:, 0] ** 2) + (offsets[:, 1] ** 2) + (offsets[:, 2] ** 2)
+            ) - (dend_len ** 2)
+            # Mossy fiber of each glomerulus, glomeruli without one get a unique id.
+            glom_mf = np.array(
+                [glom_mf_map.get(g, -1 - i) for i, g in enumerate(glomeruli[:, 0])]
+            )
             # Find glomeruli to connect to each granule cell
-            for gran_id, gran_type, gran_x, gran_y, gran_z in granules:
-                # Use a naive approach to find all glomeruli at a maximum distance of `dendrite_length`
-                distance_vector = (
-                    ((glom_x - gran_x) ** 2)
-                    + ((glom_y - gran_y) ** 2)
-                    + ((glom_z - gran_z) ** 2)
-                    - (dend_len ** 2)
-                )
-                # Indices of glomeruli that can potentially be connected
-                good_gloms = np.where((distance_vector < 0.0) == True)[0]
-                had_mf = set()
-                candidates = []
-                for g in np.random.permutation(good_gloms):
-                    mf = glom_mf_map[g + first_glomerulus]
-                    if mf in had_mf:
-                        continue
-                    had_mf.add(mf)
-                    candidates.append(g)
-                good_gloms = np.array(candidates)
-                good_gloms_len = len(good_gloms)
+            for gran_id, start, end in zip(
+                granules[:, 0], candidate_list.indptr[:-1], candidate_list.indptr[1:]
+            ):
+                good_gloms = candidate_list.indices[start:end]
+                distance_vector = distances[start:end]
+                # Select the first glomerulus of each mossy fiber in a random order.
+                order = np.random.permutation(len(good_gloms))
+                _, first_of_mf = np.unique(glom_mf[good_gloms[order]], return_index=True)
+                candidates = order[np.sort(first_of_mf)]
+                good_gloms_len = len(candidates)
                 # Do we find more than enough candidates?
                 if good_gloms_len > n_conn_glom:  # Yes: select the closest ones
                     # Get the distances of the glomeruli within range
-                    gloms_distance = distance_vector[good_gloms]
+                    gloms_distance = distance_vector[candidates]
                     # Sort the good glomerulus id vector by the good glomerulus distance vector
-                    connected_gloms = good_gloms[gloms_distance.argsort()]
+                    connected_gloms = good_gloms[candidates[gloms_distance.argsort()]]
                     connected_glom_len = n_conn_glom
                 else:  # No: select all of them
-                    connected_gloms = good_gloms
+                    connected_gloms = good_gloms[candidates]
                     connected_glom_len = good_gloms_len
-                # Connect the selected glomeruli to the current gran_id
-                for i in range(connected_glom_len):
-                    # Add the first_glomerulus id to convert their local id to their real simulation id
-                    results[next_index + i] = [
-                        connected_gloms[i] + first_glomerulus,
-                        gran_id,
-                    ]
+                # Connect the selected glomeruli to the current gran_id, add the
+                # first_glomerulus id to convert their local id to their real
+                # simulation id
+                end_index = next_index + connected_glom_len
+                results[next_index:end_index, 0] = (
+                    connected_gloms[:connected_glom_len] + first_glomerulus
+                )
+                results[next_index:end_index, 1] = gran_id
                 # Move up the internal array pointer
-                next_index += connected_glom_len
+                next_index = end_index
             # Truncate the pre-allocated array to the internal array pointer.
             return results[:next_index, :]
 
@@ -1,5 +1,6 @@
 import numpy as np
 from ..strategy import ConnectionStrategy
+from ..candidates import box_candidates
 
 
 class ConnectomeGolgiGlomerulus(ConnectionStrategy):
@@ -43,36 +44,26 @@ class ConnectomeGolgiGlomerulus(ConnectionStrategy):
             layer_thickness,
             oob,
         ):
-            glom_x = glomeruli[:, 2]
-            glom_y = glomeruli[:, 3]
-            glom_z = glomeruli[:, 4]
             new_glomeruli = np.copy(glomeruli)
             new_golgicells = np.random.permutation(golgicells)
             connections = np.zeros((golgis.shape[0] * n_conn_goc, 2))
             new_connection_index = 0
+            # Find the glomeruli that fall into the box of the axon of each Golgi cell,
+            # excluding the glomeruli that only touch its top or bottom.
+            candidate_list = box_candidates(
+                glomeruli[:, 2:5],
+                new_golgicells[:, 2:5],
+                np.array([GoCaxon_x, GoCaxon_y, GoCaxon_z]) / 2.0 + r_glom,
+                strict=[False, True, False],
+            )
 
             # for all Golgi cells: calculate which glomeruli fall into the area of GoC
             # axon, then choose 40 of them for the connection and delete them from
             # successive computations, since 1 glomerulus must be connected to only 1 GoC
-            for golgi_id, golgi_type, golgi_x, golgi_y, golgi_z in new_golgicells:
-                # Check geometrical constraints
-                # glomerulus falls into the x range of values?
-                bool_vector = ((glom_x + r_glom).__ge__(golgi_x - GoCaxon_x / 2.0)) & (
-                    (glom_x - r_glom).__le__(golgi_x + GoCaxon_x / 2.0)
-                )
-                # glomerulus falls into the y range of values?
-                bool_vector = bool_vector & (
-                    ((glom_y + r_glom) > (golgi_y - GoCaxon_y / 2.0))
-                    & ((glom_y - r_glom) < (golgi_y + GoCaxon_y / 2.0))
-                )
-                # glomerulus falls into the z range of values?
-                bool_vector = bool_vector & (
-                    ((glom_z + r_glom).__ge__(golgi_z - GoCaxon_z / 2.0))
-                    & ((glom_z - r_glom).__le__(golgi_z + GoCaxon_z / 2.0))
-                )
-
+            for (golgi_id, golgi_type, golgi_x, golgi_y, golgi_z), good_gloms in zip(
+                new_golgicells, candidate_list
+            ):
                 # Make a permutation of all candidate glomeruli
-                good_gloms = np.where(bool_vector)[0]
                 chosen_rand = np.random.permutation(good_gloms)
                 good_gloms_matrix = new_glomeruli[chosen_rand]
                 # Calculate the distance between the golgi cell and all glomerulus candidates, normalize distance by layer thickness
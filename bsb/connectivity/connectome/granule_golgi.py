@@ -1,5 +1,6 @@
 import numpy as np
 from ..strategy import ConnectionStrategy
+from ..candidates import radius_candidates, slab_candidates
 from ...exceptions import *
 from ...reporting import warn
 
@@ -44,50 +45,51 @@ class ConnectomeGranuleGolgi(ConnectionStrategy):
             tot_conn,
             scaffold,
         ):
-            aa_goc = np.empty((0, 2))
-            pf_goc = np.empty((0, 2))
+            aa_goc = []
+            pf_goc = []
             densityWarningSent = False
             new_granules = np.copy(granules)
-            granules_x = new_granules[:, 2]
-            granules_z = new_granules[:, 4]
             new_golgicells = np.random.permutation(golgicells)
             if new_granules.shape[0] <= new_golgicells.shape[0]:
                 raise ConnectivityError(
                     "The number of granule cells was less than the number of golgi cells. Simulation cannot continue."
                 )
-            for golgi_id, _, golgi_x, golgi_y, golgi_z in new_golgicells:
-                # Distance of this golgi cell to all ascending axons
-                distance_vector = ((granules_x - golgi_x) ** 2) + (
-                    (granules_z - golgi_z) ** 2
+            # Granules whose ascending axon has been connected to a Golgi cell
+            connected = np.zeros(len(granules), dtype=bool)
+            # Granules whose ascending axon is connected to the current Golgi cell
+            connected_to_golgi = np.zeros(len(granules), dtype=bool)
+            # Find the ascending axons and parallel fibers that can potentially be
+            # connected to each Golgi cell.
+            aa_candidate_list = radius_candidates(
+                granules[:, [2, 4]], new_golgicells[:, [2, 4]], r_goc_vol
+            )
+            pf_candidate_list = slab_candidates(
+                granules[:, 2], new_golgicells[:, 2], r_goc_vol
+            )
+            for golgi, AA_candidates, pf_candidates in zip(
+                new_golgicells, aa_candidate_list, pf_candidate_list
+            ):
+                golgi_id, _, golgi_x, golgi_y, golgi_z = golgi
+                AA_candidates = AA_candidates[~connected[AA_candidates]]
+                # Distance of this golgi cell to the candidate ascending axons
+                distance_vector = ((granules[AA_candidates, 2] - golgi_x) ** 2) + (
+                    (granules[AA_candidates, 4] - golgi_z) ** 2
                 )
-                AA_candidates = np.where((distance_vector).__le__(r_goc_vol ** 2))[
-                    0
-                ]  # finds indexes of ascending axons that can potentially be connected
-                chosen_rand = np.random.permutation(AA_candidates)
-                selected_granules = new_granules[chosen_rand]
+                chosen_rand = np.random.permutation(len(AA_candidates))
+                selected_granules = new_granules[AA_candidates[chosen_rand]]
                 selected_distances = np.sqrt(distance_vector[chosen_rand])
                 prob = selected_distances / r_goc_vol
                 distance_sort = prob.argsort()
                 selected_granules = selected_granules[distance_sort]
                 prob = prob[distance_sort]
                 rolls = np.random.uniform(size=len(selected_granules))
-                connectedAA = np.empty(n_connAA)
-                idx = 0
-                for ind, j in enumerate(selected_granules):
-                    if idx < n_connAA:
-                        if rolls[ind] > prob[ind]:
-                            connectedAA[idx] = j[0]
-                            idx += 1
-                connectedAA = connectedAA[0:idx]
-                good_grc = np.delete(
-                    granules, np.array(connectedAA - first_granule, dtype=int), 0
-                )
-                intersections = (good_grc[:, 2]).__ge__(golgi_x - r_goc_vol) & (
-                    good_grc[:, 2]
-                ).__le__(golgi_x + r_goc_vol)
-                good_pf = np.where(intersections == True)[
-                    0
-                ]  # finds indexes of granules that can potentially be connected
+                connectedAA = selected_granules[rolls > prob, 0][:n_connAA]
+                # Parallel fibers of the granules that weren't connected through
+                # their ascending axon to this Golgi cell.
+                aa_idx = np.array(connectedAA - first_granule, dtype=int)
+                connected_to_golgi[aa_idx] = True
+                good_pf = pf_candidates[~connected_to_golgi[pf_candidates]]
+                connected_to_golgi[aa_idx] = False
                 # The remaining amount of parallel fibres to connect after subtracting the amount of already connected ascending axons.
                 AA_connected_count = len(connectedAA)
                 parallelFibersToConnect = tot_conn - AA_connected_count
@@ -112,17 +114,19 @@ class ConnectomeGranuleGolgi(ConnectionStrategy):
                     )
                     totalConnectionsMade = tot_conn
                 PF_connected_count = connected_pf.shape[0]
-                pf_idx = good_grc[connected_pf, :]
+                pf_idx = granules[connected_pf, :]
                 matrix_aa = np.zeros((AA_connected_count, 2))
                 matrix_pf = np.zeros((PF_connected_count, 2))
                 matrix_pf[0:PF_connected_count, 0] = pf_idx[:, 0]
                 matrix_aa[0:AA_connected_count, 0] = connectedAA
                 matrix_pf[:, 1] = golgi_id
                 matrix_aa[:, 1] = golgi_id
-                pf_goc = np.vstack((pf_goc, matrix_pf))
-                aa_goc = np.vstack((aa_goc, matrix_aa))
-                new_granules[((connectedAA.astype(int)) - first_granule), :] = OoB_value
+                pf_goc.append(matrix_pf)
+                aa_goc.append(matrix_aa)
+                connected[(connectedAA.astype(int)) - first_granule] = True
                 # End of Golgi cell loop
+            aa_goc = np.concatenate([np.empty((0, 2))] + aa_goc)
+            pf_goc = np.concatenate([np.empty((0, 2))] + pf_goc)
             aa_goc = aa_goc[aa_goc[:, 1].argsort()]
             pf_goc = pf_goc[
                 pf_goc[:, 1].argsort()
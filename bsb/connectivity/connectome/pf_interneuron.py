@@ -1,5 +1,6 @@
 import numpy as np
 from ..strategy import ConnectionStrategy
+from ..candidates import radius_candidates
 
 
 class ConnectomePFInterneuron(ConnectionStrategy):
@@ -22,22 +23,13 @@ class ConnectomePFInterneuron(ConnectionStrategy):
         pf_heights = 150 + granules[:, 3]
 
         def connectome_pf_inter(first_granule, interneurons, granules, r_sb, h_pf):
-            pf_interneuron = np.zeros((0, 2))
             # for each interneuron find all the parallel fibers that fall into the sphere with centre the cell soma and appropriate radius
-            for i in interneurons:
-
-                # find all cells that satisfy the condition
-                interneuron_matrix = (
-                    ((granules[:, 2] - i[2]) ** 2) + ((h_pf - i[3]) ** 2) - (r_sb ** 2)
-                ).__le__(0)
-                # indexes of interneurons that can potentially be connected
-                good_pf = np.where(interneuron_matrix)[0]
-
-                matrix = np.zeros((len(good_pf), 2))
-                matrix[:, 1] = i[0]
-                matrix[:, 0] = good_pf + first_granule
-                pf_interneuron = np.vstack((pf_interneuron, matrix))
-
+            candidate_list = radius_candidates(
+                np.column_stack((granules[:, 2], h_pf)), interneurons[:, 2:4], r_sb
+            )
+            pf_interneuron = np.zeros((len(candidate_list.indices), 2))
+            pf_interneuron[:, 1] = interneurons[candidate_list.rows, 0]
+            pf_interneuron[:, 0] = candidate_list.indices + first_granule
             return pf_interneuron
 
         result = connectome_pf_inter(
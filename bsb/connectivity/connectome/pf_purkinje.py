@@ -1,5 +1,6 @@
 import numpy as np
 from ..strategy import ConnectionStrategy
+from ..candidates import slab_candidates
 
 
 class ConnectomePFPurkinje(ConnectionStrategy):
@@ -20,25 +21,12 @@ class ConnectomePFPurkinje(ConnectionStrategy):
         purkinje_extension_x = purkinje_cell_type.placement.extension_x
 
         def connectome_pf_pc(first_granule, granules, purkinjes, x_pc):
-            pf_pc = np.zeros((0, 2))
-            # for all Purkinje cells: calculate and choose which parallel fibers fall into the area of PC dendritic tree (then delete them from successive computations, since 1 parallel fiber is connected to a maximum of PCs)
-            for i in purkinjes:
-                # which parallel fibers fall into the x range of values?
-                bool_matrix = (granules[:, 2]).__ge__(i[2] - x_pc / 2.0) & (
-                    granules[:, 2]
-                ).__le__(
-                    i[2] + x_pc / 2.0
-                )  # CAMBIARE IN new_granules SE VINCOLO SU 30 pfs
-                good_pf = np.where(bool_matrix)[
-                    0
-                ]  # finds indexes of parallel fibers that, on the selected axis, satisfy the condition
-
-                # construction of the output matrix: the first column has the GrC id, while the second column has the PC id
-                matrix = np.zeros((len(good_pf), 2))
-                matrix[:, 1] = i[0]
-                matrix[:, 0] = good_pf + first_granule
-                pf_pc = np.vstack((pf_pc, matrix))
-
+            # for all Purkinje cells: calculate and choose which parallel fibers fall into the x range of the PC dendritic tree
+            candidate_list = slab_candidates(granules[:, 2], purkinjes[:, 2], x_pc / 2.0)
+            # construction of the output matrix: the first column has the GrC id, while the second column has the PC id
+            pf_pc = np.zeros((len(candidate_list.indices), 2))
+            pf_pc[:, 1] = purkinjes[candidate_list.rows, 0]
+            pf_pc[:, 0] = candidate_list.indices + first_granule
             return pf_pc
 
         result = connectome_pf_pc(
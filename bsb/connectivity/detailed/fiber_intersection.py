@@ -9,12 +9,9 @@ from ...helpers import ConfigurableClass
 from ...networks import FiberMorphology, Branch
 from ...plotting import plot_fiber_morphology
 from ...reporting import report, warn
+from ...voxels import intersect_boxes, group_pairs, tree_boxes, box_index
 import abc
 
-# Import rtree
-from rtree import index
-from rtree.index import Rtree
-
 
 class FiberIntersection(ConnectionStrategy, MorphologyStrategy):
     """
@@ -59,9 +56,6 @@ class FiberIntersection(ConnectionStrategy, MorphologyStrategy):
     def connect(self):
         scaffold = self.scaffold
 
-        p = index.Property(dimension=3)
-        to_cell_tree = index.Index(properties=p)
-
         # Select all the cells from the pre- & postsynaptic type for a specific connection.
         from_type = self.from_cell_types[0]
         from_compartments = self.from_cell_compartments[0]
@@ -85,11 +79,13 @@ class FiberIntersection(ConnectionStrategy, MorphologyStrategy):
 
         # For every postsynaptic cell, derive the box incorporating all voxels,
         # and store that box in the tree, to later find intersections with that cell.
+        to_boxes = []
         for i, (to_cell, morphology) in enumerate(to_morphology_set):
             self.assert_voxelization(morphology, to_compartments)
             to_offset = np.concatenate((to_cell.position, to_cell.position))
             to_box = morphology.cloud.get_voxel_box()
-            to_cell_tree.insert(i, tuple(to_box + to_offset))
+            to_boxes.append(to_box + to_offset)
+        to_cell_tree = box_index(to_boxes)
 
         connections_out = []
         compartments_out = []
@@ -130,27 +126,12 @@ class FiberIntersection(ConnectionStrategy, MorphologyStrategy):
             # (4) Interpolate again
             self.interpolate_branches(fm.root_branches)
 
-            # (5) Voxelize all branches of the transformed fiber morphology
-            p = index.Property(dimension=3)
-            # The bounding box is incrementally expanded, these initial bounds are a point
-            # at the start of the first root branch.
-            from_bounding_box = [
-                fm.root_branches[0]._compartments[0].start + from_cell.position
-            ] * 2
-            from_voxel_tree = index.Index(properties=p)
-            from_map = []
-            (
-                from_bounding_box,
-                from_voxel_tree,
-                from_map,
-                voxel_list,
-            ) = self.voxelize_branches(
-                fm.root_branches,
-                from_cell.position,
-                from_bounding_box,
-                from_voxel_tree,
-                from_map,
+            # (5) Voxelize all branches of the transformed fiber morphology into the
+            # boxes around its compartments, in absolute coordinates.
+            from_bounding_box, _, from_map, from_voxels = self.voxelize_branches(
+                fm.root_branches, from_cell.position, tree=False
             )
+            from_voxel_boxes = (np.arange(len(from_map)), from_voxels)
 
             # (6) Check for intersections of the postsyn tree with the bounding box
 
@@ -158,8 +139,9 @@ class FiberIntersection(ConnectionStrategy, MorphologyStrategy):
 
             # Bounding box intersection to identify possible connected candidates, using
             # the bounding box of the point cloud. Query the Rtree for intersections of
-            # to_cell boxes with our from_cell box
-            cell_intersections = list(
+            # to_cell boxes with our from_cell box, sorted so that the random draws don't
+            # depend on the tree layout.
+            cell_intersections = sorted(
                 to_cell_tree.intersection(
                     tuple(np.concatenate(from_bounding_box)), objects=False
                 )
@@ -182,7 +164,7 @@ class FiberIntersection(ConnectionStrategy, MorphologyStrategy):
                 # Find which voxels inside the bounding box of the fiber and the cell box
                 # actually intersect with eachother.
                 voxel_intersections = self.intersect_voxel_tree(
-                    from_voxel_tree, to_morpho.cloud, to_cell.position
+                    from_voxel_boxes, to_morpho.cloud, to_cell.position
                 )
                 # Returns a list of lists: the elements in the inner lists are the indices
                 # of the voxels in the from point cloud, the indices of the lists inside
@@ -259,25 +241,20 @@ class FiberIntersection(ConnectionStrategy, MorphologyStrategy):
         Similarly to `intersect_clouds` from `VoxelIntersection`, it finds intersecting voxels between a from_voxel_tree
         and a to_cloud set of voxels
 
-        :param from_voxel_tree: tree built from the voxelization of all branches in the fiber (in absolute coordinates)
-        :type from_point_cloud: Rtree index
+        :param from_voxel_tree: tree built from the voxelization of all branches in the fiber (in absolute coordinates), or its ids and boxes from :func:`.voxels.tree_boxes`
+        :type from_voxel_tree: Rtree index or tuple
         :param to_cloud: voxel cloud associated to a to_cell morphology
         :type to_cloud: `VoxelCloud`
         :param to_pos: 3-D position of to_cell neuron
         :type to_pos: list
         """
-
-        voxel_intersections = []
-
-        # Find intersection of to_cloud with from_voxel_tree
-        for v, voxel in enumerate(to_cloud.get_voxels(cache=True)):
-            absolute_position = np.add(voxel, to_pos)
-            absolute_box = np.add(absolute_position, to_cloud.grid_size)
-            box = np.concatenate((absolute_position, absolute_box))
-            voxel_intersections.append(
-                list(from_voxel_tree.intersection(tuple(box), objects=False))
-            )
-        return voxel_intersections
+        if not isinstance(from_voxel_tree, tuple):
+            from_voxel_tree = tree_boxes(from_voxel_tree)
+        ids, boxes = from_voxel_tree
+        to_voxels, from_voxels = intersect_boxes(boxes, to_cloud.get_voxel_boxes(to_pos))
+        return group_pairs(
+            to_voxels, ids[from_voxels], len(to_cloud.get_voxels(cache=True))
+        )
 
     def assert_voxelization(self, morphology, compartment_types):
         if len(morphology.cloud.get_voxels()) == 0:
@@ -293,24 +270,54 @@ class FiberIntersection(ConnectionStrategy, MorphologyStrategy):
             self.interpolate_branches(branch.child_branches)
 
     def voxelize_branches(
-        self,
-        branches,
-        position,
-        bounding_box=None,
-        voxel_tree=None,
-        map=None,
-        voxel_list=None,
+        self, branches, position, bounding_box=None, voxel_tree=None, map=None, tree=True
     ):
-        voxel_list = []
-        for branch in branches:
-            bounding_box, voxel_tree, map, voxel_list = branch.voxelize(
-                position, bounding_box, voxel_tree, map, voxel_list
-            )
-            self.voxelize_branches(
-                branch.child_branches, position, bounding_box, voxel_tree, map, voxel_list
-            )
+        """
+        Voxelize the compartments of the branches and their child branches into the
+        boxes around each compartment, in absolute coordinates. The boxes of all
+        compartments are computed at once and bulk loaded into a new Rtree index, unless
+        an index is given to insert them into or ``tree`` is ``False``.
+
+        :param tree: Build an Rtree index of the voxels. Without an index only the
+          array of voxel boxes is returned, and ``None`` in place of the index.
+        :type tree: bool
+        :returns: The bounding box of the compartment ends, the Rtree index, the
+          compartment of each voxel and an (N, 6) array of the voxel boxes.
+        :rtype: tuple
+        """
+        compartments = list(_walk_compartments(branches))
+        if map is None:
+            map = []
+        if not compartments:
+            if voxel_tree is None and tree:
+                voxel_tree = box_index([])
+            return bounding_box, voxel_tree, map, np.empty((0, 6))
+        starts = np.array([c.start for c in compartments], dtype=float)
+        ends = np.array([c.end for c in compartments], dtype=float)
+        if bounding_box is None:
+            # The bounding box is expanded from the start of the first root branch.
+            bounding_box = [starts[0] + position] * 2
+        bounding_box = [
+            np.minimum(bounding_box[0], np.min(ends + position, axis=0)),
+            np.maximum(bounding_box[1], np.max(ends + position, axis=0)),
+        ]
+        voxels = np.column_stack(
+            (np.minimum(starts, ends) + position, np.maximum(starts, ends) + position)
+        )
+        if voxel_tree is not None:
+            for v, voxel in enumerate(voxels, start=len(map)):
+                voxel_tree.insert(v, tuple(voxel))
+        elif tree:
+            voxel_tree = box_index(voxels, ids=range(len(map), len(map) + len(voxels)))
+        map.extend(compartments)
+        return bounding_box, voxel_tree, map, voxels
+
 
-        return bounding_box, voxel_tree, map, voxel_list
+def _walk_compartments(branches):
+    # Depth first iteration over the compartments of the branches and their children.
+    for branch in branches:
+        yield from branch._compartments
+        yield from _walk_compartments(branch.child_branches)
 
 
 class FiberTransform(ConfigurableClass):
@@ -386,8 +393,6 @@ class QuiverTransform(FiberTransform):
 
         """
         orientation_data = self.quivers
-        volume_res = self.vol_res
-        volume_start = self.vol_start
 
         if not self.shared:
             # Compute branch direction - to check that PFs have 2 branches, left and right
@@ -396,62 +401,66 @@ class QuiverTransform(FiberTransform):
             if branch_dir is False:
                 return
 
-            num_comp = len(branch._compartments)
-
-            # Compute length of the first compartment in the current branch
-            length_comp = np.linalg.norm(
-                branch._compartments[0].end - branch._compartments[0].start
-            )
-            # Looping over branch compartments to transform them
-            for comp in range(len(branch._compartments)):
-                # Find direction transversal to branch: cross product between
-                # the branch direction and the original morphology/parent branch
-                if branch.orientation is None:
-                    transversal_vector = np.cross(branch_dir, [0, 1, 0])
-                else:
-                    transversal_vector = np.cross(branch_dir, branch.orientation)
-
+            compartments = branch._compartments
+            num_comp = len(compartments)
+            # The direction transversal to the branch is the cross product between the
+            # branch direction and the original morphology/parent branch orientation.
+            if branch.orientation is None:
+                transversal_vector = np.cross(branch_dir, [0, 1, 0])
+            else:
+                transversal_vector = np.cross(branch_dir, branch.orientation)
+            # Each transformed compartment keeps its original length.
+            lengths = np.array([np.linalg.norm(c.end - c.start) for c in compartments])
+            # The transformed points: the start of the branch followed by the end of
+            # each compartment, which is also the start of the next compartment.
+            points = np.empty((num_comp + 1, 3))
+            points[0] = compartments[0].start
+            comp = 0
+            cut = False
+            while comp < num_comp:
                 # Extracting index of voxel where the current compartment is located
-                voxel_ind = (
-                    branch._compartments[comp].start + offset - volume_start
-                ) / volume_res
-
-                voxel_ind = voxel_ind.astype(int) - [1, 1, 1]
+                voxel_ind = self._get_voxel_indices(points[comp], offset)
                 # Catch values falling outside of quiver field volume
-                if (np.array(voxel_ind) < np.array([0, 0, 0])).all() or (
-                    np.array(voxel_ind) > np.array(orientation_data.shape[1:])
+                if (voxel_ind < 0).all() or (
+                    voxel_ind > np.array(orientation_data.shape[1:])
                 ).all():
-                    # Update number of cut branches
-                    self._branch_cut_num += 1
-                    # Detach subsequent compartments from branch
-                    leftover_branch = branch.detach(branch._compartments[comp])
+                    cut = True
                     break
-
                 orientation_vector = orientation_data[
                     :, voxel_ind[0], voxel_ind[1], voxel_ind[2]
                 ]
-
-                # Catch values belonging to a different area than the reconstructed one (marked by NaN)
+                # Catch values belonging to a different area than the reconstructed one
+                # (marked by NaN)
                 if np.isnan(orientation_vector).any():
-                    self._branch_cut_num += 1
-                    # Detach subsequent compartments from branch
-                    leftover_branch = branch.detach(branch._compartments[comp])
+                    cut = True
                     break
-
                 cross_prod = np.cross(orientation_vector, transversal_vector)
                 cross_prod = cross_prod / np.linalg.norm(cross_prod)
-
-                # Transform compartment
-                branch._compartments[comp].end = (
-                    branch._compartments[comp].start + cross_prod * length_comp
+                # All compartments that start in this voxel have the same direction:
+                # transform the rest of the branch along it with a cumulative sum, and
+                # keep the compartments up to the first one that starts in another voxel.
+                steps = cross_prod * lengths[comp:, np.newaxis]
+                run = np.cumsum(np.vstack((points[comp], steps)), axis=0)[1:]
+                left = np.any(
+                    self._get_voxel_indices(run[:-1], offset) != voxel_ind, axis=1
                 )
-                if comp < (num_comp - 1):
-                    length_comp = np.linalg.norm(
-                        branch._compartments[comp + 1].end
-                        - branch._compartments[comp + 1].start
-                    )
-                    # The new end is the start of the adjacent compartment
-                    branch._compartments[comp + 1].start = branch._compartments[comp].end
+                run_length = np.argmax(left) + 1 if left.any() else len(run)
+                points[comp + 1 : comp + run_length + 1] = run[:run_length]
+                comp += run_length
+            # Update the compartments, the new end is the start of the adjacent compartment.
+            for i in range(comp):
+                compartments[i].end = points[i + 1]
+                if i < num_comp - 1:
+                    compartments[i + 1].start = compartments[i].end
+            if cut:
+                # Update number of cut branches
+                self._branch_cut_num += 1
+                # Detach subsequent compartments from branch
+                branch.detach(compartments[comp])
+
+    def _get_voxel_indices(self, points, offset):
+        voxel_ind = (points + offset - self.vol_start) / self.vol_res
+        return voxel_ind.astype(int) - [1, 1, 1]
 
     def get_branch_direction(self, branch):
         for comp in branch._compartments:
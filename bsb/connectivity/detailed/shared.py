@@ -17,20 +17,10 @@ class MorphologyStrategy:
                 )
             )
         m_name = random_element(available_morphologies)
-        if not m_name in self.morphology_cache:
-            mr = self.scaffold.morphology_repository
-            self.morphology_cache[m_name] = mr.get_morphology(
-                m_name, scaffold=self.scaffold
-            )
-        return self.morphology_cache[m_name]
+        return self.scaffold.morphology_repository.get_cached_morphology(m_name)
 
     def get_all_morphologies(self, cell_type):
-        all_morphologies = []
-        for m_name in self.list_all_morphologies(cell_type):
-            if not m_name in self.morphology_cache:
-                mr = self.scaffold.morphology_repository
-                self.morphology_cache[m_name] = mr.get_morphology(
-                    m_name, scaffold=self.scaffold
-                )
-            all_morphologies.append(self.morphology_cache[m_name])
-        return all_morphologies
+        mr = self.scaffold.morphology_repository
+        return [
+            mr.get_cached_morphology(m) for m in self.list_all_morphologies(cell_type)
+        ]
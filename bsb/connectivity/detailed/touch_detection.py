@@ -6,7 +6,10 @@ from ...helpers import (
     assert_attr_in,
 )
 from ...reporting import report, warn
-from random import sample as sample_elements
+from sklearn.neighbors import KDTree
+
+# Maximum amount of query points stacked into a single tree query.
+_MAX_QUERY_POINTS = 2 ** 20
 
 
 class TouchInformation:
@@ -61,9 +64,6 @@ class TouchDetector(ConnectionStrategy, MorphologyStrategy):
         )
 
     def connect(self):
-        # Create a dictionary to cache loaded morphologies.
-        self.morphology_cache = {}
-
         for from_cell_type_index in range(len(self.from_cell_types)):
             from_cell_type = self.from_cell_types[from_cell_type_index]
             from_cell_compartments = self.from_cell_compartments[from_cell_type_index]
@@ -97,8 +97,6 @@ class TouchDetector(ConnectionStrategy, MorphologyStrategy):
                     morphologies=morphology_names,
                     compartments=compartments,
                 )
-        # Remove the morphology cache
-        self.morphology_cache = None
 
     def intersect_cells(self, touch_info):
         from_cell_type = touch_info.from_cell_type
@@ -121,102 +119,167 @@ class TouchDetector(ConnectionStrategy, MorphologyStrategy):
         # TODO: Profile whether the reverse lookup with the smaller tree and then reversing the matches array
         # gains us any speed.
         if from_count < to_count:
-            return to_cell_tree.query_radius(from_cell_tree.get_arrays()[0], radius)
+            return to_cell_tree.query_radius(np.asarray(from_cell_tree.data), radius)
         else:
             reversed_matches = from_cell_tree.query_radius(
-                to_cell_tree.get_arrays()[0], radius
+                np.asarray(to_cell_tree.data), radius
             )
-            matches = [[] for _ in range(len(from_cell_tree.get_arrays()[0]))]
+            matches = [[] for _ in range(len(from_cell_tree.data))]
             for i in range(len(reversed_matches)):
                 for match in reversed_matches[i]:
                     matches[match].append(i)
             return matches
 
     def intersect_compartments(self, touch_info, candidate_map):
-        connected_cells = []
-        morphology_names = []
-        connected_compartments = []
-        c_check = 0
-        touching_cells = 0
-        plots = 0
-        for i in range(len(candidate_map)):
-            from_id = touch_info.from_identifiers[i]
-            touch_info.from_morphology = self.get_random_morphology(
-                touch_info.from_cell_type
-            )
-            for j in candidate_map[i]:
-                c_check += 1
-                to_id = touch_info.to_identifiers[j]
-                touch_info.to_morphology = self.get_random_morphology(
-                    touch_info.to_cell_type
-                )
-                intersections = self.get_compartment_intersections(
-                    touch_info, touch_info.from_positions[i], touch_info.to_positions[j]
-                )
-                if len(intersections) > 0:
-                    touching_cells += 1
-                    number_of_synapses = max(
-                        min(int(self.synapses.sample()), len(intersections)),
-                        int(not self.allow_zero_synapses),
-                    )
-                    cell_connections = [
-                        [from_id, to_id] for _ in range(number_of_synapses)
-                    ]
-                    compartment_connections = sample_elements(
-                        intersections, k=number_of_synapses
-                    )
-                    connected_cells.extend(cell_connections)
-                    connected_compartments.extend(compartment_connections)
-                    # Pad the morphology names with the right names for the amount of compartment connections made
-                    morphology_names.extend(
-                        [
-                            [
-                                touch_info.from_morphology.morphology_name,
-                                touch_info.to_morphology.morphology_name,
-                            ]
-                            for _ in range(len(compartment_connections))
-                        ]
-                    )
+        from_cells, to_cells, from_morphos, to_morphos = self.pick_morphologies(
+            touch_info, candidate_map
+        )
+        pairs, from_comps, to_comps = self.get_compartment_intersections(
+            touch_info, from_cells, to_cells, from_morphos, to_morphos
+        )
+        # Draw the amount of synapses of each touching pair and sample that many of its
+        # intersections without replacement, by sorting the intersections of each pair
+        # on a random key and keeping the first ones.
+        touching, hit_counts = np.unique(pairs, return_counts=True)
+        synapses = np.asarray(self.synapses.draw(len(touching))).astype(int)
+        synapses = np.maximum(
+            np.minimum(synapses, hit_counts), int(not self.allow_zero_synapses)
+        )
+        order = np.lexsort((np.random.random(len(pairs)), pairs))
+        rank = np.arange(len(pairs)) - np.repeat(
+            np.cumsum(hit_counts) - hit_counts, hit_counts
+        )
+        selected = order[rank < np.repeat(synapses, hit_counts)]
+        selected_pairs = pairs[selected]
+        connected_cells = np.empty((len(selected), 2), dtype=int)
+        connected_cells[:, 0] = np.asarray(touch_info.from_identifiers, dtype=int)[
+            from_cells[selected_pairs]
+        ]
+        connected_cells[:, 1] = np.asarray(touch_info.to_identifiers, dtype=int)[
+            to_cells[selected_pairs]
+        ]
+        connected_compartments = np.empty((len(selected), 2), dtype=int)
+        connected_compartments[:, 0] = from_comps[selected]
+        connected_compartments[:, 1] = to_comps[selected]
+        from_names = np.array(
+            [m.morphology_name for m in touch_info.from_morphologies], dtype=np.string_
+        )
+        to_names = np.array(
+            [m.morphology_name for m in touch_info.to_morphologies], dtype=np.string_
+        )
+        morphology_names = np.empty(
+            (len(selected), 2), dtype=np.promote_types(from_names.dtype, to_names.dtype)
+        )
+        morphology_names[:, 0] = from_names[from_morphos[selected_pairs]]
+        morphology_names[:, 1] = to_names[to_morphos[selected_pairs]]
         report(
             "Checked {} candidate cell pairs from {} to {}".format(
-                c_check, touch_info.from_cell_type.name, touch_info.to_cell_type.name
+                len(from_cells),
+                touch_info.from_cell_type.name,
+                touch_info.to_cell_type.name,
             ),
             level=2,
         )
         report(
             "Touch connection results: \n* Touching pairs: {} \n* Synapses: {}".format(
-                touching_cells, len(connected_compartments)
+                len(touching), len(selected)
             ),
             level=2,
         )
+        return connected_cells, morphology_names, connected_compartments
 
-        return (
-            np.array(connected_cells, dtype=int),
-            np.array(morphology_names, dtype=np.string_),
-            np.array(connected_compartments, dtype=int),
-        )
+    def pick_morphologies(self, touch_info, candidate_map):
+        """
+        Flatten the candidate map into candidate pairs and pick a random morphology for
+        each presynaptic cell and each candidate pair. The picked morphologies are
+        stored on ``touch_info.from_morphologies`` and ``touch_info.to_morphologies``.
 
-    def get_compartment_intersections(self, touch_info, from_pos, to_pos):
-        from_morpho = touch_info.from_morphology
-        to_morpho = touch_info.to_morphology
-        query_points = (
-            to_morpho.get_compartment_positions(touch_info.to_cell_compartments)
-            + to_pos
-            - from_pos
+        :returns: The presynaptic and postsynaptic cell index of each pair and the index
+          of the picked presynaptic and postsynaptic morphology of each pair.
+        :rtype: tuple of 4 :class:`numpy.ndarray`
+        """
+        from_morphologies = {}
+        to_morphologies = {}
+        from_cells, to_cells, from_morphos, to_morphos = [], [], [], []
+        for i, candidates in enumerate(candidate_map):
+            from_m = self.get_random_morphology(touch_info.from_cell_type)
+            from_m = from_morphologies.setdefault(
+                id(from_m), (len(from_morphologies), from_m)
+            )
+            for j in candidates:
+                to_m = self.get_random_morphology(touch_info.to_cell_type)
+                to_m = to_morphologies.setdefault(id(to_m), (len(to_morphologies), to_m))
+                from_cells.append(i)
+                to_cells.append(j)
+                from_morphos.append(from_m[0])
+                to_morphos.append(to_m[0])
+        touch_info.from_morphologies = [m for _, m in from_morphologies.values()]
+        touch_info.to_morphologies = [m for _, m in to_morphologies.values()]
+        return tuple(
+            np.array(a, dtype=int)
+            for a in (from_cells, to_cells, from_morphos, to_morphos)
         )
-        from_tree = from_morpho.get_compartment_tree(touch_info.from_cell_compartments)
-        compartment_hits = from_tree.query_radius(
-            query_points, self.compartment_intersection_radius
+
+    def get_compartment_intersections(
+        self, touch_info, from_cells, to_cells, from_morphos, to_morphos
+    ):
+        """
+        Find the intersecting compartments of the candidate pairs. The pairs are grouped
+        per pair of morphologies and the translated compartments of all pairs of a
+        group are queried at once on the compartment tree of the presynaptic morphology.
+
+        :returns: The candidate pair, presynaptic compartment and postsynaptic
+          compartment of each intersection, sorted by candidate pair.
+        :rtype: tuple of 3 :class:`numpy.ndarray`
+        """
+        from_positions = np.asarray(touch_info.from_positions, dtype=float)
+        to_positions = np.asarray(touch_info.to_positions, dtype=float)
+        # Select the compartments of each morphology once, and build the tree of the
+        # selected compartments of each presynaptic morphology once.
+        from_labels = touch_info.from_cell_compartments
+        to_labels = touch_info.to_cell_compartments
+        from_data = []
+        for m in touch_info.from_morphologies:
+            points = m.get_compartment_positions(from_labels)
+            tree = KDTree(points) if len(points) else None
+            from_data.append((points, tree, m.get_compartment_submask(from_labels)))
+        to_data = [
+            (m.get_compartment_positions(to_labels), m.get_compartment_submask(to_labels))
+            for m in touch_info.to_morphologies
+        ]
+        pairs, from_comps, to_comps = [], [], []
+        groups = from_morphos * len(to_data) + to_morphos
+        for group in np.unique(groups):
+            group_pairs = np.nonzero(groups == group)[0]
+            from_points, tree, from_map = from_data[group // len(to_data)]
+            to_points, to_map = to_data[group % len(to_data)]
+            if not len(from_points) or not len(to_points):
+                continue
+            from_map, to_map = np.asarray(from_map), np.asarray(to_map)
+            offsets = (
+                to_positions[to_cells[group_pairs]]
+                - from_positions[from_cells[group_pairs]]
+            )
+            # Limit the amount of query points stacked at once.
+            step = max(_MAX_QUERY_POINTS // len(to_points), 1)
+            for chunk in range(0, len(group_pairs), step):
+                chunk_offsets = offsets[chunk : chunk + step]
+                queries = (to_points + chunk_offsets[:, np.newaxis]).reshape(-1, 3)
+                hits = tree.query_radius(queries, self.compartment_intersection_radius)
+                counts = np.fromiter(map(len, hits), dtype=int, count=len(hits))
+                query_ids = np.repeat(np.arange(len(queries)), counts)
+                pairs.append(group_pairs[chunk + query_ids // len(to_points)])
+                from_comps.append(from_map[np.concatenate(hits).astype(int)])
+                to_comps.append(to_map[query_ids % len(to_points)])
+        if not pairs:
+            return tuple(np.empty(0, dtype=int) for _ in range(3))
+        pairs = np.concatenate(pairs)
+        order = np.argsort(pairs, kind="stable")
+        return (
+            pairs[order],
+            np.concatenate(from_comps)[order],
+            np.concatenate(to_comps)[order],
         )
-        from_map = from_morpho.get_compartment_submask(touch_info.from_cell_compartments)
-        to_map = to_morpho.get_compartment_submask(touch_info.to_cell_compartments)
-        intersections = []
-        for i in range(len(compartment_hits)):
-            hits = compartment_hits[i]
-            if len(hits) > 0:
-                for j in range(len(hits)):
-                    intersections.append([from_map[hits[j]], to_map[i]])
-        return intersections
 
     def get_search_radius(self, cell_type):
         morphologies = self.get_all_morphologies(cell_type)
@@ -1,8 +1,11 @@
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from ..strategy import ConnectionStrategy
 from .shared import MorphologyStrategy
 from ...helpers import DistributionConfiguration
 from ...models import MorphologySet
+from ...reporting import report
+from ...voxels import group_pairs, box_index
 from ...exceptions import *
 
 
@@ -22,6 +25,8 @@ class VoxelIntersection(ConnectionStrategy, MorphologyStrategy):
         "contacts": DistributionConfiguration.cast,
         "voxels_pre": int,
         "voxels_post": int,
+        "chunk_size": float,
+        "workers": int,
     }
 
     defaults = {
@@ -29,6 +34,8 @@ class VoxelIntersection(ConnectionStrategy, MorphologyStrategy):
         "contacts": DistributionConfiguration.cast(1),
         "voxels_pre": 50,
         "voxels_post": 50,
+        "chunk_size": None,
+        "workers": 1,
     }
 
     def validate(self):
@@ -37,13 +44,6 @@ class VoxelIntersection(ConnectionStrategy, MorphologyStrategy):
     def connect(self):
         scaffold = self.scaffold
 
-        # Import rtree & instantiate the index with its properties.
-        from rtree import index
-        from rtree.index import Rtree
-
-        p = index.Property(dimension=3)
-        to_cell_tree = index.Index(properties=p)
-
         # Select all the cells from the pre- & postsynaptic type for a specific connection.
         from_type = self.from_cell_types[0]
         from_compartments = self.from_cell_compartments[0]
@@ -51,8 +51,6 @@ class VoxelIntersection(ConnectionStrategy, MorphologyStrategy):
         to_type = self.to_cell_types[0]
         from_placement_set = self.scaffold.get_placement_set(from_type.name)
         to_placement_set = self.scaffold.get_placement_set(to_type.name)
-        from_cells = self.scaffold.get_cells_by_type(from_type.name)
-        to_cells = self.scaffold.get_cells_by_type(to_type.name)
 
         # Load the morphology and voxelization data for the entrire morphology, for each cell type.
         from_morphology_set = MorphologySet(
@@ -73,125 +71,128 @@ class VoxelIntersection(ConnectionStrategy, MorphologyStrategy):
             from_morphology_set._morphology_map + to_morphology_set._morphology_map
         )
         joined_map_offset = len(from_morphology_set._morphology_map)
-
-        # For every postsynaptic cell, derive the box incorporating all voxels,
-        # and store that box in the tree, to later find intersections with that cell.
-        for i, (to_cell, morphology) in enumerate(to_morphology_set):
+        # Make sure that the voxelization was successful
+        for morphology in from_morphology_set._morphologies:
+            self.assert_voxelization(morphology, from_compartments)
+        for morphology in to_morphology_set._morphologies:
             self.assert_voxelization(morphology, to_compartments)
-            to_offset = np.concatenate((to_cell.position, to_cell.position))
-            to_box = morphology.cloud.get_voxel_box()
-            to_cell_tree.insert(i, tuple(to_box + to_offset))
-
-        # For each presynaptic cell, find all postsynaptic cells that its outer
-        # box intersects with.
-        connections_out = []
-        compartments_out = []
-        morphologies_out = []
-        for from_cell, from_morpho in from_morphology_set:
-            # Make sure that the voxelization was successful
-            self.assert_voxelization(from_morpho, from_compartments)
-            # Get the outer box of the morphology.
-            from_box = from_morpho.cloud.get_voxel_box()
-            # Get a map from voxel index to compartments in that voxel.
-            from_map = from_morpho.cloud.map
-            # Transform the box into a rectangle that we can query the Rtree with.
-            this_box = tuple(
-                from_box + np.concatenate((from_cell.position, from_cell.position))
-            )
-            # Query the Rtree for intersections of to_cell boxes with our from_cell box
-            cell_intersections = list(to_cell_tree.intersection(this_box, objects=False))
-            # Loop over each intersected partner to find and select compartment intersections
-            for partner in cell_intersections:
-                # Only select a fraction of the total possible matches, based on how much
-                # affinity there is between the cell types.
-                # Affinity 1: All cells whose voxels intersect are considered to grow
-                # towards eachother and always form a connection with other cells in their
-                # voxelspace
-                # Affinity 0: Cells completely ignore other cells in their voxelspace and
-                # don't form connections.
-                if np.random.rand() >= self.affinity:
-                    continue
-                # Get the precise morphology of the to_cell we collided with
-                to_cell, to_morpho = to_morphology_set[partner]
-                # Get the map from voxel id to list of compartments in that voxel.
-                to_map = to_morpho.cloud.map
-                # Find which voxels inside the cell boxes actually intersect with eachother.
-                voxel_intersections = self.intersect_clouds(
-                    from_morpho.cloud,
-                    to_morpho.cloud,
-                    from_cell.position,
-                    to_cell.position,
-                )
-                # Returns a list of lists: the elements in the inner lists are the indices of the
-                # voxels in the from morphology, the indices of the lists inside of the outer list
-                # are the to voxel indices.
-                #
-                # Find non-empty lists: these voxels actually have intersections
-                intersecting_to_voxels = np.nonzero(voxel_intersections)[0]
-                if not len(intersecting_to_voxels):
-                    # No intersections found? Do nothing, continue to next partner.
-                    continue
-                # Dictionary that stores the target compartments for each to_voxel.
-                target_comps_per_to_voxel = {}
-                # Iterate over each to_voxel index.
-                for to_voxel_id in intersecting_to_voxels:
-                    # Get the list of voxels that the to_voxel intersects with.
-                    intersecting_voxels = voxel_intersections[to_voxel_id]
-                    target_compartments = []
-                    for from_voxel_id in intersecting_voxels:
-                        # Store all of the compartments in the from_voxel as
-                        # possible candidates for these cells' connections
-                        target_compartments.extend(from_map[from_voxel_id])
-                    target_comps_per_to_voxel[to_voxel_id] = target_compartments
-                # Weigh the random sampling by the amount of compartments so that voxels
-                # with more compartments have a higher chance of having one of their many
-                # compartments randomly picked.
-                voxel_weights = [
-                    len(to_map[to_voxel_id]) * len(from_targets)
-                    for to_voxel_id, from_targets in target_comps_per_to_voxel.items()
-                ]
-                weight_sum = sum(voxel_weights)
-                voxel_weights = [w / weight_sum for w in voxel_weights]
-                contacts = round(self.contacts.sample())
-                candidates = list(target_comps_per_to_voxel.items())
-                while contacts > 0:
-                    contacts -= 1
-                    # Pick a random voxel and its targets
-                    random_candidate_id = np.random.choice(
-                        range(len(candidates)), 1, p=voxel_weights
-                    )[0]
-                    # Pick a to_voxel_id and its target compartments from the list of candidates
-                    random_to_voxel_id, random_compartments = candidates[
-                        random_candidate_id
-                    ]
-                    # Pick a random from and to compartment of the chosen voxel pair
-                    from_compartment = np.random.choice(random_compartments, 1)[0]
-                    to_compartment = np.random.choice(to_map[random_to_voxel_id], 1)[0]
-                    compartments_out.append([from_compartment, to_compartment])
-                    morphologies_out.append(
-                        [from_morpho._set_index, joined_map_offset + to_morpho._set_index]
-                    )
-                    connections_out.append([from_cell.id, to_cell.id])
 
+        connections, morphologies, compartments = self.intersect_cells(
+            from_placement_set.identifiers,
+            from_placement_set.positions,
+            from_morphology_set._morphology_index,
+            [m.cloud for m in from_morphology_set._morphologies],
+            to_placement_set.identifiers,
+            to_placement_set.positions,
+            to_morphology_set._morphology_index,
+            [m.cloud for m in to_morphology_set._morphologies],
+        )
+        morphologies[:, 1] += joined_map_offset
         self.scaffold.connect_cells(
             self,
-            np.array(connections_out or np.empty((0, 2))),
-            morphologies=np.array(morphologies_out or np.empty((0, 2), dtype=str)),
-            compartments=np.array(compartments_out or np.empty((0, 2))),
+            connections,
+            morphologies=morphologies,
+            compartments=compartments,
             morpho_map=joined_map,
         )
 
-    def intersect_clouds(self, from_cloud, to_cloud, from_pos, to_pos):
-        voxel_intersections = []
-        translation = to_pos - from_pos
-        for v, voxel in enumerate(to_cloud.get_voxels(cache=True)):
-            relative_position = np.add(voxel, translation)
-            relative_box = np.add(relative_position, to_cloud.grid_size)
-            box = np.concatenate((relative_position, relative_box))
-            voxel_intersections.append(
-                list(from_cloud.tree.intersection(tuple(box), objects=False))
+    def intersect_cells(
+        self,
+        from_ids,
+        from_positions,
+        from_morphologies,
+        from_clouds,
+        to_ids,
+        to_positions,
+        to_morphologies,
+        to_clouds,
+    ):
+        """
+        Connect the presynaptic to the postsynaptic cells whose voxel clouds intersect.
+        The presynaptic cells are split into spatial chunks of ``chunk_size`` that are
+        intersected with the postsynaptic cells in their neighbourhood, on ``workers``
+        processes. Each chunk is seeded from the global random state, so the results
+        do not depend on the amount of workers.
+
+        :param from_ids: Identifiers of the presynaptic cells.
+        :param from_positions: Positions of the presynaptic cells.
+        :param from_morphologies: Index of the voxel cloud of each presynaptic cell.
+        :param from_clouds: Voxel clouds of the presynaptic morphologies.
+        :returns: The connections, the morphology indices and the compartments of the
+          connections.
+        :rtype: tuple of 3 (N, 2) :class:`numpy.ndarray`
+        """
+        from_ids = np.asarray(from_ids, dtype=int)
+        from_positions = np.asarray(from_positions, dtype=float).reshape(-1, 3)
+        from_morphologies = np.asarray(from_morphologies, dtype=int)
+        to_ids = np.asarray(to_ids, dtype=int)
+        to_positions = np.asarray(to_positions, dtype=float).reshape(-1, 3)
+        to_morphologies = np.asarray(to_morphologies, dtype=int)
+        from_boxes = _cell_boxes(from_clouds, from_morphologies, from_positions)
+        to_boxes = _cell_boxes(to_clouds, to_morphologies, to_positions)
+        chunks = self.get_chunks(from_positions)
+        # Seed each chunk from the global random state so that the result does not
+        # depend on which worker intersects which chunk.
+        seeds = np.random.randint(np.iinfo(np.int32).max, size=len(chunks))
+        jobs = []
+        for chunk, seed in zip(chunks, seeds):
+            # Restrict the postsynaptic cells to those overlapping the chunk.
+            low = np.min(from_boxes[chunk, :3], axis=0)
+            high = np.max(from_boxes[chunk, 3:], axis=0)
+            near = np.nonzero(
+                np.all((to_boxes[:, :3] <= high) & (to_boxes[:, 3:] >= low), axis=1)
+            )[0]
+            # Send each chunk only the voxel clouds of its own cells.
+            chunk_from_clouds = {
+                m: from_clouds[m] for m in np.unique(from_morphologies[chunk]).tolist()
+            }
+            chunk_to_clouds = {
+                m: to_clouds[m] for m in np.unique(to_morphologies[near]).tolist()
+            }
+            jobs.append(
+                (
+                    (from_ids[chunk], from_positions[chunk], from_morphologies[chunk]),
+                    (to_ids[near], to_positions[near], to_morphologies[near]),
+                    from_boxes[chunk],
+                    to_boxes[near],
+                    chunk_from_clouds,
+                    chunk_to_clouds,
+                    self.affinity,
+                    self.contacts,
+                    seed,
+                )
+            )
+        workers = self.workers or 1
+        if workers > 1 and len(jobs) > 1:
+            report(
+                "Intersecting {} chunks on {} workers".format(len(jobs), workers),
+                level=2,
             )
-        return voxel_intersections
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                results = list(pool.map(_intersect_chunk, jobs))
+        else:
+            results = list(map(_intersect_chunk, jobs))
+        if not results:
+            return tuple(np.empty((0, 2), dtype=int) for _ in range(3))
+        return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+    def get_chunks(self, positions):
+        """
+        Split the cells into cubic chunks of ``chunk_size``, or a single chunk if no
+        chunk size is given.
+
+        :returns: The indices of the cells in each chunk.
+        :rtype: list of :class:`numpy.ndarray`
+        """
+        if self.chunk_size is None or not len(positions):
+            return [np.arange(len(positions))]
+        keys = np.floor(positions / self.chunk_size).astype(int)
+        _, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        return np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+
+    def intersect_clouds(self, from_cloud, to_cloud, from_pos, to_pos):
+        return intersect_clouds(from_cloud, to_cloud, from_pos, to_pos)
 
     def assert_voxelization(self, morphology, compartment_types):
         if len(morphology.cloud.get_voxels()) == 0:
@@ -200,3 +201,125 @@ class VoxelIntersection(ConnectionStrategy, MorphologyStrategy):
                     ", ".join(compartment_types), morphology.morphology_name
                 )
             )
+
+
+def intersect_clouds(from_cloud, to_cloud, from_pos, to_pos):
+    """
+    Find the voxels of ``from_cloud`` that intersect with each voxel of ``to_cloud``.
+
+    :returns: A list with, for each voxel of ``to_cloud``, a sorted list of the
+      intersecting voxels of ``from_cloud``.
+    :rtype: list
+    """
+    to_voxels, from_voxels = from_cloud.intersect(to_cloud, to_pos - from_pos)
+    return group_pairs(to_voxels, from_voxels, len(to_cloud.get_voxels(cache=True)))
+
+
+def _cell_boxes(clouds, morphologies, positions):
+    # Translate the outer box of the voxel cloud of each cell to the cell position.
+    boxes = np.array([cloud.get_voxel_box() for cloud in clouds]).reshape(-1, 6)
+    return boxes[morphologies] + np.tile(positions, 2)
+
+
+def _intersect_chunk(job):
+    # Intersect a chunk of presynaptic cells with the postsynaptic cells around it.
+    (
+        (from_ids, from_positions, from_morphologies),
+        (to_ids, to_positions, to_morphologies),
+        from_boxes,
+        to_boxes,
+        from_clouds,
+        to_clouds,
+        affinity,
+        contacts,
+        seed,
+    ) = job
+    random_state = np.random.RandomState(seed)
+    # For every postsynaptic cell, store the box incorporating all voxels in the tree,
+    # to later find intersections with that cell.
+    to_cell_tree = box_index(to_boxes)
+
+    connections_out = []
+    compartments_out = []
+    morphologies_out = []
+    for from_id, from_position, from_m, from_box in zip(
+        from_ids, from_positions, from_morphologies, from_boxes
+    ):
+        from_cloud = from_clouds[from_m]
+        # Get a map from voxel index to compartments in that voxel.
+        from_map = from_cloud.map
+        # Query the Rtree for intersections of to_cell boxes with our from_cell box,
+        # sorted so that the random draws don't depend on the tree layout.
+        cell_intersections = sorted(to_cell_tree.intersection(tuple(from_box)))
+        # Loop over each intersected partner to find and select compartment intersections
+        for partner in cell_intersections:
+            # Only select a fraction of the total possible matches, based on how much
+            # affinity there is between the cell types.
+            # Affinity 1: All cells whose voxels intersect are considered to grow
+            # towards eachother and always form a connection with other cells in their
+            # voxelspace
+            # Affinity 0: Cells completely ignore other cells in their voxelspace and
+            # don't form connections.
+            if random_state.rand() >= affinity:
+                continue
+            to_m = to_morphologies[partner]
+            to_cloud = to_clouds[to_m]
+            # Get the map from voxel id to list of compartments in that voxel.
+            to_map = to_cloud.map
+            # Find which voxels inside the cell boxes actually intersect with eachother.
+            voxel_intersections = intersect_clouds(
+                from_cloud, to_cloud, from_position, to_positions[partner]
+            )
+            # Returns a list of lists: the elements in the inner lists are the indices of the
+            # voxels in the from morphology, the indices of the lists inside of the outer list
+            # are the to voxel indices.
+            #
+            # Find non-empty lists: these voxels actually have intersections
+            intersecting_to_voxels = [
+                v for v, voxels in enumerate(voxel_intersections) if voxels
+            ]
+            if not intersecting_to_voxels:
+                # No intersections found? Do nothing, continue to next partner.
+                continue
+            # Dictionary that stores the target compartments for each to_voxel.
+            target_comps_per_to_voxel = {}
+            # Iterate over each to_voxel index.
+            for to_voxel_id in intersecting_to_voxels:
+                # Get the list of voxels that the to_voxel intersects with.
+                intersecting_voxels = voxel_intersections[to_voxel_id]
+                target_compartments = []
+                for from_voxel_id in intersecting_voxels:
+                    # Store all of the compartments in the from_voxel as
+                    # possible candidates for these cells' connections
+                    target_compartments.extend(from_map[from_voxel_id])
+                target_comps_per_to_voxel[to_voxel_id] = target_compartments
+            # Weigh the random sampling by the amount of compartments so that voxels
+            # with more compartments have a higher chance of having one of their many
+            # compartments randomly picked.
+            voxel_weights = [
+                len(to_map[to_voxel_id]) * len(from_targets)
+                for to_voxel_id, from_targets in target_comps_per_to_voxel.items()
+            ]
+            weight_sum = sum(voxel_weights)
+            voxel_weights = [w / weight_sum for w in voxel_weights]
+            contacts_left = round(contacts.sample(random_state=random_state))
+            candidates = list(target_comps_per_to_voxel.items())
+            while contacts_left > 0:
+                contacts_left -= 1
+                # Pick a random voxel and its targets
+                random_candidate_id = random_state.choice(
+                    range(len(candidates)), 1, p=voxel_weights
+                )[0]
+                # Pick a to_voxel_id and its target compartments from the list of candidates
+                random_to_voxel_id, random_compartments = candidates[random_candidate_id]
+                # Pick a random from and to compartment of the chosen voxel pair
+                from_compartment = random_state.choice(random_compartments, 1)[0]
+                to_compartment = random_state.choice(to_map[random_to_voxel_id], 1)[0]
+                compartments_out.append([from_compartment, to_compartment])
+                morphologies_out.append([from_m, to_m])
+                connections_out.append([from_id, to_ids[partner]])
+
+    return tuple(
+        np.array(data, dtype=int).reshape(-1, 2)
+        for data in (connections_out, morphologies_out, compartments_out)
+    )
@@ -1,10 +1,11 @@
 from .statistics import Statistics
 from .plotting import plot_network
 import numpy as np
-import time
+import time, random, zlib, functools
+from concurrent.futures import ProcessPoolExecutor
 from .trees import TreeCollection
 from .output import MorphologyRepository
-from .helpers import map_ndarray, listify_input
+from .helpers import map_ndarray, listify_input, GrowableArray, ContinuityIndex
 from .models import CellType
 from .connectivity import ConnectionStrategy
 from warnings import warn as std_warn
@@ -45,6 +46,63 @@ def from_hdf5(file):
     return Scaffold(config, from_file=file)
 
 
+def _seed_connection_type(seed, name):
+    # Derive the seed of a connection type from the base seed and its name, so that it
+    # does not depend on the order in which the connection types run.
+    sequence = np.random.SeedSequence([seed, zlib.crc32(name.encode())])
+    state = int(sequence.generate_state(1)[0])
+    np.random.seed(state)
+    random.seed(state)
+
+
+def _connect_in_worker(job):
+    # Run a connection type on a scaffold loaded from the output file and return the
+    # connectivity data of each of its tags, and the voxel clouds and trees that it
+    # created. Other workers read the same file, so the worker can't write to it.
+    file, name, seed = job
+    scaffold = from_hdf5(file)
+    formatter = scaffold.output_formatter
+    formatter.read_only = True
+    for cell_type in scaffold.configuration.cell_types.values():
+        if formatter.has_cells_of_type(cell_type.name, entity=cell_type.entity):
+            cells = formatter.get_cells_of_type(cell_type.name, entity=cell_type.entity)
+            if cell_type.entity:
+                scaffold.entities_by_type[cell_type.name] = cells
+                continue
+            scaffold.cells_by_type[cell_type.name] = cells
+            rotation_set = scaffold.get_placement_set(cell_type.name).rotation_set
+            if rotation_set.exists():
+                scaffold.rotations[cell_type.name] = rotation_set.get_dataset()
+    connection_type = scaffold.get_connection_type(name)
+    # Forget the tags of the connectivity sets already in the file.
+    connection_type.tags = []
+    _seed_connection_type(seed, name)
+    connection_type.connect()
+    scaffold._finalize_buffers()
+    tagged_data = []
+    for tag in connection_type.tags:
+        tagged_data.append(
+            (
+                tag,
+                scaffold.cell_connections_by_tag[tag],
+                scaffold.connection_morphologies.get(tag),
+                scaffold.connection_morphologies.get(tag + "_map"),
+                scaffold.connection_compartments.get(tag),
+                scaffold._connectivity_set_meta.get(tag),
+            )
+        )
+    trees = [
+        (collection.name, tree_name, tree)
+        for collection in scaffold.trees.__dict__.values()
+        for tree_name, tree in collection.items()
+        if tree is not None
+        and not formatter.is_stored(
+            "/trees/{}/{}".format(collection.name, tree_name), tree
+        )
+    ]
+    return tagged_data, formatter.deferred_voxel_clouds, trees
+
+
 class Scaffold:
     """
     This is the main object of the bsb package and bootstraps itself
@@ -220,21 +278,96 @@ class Scaffold:
                 level=2,
             )
 
-    def connect_cell_types(self):
+    def connect_cell_types(self, workers=None, seed=None, output=True):
         """
         Run the connection strategies of all cell types.
+
+        :param workers: Amount of processes to run the connection types without an
+          ``after`` dependency on. Each process loads the placement from the output
+          file and returns its connections to this process. Defaults to 1, running
+          all connection types in this process.
+        :type workers: int
+        :param output: Whether the placement may be written to the output file for the
+          workers. Without output all connection types run in this process.
+        :type output: bool
+        :param seed: Seed the random number generators with a seed derived from this
+          seed and the name of the connection type before each connection type runs,
+          so that the results do not depend on the process or order they run in.
+        :type seed: int
         """
         sorted_connection_types = ConnectionStrategy.resolve_order(
             self.configuration.connection_types
         )
+        independent = []
+        if workers is not None and workers > 1 and not output:
+            report("Connecting serially, workers need the output file.", level=2)
+        elif workers is not None and workers > 1:
+            independent = [c for c in sorted_connection_types if not c.get_after()]
+        if len(independent) > 1:
+            if seed is None:
+                # Forked workers inherit the random state of this process, so each
+                # connection type needs a seed of its own.
+                seed = np.random.randint(np.iinfo(np.int32).max)
+            self._connect_in_pool(independent, workers, seed)
+        else:
+            independent = []
         for connection_type in sorted_connection_types:
+            if connection_type in independent:
+                continue
+            if seed is not None:
+                _seed_connection_type(seed, connection_type.name)
             self.connect_type(connection_type)
 
+    def _connect_in_pool(self, connection_types, workers, seed):
+        # The workers load the placement from the output file, so write it out first.
+        self._finalize_buffers()
+        self.compile_output()
+        jobs = [(self.output_formatter.file, c.name, seed) for c in connection_types]
+        report(
+            "Connecting {} connection types on {} workers".format(len(jobs), workers),
+            level=2,
+        )
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_connect_in_worker, jobs))
+        # Store the results in the resolved order, regardless of which finished first.
+        for connection_type, (tagged_data, _, _) in zip(connection_types, results):
+            for (
+                tag,
+                connections,
+                morphologies,
+                morpho_map,
+                compartments,
+                meta,
+            ) in tagged_data:
+                self.connect_cells(
+                    connection_type,
+                    connections,
+                    tag=tag,
+                    morphologies=morphologies,
+                    compartments=compartments,
+                    morpho_map=morpho_map,
+                    meta=meta,
+                )
+            self._report_connections(connection_type)
+        # Store the voxel clouds that the workers couldn't store in the output file and
+        # add the trees they made, to be stored with the next output.
+        self.output_formatter.store_deferred_voxel_clouds(
+            [cloud for _, clouds, _ in results for cloud in clouds]
+        )
+        for _, _, trees in results:
+            for collection_name, tree_name, tree in trees:
+                collection = getattr(self.trees, collection_name)
+                if collection.trees.get(tree_name) is None:
+                    collection.add_tree(tree_name, tree)
+
     def connect_type(self, connection_type):
         """
         Run a connection type
         """
         connection_type.connect()
+        self._report_connections(connection_type)
+
+    def _report_connections(self, connection_type):
         # Iterates for each tag of the connection_type
         for tag in range(len(connection_type.tags)):
             conn_num = np.shape(connection_type.get_connection_matrices()[tag])[0]
@@ -261,12 +394,17 @@ class Scaffold:
         for hook in self.configuration.after_connect_hooks.values():
             hook.after_connectivity()
 
-    def compile_network(self, tries=1, output=True):
+    def compile_network(self, tries=1, output=True, workers=None, seed=None):
         """
         Run all steps in the scaffold sequence to obtain a full network.
 
         :param output: Store the network after compilation.
         :type output: boolean
+        :param workers: Amount of processes to run the independent connection types
+          on, see :meth:`connect_cell_types`.
+        :type workers: int
+        :param seed: Base seed of the connection types, see :meth:`connect_cell_types`.
+        :type seed: int
         """
         times = np.zeros(tries)
         for i in np.arange(tries, dtype=int):
@@ -276,10 +414,13 @@ class Scaffold:
             for step in (
                 self.place_cell_types,
                 self.run_after_placement_hooks,
-                self.connect_cell_types,
+                functools.partial(
+                    self.connect_cell_types, workers=workers, seed=seed, output=output
+                ),
                 self.run_after_connectivity_hooks,
             ):
                 step()
+                self._finalize_buffers()
                 if output:
                     self.compile_output()
 
@@ -365,6 +506,8 @@ class Scaffold:
         self._connectivity_set_meta = {}
         self.labels = {}
         self.rotations = {}
+        # Growable buffers behind the arrays of the caches, per (cache name, key).
+        self._buffers = {}
 
     def run_simulation(self, simulation_name, quit=False):
         """
@@ -436,9 +579,7 @@ class Scaffold:
         # Spoof old cache
         cell_data = np.column_stack((cell_ids, np.zeros(positions.shape[0]), positions))
         # Cache them per type
-        self.cells_by_type[cell_type.name] = np.concatenate(
-            (self.cells_by_type[cell_type.name], cell_data)
-        )
+        self._append_tagged("cells_by_type", cell_type.name, cell_data)
 
         placement_dict = self.statistics.cells_placed
         if cell_type.name not in placement_dict:
@@ -451,9 +592,7 @@ class Scaffold:
         if rotations is not None:
             if cell_type.name not in self.rotations:
                 self.rotations[cell_type.name] = np.empty((0, 2))
-            self.rotations[cell_type.name] = np.concatenate(
-                (self.rotations[cell_type.name], rotations)
-            )
+            self._append_tagged("rotations", cell_type.name, rotations)
         return cell_ids
 
     def _allocate_ids(self, count):
@@ -532,12 +671,7 @@ class Scaffold:
         entities_ids = self._allocate_ids(count)
 
         # Cache them per type
-        if not cell_type.name in self.entities_by_type:
-            self.entities_by_type[cell_type.name] = entities_ids
-        else:
-            self.entities_by_type[cell_type.name] = np.concatenate(
-                (self.entities_by_type[cell_type.name], entities_ids)
-            )
+        self._append_tagged("entities_by_type", cell_type.name, entities_ids)
 
         placement_dict = self.statistics.cells_placed
         if not cell_type.name in placement_dict:
@@ -547,16 +681,36 @@ class Scaffold:
             setattr(cell_type.placement, "cells_placed", 0)
         cell_type.placement.cells_placed += count
 
+    def _get_buffer(self, attr, tag):
+        """
+        Get the growable buffer behind a tagged numpy array in a dictionary attribute
+        of the scaffold.
+        """
+        cache = self.__dict__[attr]
+        buffer = self._buffers.get((attr, tag))
+        if buffer is None or cache.get(tag) is not buffer.view():
+            # Start a new buffer for new tags or arrays that were replaced in the cache.
+            buffer = GrowableArray(cache.get(tag))
+            self._buffers[(attr, tag)] = buffer
+        return buffer
+
+    def _finalize_buffers(self):
+        """
+        Release the unused capacity of all buffers behind the network cache.
+        """
+        for (attr, tag), buffer in self._buffers.items():
+            cache = self.__dict__[attr]
+            if cache.get(tag) is buffer.view():
+                cache[tag] = buffer.finalize()
+
     def _append_tagged(self, attr, tag, data):
         """
         Appends or creates data to a tagged numpy array in a dictionary attribute of
         the scaffold.
         """
-        if tag in self.__dict__[attr]:
-            cache = self.__dict__[attr][tag]
-            self.__dict__[attr][tag] = np.concatenate((cache, data))
-        else:
-            self.__dict__[attr][tag] = np.copy(data)
+        buffer = self._get_buffer(attr, tag)
+        buffer.append(data)
+        self.__dict__[attr][tag] = buffer.view()
 
     def _append_mapped(self, attr, tag, data, use_map=None):
         """
@@ -580,11 +734,7 @@ class Scaffold:
             mapped_data = np.array(mapped_data, dtype=int)
 
         # Append data
-        if tag in self.__dict__[attr]:
-            cache = self.__dict__[attr][tag]
-            self.__dict__[attr][tag] = np.concatenate((cache, mapped_data))
-        else:
-            self.__dict__[attr][tag] = np.copy(mapped_data)
+        self._append_tagged(attr, tag, mapped_data)
 
     def append_dset(self, name, data):
         """
@@ -774,18 +924,20 @@ class Scaffold:
         """
         return self.output_formatter.get_connectivity_set(tag)
 
-    def get_placement_set(self, type):
+    def get_placement_set(self, type, mmap=False):
         """
         Return a cell type's placement set from the output formatter.
 
         :param type: Unique identifier of the cell type in the scaffold.
         :type type: :class:`.models.CellType` or string
+        :param mmap: Read the datasets through memory maps when possible.
+        :type mmap: bool
         :returns: A placement set
         :rtype: :class:`.models.PlacementSet`
         """
         if isinstance(type, str):
             type = self.get_cell_type(type)
-        return self.output_formatter.get_placement_set(type)
+        return self.output_formatter.get_placement_set(type, mmap=mmap)
 
     def translate_cell_ids(self, data, cell_type):
         """
@@ -808,7 +960,7 @@ class Scaffold:
         if not self.is_compiled():
             return self.cells_by_type[cell_type.name][data, 0]
         else:
-            return self.get_placement_set(cell_type).identifiers[data]
+            return self.get_placement_set(cell_type).get_identifiers(data)
 
     def get_connection_type(self, name):
         """
@@ -890,19 +1042,20 @@ class Scaffold:
 
     def get_gid_types(self, ids):
         """
-        Return the cell type of each gid
-        """
-        all_ps = {
-            ct: self.get_placement_set(ct).identifiers
-            for ct in self.configuration.cell_types.values()
-        }
-
-        def lookup(id):
-            for ct, ps in all_ps.items():
-                if id in ps:
-                    return ct
+        Return the cell type of each gid, or ``None`` for gids that don't belong to any
+        cell type.
 
-        return np.vectorize(lookup)(ids)
+        :param ids: Array of gids
+        :returns: Object array of :class:`CellTypes <.models.CellType>`
+        :rtype: :class:`numpy.ndarray`
+        """
+        cell_types = list(self.configuration.cell_types.values())
+        index = ContinuityIndex(
+            self.get_placement_set(ct).identifier_set.get_dataset() for ct in cell_types
+        )
+        # Append `None` so that gids without a cell type, at index -1, map onto it.
+        lookup = np.array(cell_types + [None], dtype=object)
+        return lookup[index.lookup(ids)]
 
     def get_placed_count(self, cell_type_name):
         """
@@ -284,14 +284,14 @@ class DistributionConfiguration(OptionallyCastable):
             )
             raise InvalidDistributionError(error_msg) from None
 
-    def draw(self, n):
+    def draw(self, n, random_state=None):
         if self.type == "const":
             return [self.value for _ in range(n)]
         else:
-            return self.distribution.rvs(size=n)
+            return self.distribution.rvs(size=n, random_state=random_state)
 
-    def sample(self):
-        return self.draw(1)[0]
+    def sample(self, random_state=None):
+        return self.draw(1, random_state=random_state)[0]
 
     def mean(self):
         return self.distribution.mean()
@@ -599,6 +599,81 @@ def map_ndarray(data, _map=None):
     return _mapped, _map
 
 
+class GrowableArray:
+    """
+    Array that can be appended to along its first axis at an amortized constant cost
+    per row. Its capacity grows geometrically and :meth:`view` gives an ndarray of the
+    filled rows without copying them.
+
+    .. code-block:: python
+
+        buffer = GrowableArray(np.empty((0, 2)))
+        for chunk in chunks:
+            buffer.append(chunk)
+        connections = buffer.finalize()
+    """
+
+    growth_factor = 2
+
+    def __init__(self, data=None):
+        if data is None:
+            self._data = None
+            self._length = 0
+            self._view = None
+        else:
+            self._data = np.array(data, copy=True)
+            self._length = len(self._data)
+            self._view = self._data
+
+    def __len__(self):
+        return self._length
+
+    def view(self):
+        """
+        Return an ndarray view on the filled rows of the buffer. The same view object
+        is returned until the buffer is appended to or finalized.
+        """
+        return self._view
+
+    def append(self, data):
+        """
+        Append rows to the buffer, growing its capacity if required.
+
+        :param data: Rows to append. Must match the trailing dimensions of the buffer.
+        :type data: :class:`numpy.ndarray`
+        """
+        data = np.asarray(data)
+        if self._data is None:
+            self.__init__(data)
+            return
+        if data.shape[1:] != self._data.shape[1:]:
+            raise ValueError(
+                "Can't append data of shape {} to a buffer of shape {}.".format(
+                    data.shape, self._view.shape
+                )
+            )
+        dtype = np.result_type(self._data, data)
+        new_length = self._length + len(data)
+        if new_length > len(self._data) or dtype != self._data.dtype:
+            capacity = max(new_length, int(len(self._data) * self.growth_factor), 1)
+            grown = np.empty((capacity,) + self._data.shape[1:], dtype=dtype)
+            grown[: self._length] = self._data[: self._length]
+            self._data = grown
+        self._data[self._length : new_length] = data
+        self._length = new_length
+        self._view = self._data[:new_length]
+
+    def finalize(self):
+        """
+        Release the unused capacity of the buffer and return the filled rows as a
+        compact ndarray. The buffer can still be appended to afterwards.
+        """
+        if self._data is not None and len(self._data) != self._length:
+            self._data = self._data[: self._length].copy()
+            self._view = self._data
+        return self._view
+
+
 def load_configurable_class(name, configured_class_name, parent_class, parameters={}):
     if isclass(configured_class_name):
         instance = configured_class_name(**parameters)
@@ -726,9 +801,79 @@ def iterate_continuity_list(iterable, step=1):
             yield i
 
 
+def take_continuity_list(iterable, indices, step=1):
+    """
+    Return the items at the given positions of the full set of items associated with
+    the continuity list, without expanding the list.
+
+    *Example:* ``take_continuity_list([4, 6, 12, 1], [0, 5, 6])`` ==> ``[4, 9, 12]``
+
+    :param indices: Position or array of positions in the expanded list.
+    :returns: Item or array of items, matching the shape of ``indices``.
+    :raises: IndexError if a position is out of bounds.
+    """
+    serial = np.asarray(iterable, dtype=int).reshape(-1, 2)
+    starts, counts = serial[:, 0], serial[:, 1]
+    # Position of the first item of each stretch in the expanded list.
+    offsets = np.cumsum(counts) - counts
+    total = offsets[-1] + counts[-1] if len(serial) else 0
+    indices = np.asarray(indices, dtype=int)
+    if np.any((indices < -total) | (indices >= total)):
+        raise IndexError("Index out of bounds for {} items.".format(total))
+    indices = np.where(indices < 0, indices + total, indices)
+    # Empty stretches share their offset with the next stretch, pick the last one.
+    stretch = np.searchsorted(offsets, indices, side="right") - 1
+    return (starts[stretch] + (indices - offsets[stretch]) * step)[()]
+
+
 def count_continuity_list(iterable):
     total = 0
     for _, count in continuity_hop(iter(iterable)):
         # Each hop, add the count to the total
         total += count
     return total
+
+
+class ContinuityIndex:
+    """
+    Sorted index of the stretches of several continuity lists, as formatted by
+    :func:`.helpers.continuity_list`. Finds which of the lists contains each element of
+    an array of values with a single :func:`numpy.searchsorted`, without expanding the
+    lists.
+
+    .. code-block:: python
+
+        index = ContinuityIndex([[0, 5], [5, 3, 10, 2]])
+        index.lookup([1, 6, 11, 9])  # array([0, 1, 1, -1])
+    """
+
+    def __init__(self, continuity_lists):
+        starts, counts, owners = [], [], []
+        for owner, serial in enumerate(continuity_lists):
+            serial = np.asarray(serial, dtype=int).reshape(-1, 2)
+            starts.append(serial[:, 0])
+            counts.append(serial[:, 1])
+            owners.append(np.full(len(serial), owner, dtype=int))
+        starts = np.concatenate(starts) if starts else np.empty(0, dtype=int)
+        counts = np.concatenate(counts) if counts else np.empty(0, dtype=int)
+        owners = np.concatenate(owners) if owners else np.empty(0, dtype=int)
+        order = np.argsort(starts, kind="stable")
+        self._starts = starts[order]
+        self._ends = self._starts + counts[order]
+        self._owners = owners[order]
+
+    def lookup(self, values):
+        """
+        Return the index of the continuity list that contains each value, or -1 for
+        values that aren't contained in any of the lists.
+
+        :param values: Value or array of values to look up.
+        :returns: Index or array of indices, matching the shape of ``values``.
+        """
+        values = np.asarray(values)
+        stretch = np.searchsorted(self._starts, values, side="right") - 1
+        if not len(self._starts):
+            return np.full(values.shape, -1, dtype=int)[()]
+        # Values before the first stretch get index -1, clip it to compare the ends.
+        found = (stretch >= 0) & (values < self._ends[np.maximum(stretch, 0)])
+        return np.where(found, self._owners[stretch], -1)[()]
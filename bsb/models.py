@@ -1,4 +1,4 @@
-import numpy as np, random
+import numpy as np, random, copy, itertools
 from .morphologies import Morphology as BaseMorphology
 from .helpers import (
     ConfigurableClass,
@@ -9,6 +9,7 @@ from .helpers import (
     expand_continuity_list,
     count_continuity_list,
     iterate_continuity_list,
+    take_continuity_list,
 )
 from .exceptions import *
 
@@ -192,22 +193,16 @@ class Resource:
         self._path = path
 
     def get_dataset(self, selector=(), dtype=None):
-        with self._handler.load("r") as f:
-            if not self._path in f():
-                raise DatasetNotFoundError(
-                    "Dataset '{}' not found in '{}'.".format(
-                        self._path, self._handler.file
-                    )
-                )
-            d = f()[self._path][selector]
+        with self._handler.load("r"):
+            d = self._open()[selector]
             if dtype:
                 d = d.astype(dtype)
             return d
 
     @property
     def attributes(self):
-        with self._handler.load("r") as f:
-            return dict(f()[self._path].attrs)
+        with self._handler.load("r"):
+            return dict(self._open().attrs)
 
     def get_attribute(self, name):
         attrs = self.attributes
@@ -241,8 +236,52 @@ class Resource:
 
     @property
     def shape(self):
-        with self._handler.load("r") as f:
-            return f()[self._path].shape
+        with self._handler.load("r"):
+            return self._open().shape
+
+    def get_rows(self, selector=(), mmap=False):
+        """
+        Read the selected rows of the dataset. Unlike :meth:`get_dataset`, index arrays
+        don't have to be sorted or unique, and only the blocks of rows that contain
+        selected rows are read.
+
+        :param selector: Index, slice, index array or boolean mask of the rows.
+        :param mmap: Read through a memory map, if the dataset can be mapped.
+        """
+        with self._handler.load("r"):
+            data = self.get_memmap() if mmap else None
+            if data is None:
+                data = self._open()
+            return _read_rows(data, _selected_rows(selector, len(data)))
+
+    def get_memmap(self):
+        """
+        Map the dataset into memory, read only. Only uncompressed datasets with a
+        contiguous layout can be mapped.
+
+        :returns: The memory map, or ``None`` if the dataset can't be mapped.
+        """
+        with self._handler.load("r"):
+            dataset = self._open()
+            offset = dataset.id.get_offset()
+            if dataset.chunks is not None or offset is None or not dataset.size:
+                return None
+            return np.memmap(
+                self._handler.file,
+                dtype=dataset.dtype,
+                mode="r",
+                offset=offset,
+                shape=dataset.shape,
+            )
+
+    def _open(self):
+        # Retrieve the dataset from the objects cached by the open handle of the handler.
+        try:
+            return self._handler.open_object(self._path)
+        except KeyError:
+            raise DatasetNotFoundError(
+                "Dataset '{}' not found in '{}'.".format(self._path, self._handler.file)
+            ) from None
 
 
 class Connection:
@@ -278,6 +317,58 @@ class Connection:
             self.to_compartment = to_morphology.compartments[to_compartment]
 
 
+class ConnectivityIndex:
+    """
+    Compressed sparse index of the connections of each cell of a connectivity set. The
+    rows of the connections of cell ``ids[i]`` are ``order[indptr[i]:indptr[i + 1]]``,
+    in ascending order. Indexed on the presynaptic cells it is the CSR index of the
+    connectivity matrix, on the postsynaptic cells its CSC index.
+
+    :param ids: Sorted array of the unique identifiers of the indexed cells.
+    :param indptr: Offset of the rows of each cell in ``order``.
+    :param order: Rows of the connections, ordered by cell.
+    """
+
+    def __init__(self, ids, indptr, order):
+        self.ids = np.asarray(ids, dtype=int)
+        self.indptr = np.asarray(indptr, dtype=int)
+        self.order = np.asarray(order, dtype=int)
+
+    @classmethod
+    def create(cls, cell_ids):
+        """
+        Index a column of the identifiers of a connectivity set.
+
+        :param cell_ids: (N,) array of the pre- or postsynaptic cell of each connection.
+        """
+        cell_ids = np.asarray(cell_ids).astype(int, copy=False)
+        order = np.argsort(cell_ids, kind="stable")
+        sorted_ids = cell_ids[order]
+        # The rows of each cell start where the sorted identifiers change.
+        starts = np.flatnonzero(np.diff(sorted_ids)) + 1
+        if len(order):
+            indptr = np.concatenate(([0], starts, [len(order)]))
+        else:
+            indptr = np.zeros(1, dtype=int)
+        return cls(sorted_ids[indptr[:-1]], indptr, order)
+
+    def get_rows(self, cell_id):
+        """
+        Return the rows of the connections of a cell, in ascending order.
+        """
+        i = np.searchsorted(self.ids, cell_id)
+        if i == len(self.ids) or self.ids[i] != cell_id:
+            return self.order[:0]
+        return self.order[self.indptr[i] : self.indptr[i + 1]]
+
+    @property
+    def degrees(self):
+        """
+        Number of connections of each cell in ``ids``.
+        """
+        return np.diff(self.indptr)
+
+
 class ConnectivitySet(Resource):
     """
     Connectivity sets store connections.
@@ -291,6 +382,7 @@ class ConnectivitySet(Resource):
         self.tag = tag
         self.compartment_set = Resource(handler, "/cells/connection_compartments/" + tag)
         self.morphology_set = Resource(handler, "/cells/connection_morphologies/" + tag)
+        self._indices = {}
 
     @property
     def connections(self):
@@ -298,7 +390,7 @@ class ConnectivitySet(Resource):
         Return a list of :class:`Intersections <.models.Connection>`. Connections
         contain pre- & postsynaptic identifiers.
         """
-        return [Connection(c[0], c[1]) for c in self.get_dataset()]
+        return [Connection(*c) for c in self.get_connections().tolist()]
 
     @property
     def from_identifiers(self):
@@ -314,54 +406,183 @@ class ConnectivitySet(Resource):
         """
         return self.get_dataset(dtype=int)[:, 1]
 
+    @property
+    def from_compartments(self):
+        """
+        Return an array with the presynaptic compartment id of each connection.
+        """
+        return self.get_compartments()[:, 0]
+
+    @property
+    def to_compartments(self):
+        """
+        Return an array with the postsynaptic compartment id of each connection.
+        """
+        return self.get_compartments()[:, 1]
+
+    @property
+    def from_morphologies(self):
+        """
+        Return an array with the presynaptic morphology id of each connection, see
+        :attr:`morphology_names`.
+        """
+        return self.get_morphologies()[:, 0]
+
+    @property
+    def to_morphologies(self):
+        """
+        Return an array with the postsynaptic morphology id of each connection, see
+        :attr:`morphology_names`.
+        """
+        return self.get_morphologies()[:, 1]
+
+    @property
+    def morphology_names(self):
+        """
+        Return the list of morphology names that the morphology ids refer to.
+        """
+        self._check_intersections()
+        names = self.morphology_set.get_attribute("map")
+        return [n.decode("UTF-8") if isinstance(n, bytes) else str(n) for n in names]
+
+    def get_connections(self, selector=()):
+        """
+        Return the (N, 2) array of the pre- & postsynaptic identifiers of the selected
+        connections.
+
+        :param selector: Index, slice, index array or boolean mask of the connections.
+        """
+        return self.get_rows(selector).astype(int, copy=False)
+
+    def get_compartments(self, selector=()):
+        """
+        Return the (N, 2) array of the pre- & postsynaptic compartment ids of the
+        selected connections.
+
+        :param selector: Index, slice, index array or boolean mask of the connections.
+        :raises: MissingMorphologyError if the set has no intersection information.
+        """
+        self._check_intersections()
+        return self.compartment_set.get_rows(selector).astype(int, copy=False)
+
+    def get_morphologies(self, selector=()):
+        """
+        Return the (N, 2) array of the pre- & postsynaptic morphology ids of the
+        selected connections, see :attr:`morphology_names`.
+
+        :param selector: Index, slice, index array or boolean mask of the connections.
+        :raises: MissingMorphologyError if the set has no intersection information.
+        """
+        self._check_intersections()
+        return self.morphology_set.get_rows(selector).astype(int, copy=False)
+
+    def get_sections(self, selector=()):
+        """
+        Return the (N, 2) array of the pre- & postsynaptic section ids of the
+        compartments of the selected connections, -1 for compartments without section.
+
+        :param selector: Index, slice, index array or boolean mask of the connections.
+        :raises: MissingMorphologyError if the set has no intersection information.
+        """
+        with self._handler.batch():
+            compartments = self.get_compartments(selector)
+            morphologies = self.get_morphologies(selector)
+            names = self.morphology_names
+        sections = np.empty_like(compartments)
+        repository = self.scaffold.morphology_repository
+        for id in np.unique(morphologies):
+            morphology = repository.get_cached_morphology(names[id])
+            section_ids = morphology.compartment_arrays.section_ids
+            mask = morphologies == id
+            sections[mask] = section_ids[compartments[mask]]
+        return sections
+
+    def get_index(self, key="from"):
+        """
+        Return the :class:`.models.ConnectivityIndex` of the connections of each
+        presynaptic (``key="from"``) or postsynaptic (``key="to"``) cell. The index that
+        was stored with the set is used if there is one, otherwise it is built from the
+        identifiers. The index is kept in memory for subsequent queries.
+        """
+        if key not in ("from", "to"):
+            raise ValueError("Index key must be 'from' or 'to', not '{}'.".format(key))
+        if key not in self._indices:
+            path = "/cells/connection_index/{}/{}/".format(self.tag, key)
+            stored = Resource(self._handler, path + "order")
+            with self._handler.batch():
+                if stored.exists():
+                    self._indices[key] = ConnectivityIndex(
+                        Resource(self._handler, path + "ids").get_dataset(),
+                        Resource(self._handler, path + "indptr").get_dataset(),
+                        stored.get_dataset(),
+                    )
+                else:
+                    column = self.get_dataset((slice(None), 0 if key == "from" else 1))
+                    self._indices[key] = ConnectivityIndex.create(column)
+        return self._indices[key]
+
+    def get_outgoing(self, cell_id):
+        """
+        Return the rows of the connections that a presynaptic cell makes, in
+        ascending order. Use the rows as selector of the ``get_*`` methods.
+        """
+        return self.get_index("from").get_rows(cell_id)
+
+    def get_incoming(self, cell_id):
+        """
+        Return the rows of the connections that a postsynaptic cell receives, in
+        ascending order. Use the rows as selector of the ``get_*`` methods.
+        """
+        return self.get_index("to").get_rows(cell_id)
+
+    def get_targets(self, cell_id):
+        """
+        Return the postsynaptic identifier of each connection a cell makes.
+        """
+        return self.get_connections(self.get_outgoing(cell_id))[:, 1]
+
+    def get_sources(self, cell_id):
+        """
+        Return the presynaptic identifier of each connection a cell receives.
+        """
+        return self.get_connections(self.get_incoming(cell_id))[:, 0]
+
     @property
     def intersections(self):
         """
         Return a list of :class:`Intersections <.models.Connection>`. Intersections
         contain pre- & postsynaptic identifiers and the intersecting compartments.
         """
+        self._check_intersections()
+        return self.get_intersections()
+
+    def _check_intersections(self):
         if not self.compartment_set.exists():
             raise MissingMorphologyError(
                 "No intersection/morphology information for the '{}' connectivity set.".format(
                     self.tag
                 )
             )
-        else:
-            return self.get_intersections()
 
     def get_intersections(self):
-        intersections = []
-        morphos = {}
-
-        def _cache_morpho(id):
-            # Keep a cache of the morphologies so that all morphologies with the same
-            # id refer to the same object, and so that they aren't redundandly loaded.
-            id = int(id)
-            if not id in morphos:
-                name = self.morphology_set.unmap_one(id)[0]
-                if isinstance(name, bytes):
-                    name = name.decode("UTF-8")
-                morphos[id] = self.scaffold.morphology_repository.get_morphology(name)
-
-        cells = self.get_dataset()
-        for cell_ids, comp_ids, morpho_ids in zip(
-            cells, self.compartment_set.get_dataset(), self.morphology_set.get_dataset()
-        ):
-            from_morpho_id = int(morpho_ids[0])
-            to_morpho_id = int(morpho_ids[1])
-            # Load morphologies from the map if they're not in the cache yet
-            _cache_morpho(from_morpho_id)
-            _cache_morpho(to_morpho_id)
-            # Append the intersection with a new connection
-            intersections.append(
-                Connection(
-                    *cell_ids,  # zipped dataset: from id & to id
-                    *comp_ids,  # zipped morphologyset: from comp & to comp
-                    morphos[from_morpho_id],  # cached: 'from' TrueMorphology
-                    morphos[to_morpho_id]  # cached: 'to' TrueMorphology
-                )
+        with self._handler.batch():
+            cells = self.get_connections()
+            compartments = self.get_compartments()
+            morphologies = self.get_morphologies()
+            names = self.morphology_names
+        repository = self.scaffold.morphology_repository
+        # Load each morphology once, so that all intersections with the same morphology
+        # id refer to the same object.
+        morphos = {
+            id: repository.get_cached_morphology(names[id])
+            for id in np.unique(morphologies).tolist()
+        }
+        return [
+            Connection(*cell_ids, *comp_ids, morphos[from_m], morphos[to_m])
+            for cell_ids, comp_ids, (from_m, to_m) in zip(
+                cells.tolist(), compartments.tolist(), morphologies.tolist()
             )
-        return intersections
+        ]
 
     def get_divergence_list(self):
         presynaptic_type = self.get_presynaptic_types()[0]
@@ -458,12 +679,17 @@ class PlacementSet(Resource):
     create a collection of :class:`Cells <.models.Cell>` that each contain their own
     identifier, position and rotation.
 
+    Large placement sets can be read in parts: :meth:`iter_chunks` iterates over the
+    datasets a fixed amount of rows at a time, and the ``get_*`` methods and indexing
+    only read the selected rows. When ``mmap`` is set, uncompressed contiguous
+    datasets are read through a read-only memory map of the file instead of h5py.
+
     .. note::
 
         Use :func:`.core.get_placement_set` to correctly obtain a PlacementSet.
     """
 
-    def __init__(self, handler, cell_type):
+    def __init__(self, handler, cell_type, mmap=False):
         root = "/cells/placement/"
         tag = cell_type.name
         super().__init__(handler, root + tag)
@@ -471,6 +697,7 @@ class PlacementSet(Resource):
             raise DatasetNotFoundError("PlacementSet '{}' does not exist".format(tag))
         self.type = cell_type
         self.tag = tag
+        self.mmap = mmap
         self.identifier_set = Resource(handler, root + tag + "/identifiers")
         self.positions_set = Resource(handler, root + tag + "/positions")
         self.rotation_set = Resource(handler, root + tag + "/rotations")
@@ -480,36 +707,87 @@ class PlacementSet(Resource):
         """
         Return a list of cell identifiers.
         """
-        return np.array(
-            expand_continuity_list(self.identifier_set.get_dataset()), dtype=int
-        )
+        return self.get_identifiers()
 
     @property
     def positions(self):
         """
         Return a dataset of cell positions.
         """
+        return self.get_positions()
+
+    @property
+    def rotations(self):
+        """
+        Return a dataset of cell rotations.
+
+        :raises: DatasetNotFoundError when there is no rotation information for this
+           cell type.
+        """
+        return self.get_rotations()
+
+    def get_identifiers(self, selector=()):
+        """
+        Return the identifiers of the selected cells, without expanding the stored
+        continuity list.
+
+        :param selector: Index, slice, index array or boolean mask of the cells.
+        """
+        serial = self.identifier_set.get_dataset()
+        rows = _selected_rows(selector, count_continuity_list(serial))
+        if isinstance(rows, slice):
+            rows = np.arange(rows.start, rows.stop, rows.step)
+        return take_continuity_list(serial, rows)
+
+    def get_positions(self, selector=()):
+        """
+        Return the positions of the selected cells. Only the selected rows are read.
+
+        :param selector: Index, slice, index array or boolean mask of the cells.
+        """
         try:
-            return self.positions_set.get_dataset()
+            return self._read(self.positions_set, selector)
         except DatasetNotFoundError:
             raise DatasetNotFoundError(
                 "No position information for the '{}' placement set.".format(self.tag)
-            )
+            ) from None
 
-    @property
-    def rotations(self):
+    def get_rotations(self, selector=()):
         """
-        Return a dataset of cell rotations.
+        Return the rotations of the selected cells. Only the selected rows are read.
 
+        :param selector: Index, slice, index array or boolean mask of the cells.
         :raises: DatasetNotFoundError when there is no rotation information for this
            cell type.
         """
         try:
-            return self.rotation_set.get_dataset()
+            return self._read(self.rotation_set, selector)
         except DatasetNotFoundError:
             raise DatasetNotFoundError(
                 "No rotation information for the '{}' placement set.".format(self.tag)
-            )
+            ) from None
+
+    def iter_chunks(self, size=None):
+        """
+        Iterate over the placement set ``size`` rows at a time. Each chunk is read when
+        it is reached, so that only one chunk is held in memory.
+
+        :param size: Number of rows per chunk. By default a multiple of the rows per
+          storage chunk of the positions.
+        :returns: Generator of the ``(identifiers, positions, rotations)`` arrays of
+          each chunk. Datasets that aren't present are ``None``.
+        """
+        if size is None:
+            size = _CHUNK_ROWS
+            with self._handler.load("r"):
+                if self.positions_set.exists():
+                    size = _block_rows(self.positions_set._open())
+        size = int(size)
+        if size < 1:
+            raise ValueError("Chunk size must be a positive integer.")
+        total = len(self)
+        for start in range(0, total, size):
+            yield self._read_chunk(slice(start, min(start + size, total), 1))
 
     @property
     def cells(self):
@@ -521,24 +799,106 @@ class PlacementSet(Resource):
             Cell(id, self.type, position, rotation) for id, position, rotation in self
         ]
 
+    def __getitem__(self, selector):
+        """
+        Return the :class:`Cells <.models.Cell>` of a slice, index array or boolean
+        mask of the placement set, or a single :class:`.models.Cell` for an index.
+        """
+        rows = _selected_rows(selector, len(self))
+        chunk = self._read_chunk(rows)
+        if np.ndim(chunk[0]) == 0:
+            return Cell(*self._cell_data(chunk, None)[0])
+        return [Cell(*data) for data in self._cell_data(chunk, len(chunk[0]))]
+
     def __iter__(self):
-        id_iter = iterate_continuity_list(self.identifier_set.get_dataset())
-        iterators = [iter(id_iter), self._none(), self._none()]
-        if self.positions_set.exists():
-            iterators[1] = iter(self.positions)
-        if self.rotation_set.exists():
-            iterators[2] = iter(self.rotations)
-        return zip(*iterators)
+        for chunk in self.iter_chunks():
+            for id, _, position, rotation in self._cell_data(chunk, len(chunk[0])):
+                yield id, position, rotation
 
     def __len__(self):
         return count_continuity_list(self.identifier_set)
 
-    def _none(self):
-        """
-        Generate ``len(self)`` times ``None``
-        """
-        for i in range(len(self)):
-            yield None
+    def _read(self, resource, selector):
+        return resource.get_rows(selector, mmap=self.mmap)
+
+    def _read_chunk(self, rows):
+        # Read the identifiers, positions and rotations of the selected rows on a
+        # single open handle.
+        with self._handler.batch():
+            chunk = [self.get_identifiers(rows), None, None]
+            for i, resource in ((1, self.positions_set), (2, self.rotation_set)):
+                if resource.exists():
+                    chunk[i] = self._read(resource, rows)
+        return chunk
+
+    def _cell_data(self, chunk, n):
+        # Zip the chunk into the arguments of the cells, padding missing data with None.
+        ids, positions, rotations = chunk
+        if n is None:
+            return [(ids, self.type, positions, rotations)]
+        none = itertools.repeat(None, n)
+        return zip(
+            ids,
+            itertools.repeat(self.type),
+            none if positions is None else positions,
+            none if rotations is None else rotations,
+        )
+
+
+# Rows of a placement set that are read at a time when it is iterated over.
+_CHUNK_ROWS = 65536
+
+
+def _selected_rows(selector, n):
+    # Normalise a numpy style selection of the rows of a dataset with `n` rows to a
+    # slice with a positive step or an array of row indices.
+    if isinstance(selector, tuple) and not selector or selector is Ellipsis:
+        return slice(0, n, 1)
+    if isinstance(selector, slice):
+        start, stop, step = selector.indices(n)
+        if step > 0:
+            return slice(start, max(start, stop), step)
+        return np.arange(start, stop, step)
+    rows = np.asarray(selector)
+    if rows.dtype == bool:
+        if rows.shape != (n,):
+            raise IndexError(
+                "Boolean mask of shape {} does not match {} rows.".format(rows.shape, n)
+            )
+        return np.flatnonzero(rows)
+    if not np.issubdtype(rows.dtype, np.integer):
+        if rows.size:
+            raise IndexError("Rows can only be selected by integers or booleans.")
+        rows = rows.astype(int)
+    if np.any((rows < -n) | (rows >= n)):
+        raise IndexError("Index out of bounds for {} rows.".format(n))
+    return np.where(rows < 0, rows + n, rows)
+
+
+def _block_rows(data):
+    # Align the blocks of rows that are read at once with the storage chunks of the
+    # dataset, so that a block read decompresses each of its chunks once.
+    chunks = getattr(data, "chunks", None)
+    if not chunks:
+        return _CHUNK_ROWS
+    return chunks[0] * max(1, _CHUNK_ROWS // chunks[0])
+
+
+def _read_rows(data, rows):
+    # Read the selected rows of an h5py dataset or array. Index arrays are read as one
+    # hyperslab per block of rows that contains selected rows.
+    if isinstance(rows, slice):
+        return data[rows]
+    flat = rows.reshape(-1)
+    unique, inverse = np.unique(flat, return_inverse=True)
+    block = _block_rows(data)
+    blocks = np.split(unique, np.flatnonzero(np.diff(unique // block)) + 1)
+    parts = [data[b[0] : b[-1] + 1][b - b[0]] for b in blocks if len(b)]
+    if parts:
+        selection = np.concatenate(parts)[inverse]
+    else:
+        selection = np.empty((0,) + data.shape[1:], dtype=data.dtype)
+    return selection.reshape(rows.shape + data.shape[1:])
 
 
 class Cell:
@@ -602,7 +962,7 @@ class MorphologySet:
         self._morphology_index = []
         self._morphology_map = []
         if placement_set.rotation_set.exists() or (
-            self.scaffold and hasattr(self.scaffold.rotations, cell_type.name)
+            self.scaffold and cell_type.name in self.scaffold.rotations
         ):
             # Rotations? Get the rotated version of the randomly selected morphology and
             # check in `self._morphology_map` if it has been used before.
@@ -611,30 +971,50 @@ class MorphologySet:
                 if placement_set.rotation_set.exists()
                 else self.scaffold.rotations[cell_type.name]
             )
-            # Get the names of the rotated morphologies that need to be loaded
+            # Get the names of the rotated morphologies that need to be loaded, they are
+            # rotated on the fly from the unrotated morphology.
+            self._morphology_rotations = []
             for i in range(len(rotations)):
-                rot_str = (
-                    "__" + str(int(rotations[i][0])) + "_" + str(int(rotations[i][1]))
-                )
-                mname = morphology_names[random_morphologies[i]] + rot_str
+                name = morphology_names[random_morphologies[i]]
+                phi, theta = int(rotations[i][0]), int(rotations[i][1])
+                mname = name + "__" + str(phi) + "_" + str(theta)
 
                 if mname in self._morphology_map:
                     self._morphology_index.append(self._morphology_map.index(mname))
                 else:
                     self._morphology_index.append(len(self._morphology_map))
                     self._morphology_map.append(mname)
+                    self._morphology_rotations.append((name, phi, theta))
         else:
             # No rotations? Just use the randomly selected morphologies
             self._morphology_index = random_morphologies
             self._morphology_map = morphology_names
+            self._morphology_rotations = None
 
-        # Function to load and voxelize a morphology
+        # Function to load and voxelize a morphology, or load its stored voxel cloud.
         def load_morpho(scaffold, morpho_ind, compartment_types=None):
-            m = scaffold.morphology_repository.get_morphology(
-                self._morphology_map[morpho_ind]
-            )
+            repository = scaffold.morphology_repository
+            name = self._morphology_map[morpho_ind]
+            if self._morphology_rotations is not None:
+                # Copy the shared rotated morphology and give it the cached cloud of
+                # the rotation.
+                rotation = self._morphology_rotations[morpho_ind]
+                m = copy.copy(repository.get_rotated_morphology(*rotation))
+                m._set_index = morpho_ind
+                m.cloud = repository.get_rotated_voxel_cloud(
+                    *rotation, N, labels=compartment_types
+                )
+                return m
+            m = repository.get_morphology(name)
             m._set_index = morpho_ind
-            m.voxelize(N, compartments=m.get_compartments(compartment_types))
+            if repository.voxel_cloud_exists(name, N, compartment_types):
+                m.cloud = repository.get_voxel_cloud(name, N, compartment_types)
+            else:
+                m.voxelize(N, compartments=m.get_compartments(compartment_types))
+                # Only store the cloud in the network output; a separately configured
+                # repository is input that may be shared or read only.
+                if repository is scaffold.output_formatter:
+                    repository.store_voxel_cloud(m, N, labels=compartment_types)
             return m
 
         # Load and voxelize only the unique morphologies present in the morphology map.
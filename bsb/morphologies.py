@@ -1,4 +1,4 @@
-import abc, numpy as np, pickle, h5py, math, itertools
+import abc, numpy as np, pickle, h5py, math, itertools, copy
 from .helpers import ConfigurableClass
 from .voxels import VoxelCloud, detect_box_compartments, Box
 from sklearn.neighbors import KDTree
@@ -69,6 +69,154 @@ class Compartment:
         return c
 
 
+class CompartmentArrays:
+    """
+    Structure of arrays representation of the compartments of a morphology. The
+    compartments are stored in the depth-first order of :func:`Morphology.to_compartments
+    <.morphologies.Morphology.to_compartments>` and their index is their id.
+
+    :param starts: (N, 3) matrix of the start points of the compartments.
+    :param ends: (N, 3) matrix of the end points of the compartments.
+    :param radii: (N,) array of the radii of the compartments.
+    :param parents: (N,) array of the parent compartment indices, -1 for no parent.
+    :param section_ids: (N,) array of the NEURON section ids, -1 for no section.
+    :param labels: (N,) bitmask of the labels of each compartment, bit ``i`` is set for
+      the compartments labelled ``label_names[i]``.
+    :param label_names: List of the labels in the bitmask.
+    """
+
+    def __init__(self, starts, ends, radii, parents, section_ids, labels, label_names):
+        self.starts = np.array(starts, dtype=float).reshape(-1, 3)
+        self.ends = np.array(ends, dtype=float).reshape(-1, 3)
+        self.radii = np.array(radii, dtype=float)
+        self.parents = np.array(parents, dtype=int)
+        self.section_ids = np.array(section_ids, dtype=int)
+        self.labels = np.array(labels, dtype=np.uint64)
+        self.label_names = list(label_names)
+
+    @classmethod
+    def from_branches(cls, branches):
+        """
+        Convert branches into compartments: each pair of consecutive points on a branch
+        is a compartment, with the radius of its end point.
+
+        :param branches: Depth-first ordered branches of a morphology.
+        :type branches: list
+        """
+        label_names = []
+
+        def label_bit(label):
+            if label not in label_names:
+                if len(label_names) == 64:
+                    raise MorphologyError(
+                        "Compartment label bitmasks can hold at most 64 labels."
+                    )
+                label_names.append(label)
+            return np.uint64(1) << np.uint64(label_names.index(label))
+
+        starts, ends, radii, parents, section_ids, labels = [], [], [], [], [], []
+        # Index of the last compartment of each branch, or if the branch has no
+        # compartments the one that its children should connect to.
+        last_compartment = {}
+        offset = 0
+        for branch in branches:
+            if branch._parent is None:
+                parent = -1
+            else:
+                parent = last_compartment[id(branch._parent)]
+            n = max(branch.size - 1, 0)
+            if n:
+                points = np.column_stack((branch.x, branch.y, branch.z))
+                starts.append(points[:-1])
+                ends.append(points[1:])
+                radii.append(np.asarray(branch.radii)[1:])
+                branch_parents = np.arange(offset - 1, offset + n - 1)
+                branch_parents[0] = parent
+                parents.append(branch_parents)
+                section_ids.append(np.full(n, getattr(branch, "_neuron_sid", -1)))
+                mask = np.zeros(branch.size, dtype=np.uint64)
+                for label in branch._full_labels:
+                    mask |= label_bit(label)
+                for label, label_mask in branch._label_masks.items():
+                    mask[label_mask] |= label_bit(label)
+                # The first point's labels are dropped as there are only n - 1
+                # compartments.
+                labels.append(mask[1:])
+            last_compartment[id(branch)] = offset + n - 1 if n else parent
+            offset += n
+        if not offset:
+            return cls(np.empty((0, 3)), np.empty((0, 3)), [], [], [], [], label_names)
+        return cls(
+            np.concatenate(starts),
+            np.concatenate(ends),
+            np.concatenate(radii),
+            np.concatenate(parents),
+            np.concatenate(section_ids),
+            np.concatenate(labels),
+            label_names,
+        )
+
+    def __len__(self):
+        return len(self.radii)
+
+    @property
+    def ids(self):
+        return np.arange(len(self))
+
+    @property
+    def midpoints(self):
+        return (self.ends - self.starts) / 2 + self.starts
+
+    def get_label_mask(self, labels):
+        """
+        Return a boolean mask of the compartments that have any of the given labels.
+
+        :param labels: List of labels, or ``None`` to select all compartments.
+        :type labels: list
+        :rtype: :class:`numpy.ndarray`
+        """
+        if labels is None:
+            return np.ones(len(self.labels), dtype=bool)
+        bits = np.uint64(0)
+        for label in labels:
+            if label in self.label_names:
+                bits |= np.uint64(1) << np.uint64(self.label_names.index(label))
+        return (self.labels & bits) != 0
+
+    def get_labels(self, index):
+        """
+        Return the list of labels of a compartment.
+        """
+        mask = int(self.labels[index])
+        return [name for i, name in enumerate(self.label_names) if mask >> i & 1]
+
+    def rotate(self, rotation):
+        """
+        Rotate the start and end points of all compartments.
+
+        :param rotation: 3x3 rotation matrix.
+        """
+        self.starts = self.starts @ rotation.T
+        self.ends = self.ends @ rotation.T
+
+    def to_compartments(self):
+        """
+        Create a :class:`Compartment <.morphologies.Compartment>` object for each
+        compartment.
+        """
+        compartments = []
+        for i, (parent, section_id) in enumerate(zip(self.parents, self.section_ids)):
+            kwargs = dict(id=i, labels=self.get_labels(i))
+            if parent >= 0:
+                kwargs["parent"] = compartments[parent]
+            if section_id >= 0:
+                kwargs["section_id"] = section_id
+            compartments.append(
+                Compartment(self.starts[i], self.ends[i], self.radii[i], **kwargs)
+            )
+        return compartments
+
+
 def branch_iter(branch):
     """
     Iterate over a branch and all of its children depth first.
@@ -261,10 +409,25 @@ class Morphology:
         self.has_voxels = False
         self.roots = roots
         self._compartments = None
+        self._compartment_arrays = None
         self.update_compartment_tree()
 
+    @property
+    def compartment_arrays(self):
+        """
+        Return the :class:`CompartmentArrays <.morphologies.CompartmentArrays>` of the
+        morphology.
+        """
+        if self._compartment_arrays is None:
+            self._compartment_arrays = CompartmentArrays.from_branches(self.branches)
+        return self._compartment_arrays
+
     @property
     def compartments(self):
+        """
+        Return a list of :class:`Compartment <.morphologies.Compartment>` objects,
+        created from the :attr:`compartment_arrays` on first access.
+        """
         if self._compartments is None:
             self._compartments = self.to_compartments()
         return self._compartments
@@ -280,20 +443,7 @@ class Morphology:
         """
         Return a flattened array of compartments
         """
-        comp_counter = 0
-
-        def treat_branch(branch, last_parent=None):
-            nonlocal comp_counter
-            comps = branch.to_compartments(comp_counter, last_parent)
-            comp_counter += len(comps)
-            # If this branch has no compartments just pass on the compartment we were
-            # supposed to connect our first compartment to. That way this empty branch
-            # is skipped and the next compartments are still connected in the comp tree.
-            parent_comp = comps[-1] if len(comps) else last_parent
-            child_iters = (treat_branch(b, parent_comp) for b in branch._children)
-            return itertools.chain(comps, *child_iters)
-
-        return [*itertools.chain(*(treat_branch(root) for root in self.roots))]
+        return self.compartment_arrays.to_compartments()
 
     def flatten(self, vectors=None, matrix=False):
         """
@@ -319,8 +469,9 @@ class Morphology:
     def update_compartment_tree(self):
         # Eh, this code will be refactored soon, if you're still seeing this in v4 open an
         # issue.
-        if self.compartments:
-            self.compartment_tree = KDTree(np.array([c.end for c in self.compartments]))
+        arrays = self.compartment_arrays
+        if len(arrays):
+            self.compartment_tree = KDTree(arrays.ends)
 
     def voxelize(self, N, compartments=None):
         self.cloud = VoxelCloud.create(self, N, compartments=compartments)
@@ -334,29 +485,17 @@ class Morphology:
         return compartment_map
 
     def get_bounding_box(self, compartments=None, centered=True):
-        # Use the compartment tree to get a quick array of the compartments positions
-        compartment_positions = np.array(
-            list(map(lambda c: c.midpoint, compartments or self.compartments))
-        )
-        # Determine the amount of dimensions of the morphology. Let's hope 3 ;)
-        n_dimensions = range(compartment_positions.shape[1])
+        if compartments:
+            compartment_positions = np.array([c.midpoint for c in compartments])
+        else:
+            compartment_positions = self.compartment_arrays.midpoints
         # Create a bounding box
         outer_box = Box()
         # The outer box dimensions are equal to the maximum distance between compartments in each of n dimensions
-        outer_box.dimensions = np.array(
-            [
-                np.max(compartment_positions[:, i]) - np.min(compartment_positions[:, i])
-                for i in n_dimensions
-            ]
-        )
+        lowest = np.min(compartment_positions, axis=0)
+        outer_box.dimensions = np.max(compartment_positions, axis=0) - lowest
         # The outer box origin should be in the middle of the outer bounds if 'centered' is True. (So lowermost point + sometimes half of dimensions)
-        outer_box.origin = np.array(
-            [
-                np.min(compartment_positions[:, i])
-                + (outer_box.dimensions[i] / 2) * int(centered)
-                for i in n_dimensions
-            ]
-        )
+        outer_box.origin = lowest + (outer_box.dimensions / 2) * int(centered)
         return outer_box
 
     def get_search_radius(self, plane="xyz"):
@@ -371,34 +510,36 @@ class Morphology:
         return np.sqrt(np.sum(max_dists ** 2))
 
     def get_compartment_network(self):
-        compartments = self.compartments
-        node_list = [set([]) for c in compartments]
+        parents = self.compartment_arrays.parents
+        node_list = [set([]) for _ in parents]
         # Add child nodes to their parent's adjacency set
-        for node in compartments[1:]:
-            if node.parent is None:
-                continue
-            node_list[int(node.parent.id)].add(int(node.id))
+        for node in np.nonzero(parents >= 0)[0]:
+            node_list[parents[node]].add(int(node))
         return node_list
 
     def get_compartment_positions(self, labels=None):
         if labels is None:
             return self.compartment_tree.get_arrays()[0]
-        return [c.end for c in self.get_compartments(labels=labels)]
+        arrays = self.compartment_arrays
+        return arrays.ends[arrays.get_label_mask(labels)]
 
     def get_compartment_tree(self, labels=None):
         if labels is not None:
-            return _compartment_tree(self.get_compartments(labels=labels))
+            return KDTree(self.get_compartment_positions(labels=labels))
         return self.compartment_tree
 
     def get_compartment_submask(self, labels):
         ## TODO: Remove; voxelintersection & touchdetection audit should make this code
         ## obsolete.
-        return [c.id for c in self.get_compartments(labels)]
+        arrays = self.compartment_arrays
+        return arrays.ids[arrays.get_label_mask(labels)].tolist()
 
     def get_compartments(self, labels=None):
         if labels is None:
             return self.compartments.copy()
-        return [c for c in self.compartments if any(l in labels for l in c.labels)]
+        mask = self.compartment_arrays.get_label_mask(labels)
+        compartments = self.compartments
+        return [compartments[i] for i in np.nonzero(mask)[0]]
 
     def get_branches(self, labels=None):
         if labels is None:
@@ -413,17 +554,63 @@ class Morphology:
         Rotation matrix R, representing a rotation of angle alpha around vector k
 
         """
-        R = get_rotation_matrix(v0, v)
+        self.apply_rotation(get_rotation_matrix(v0, v))
 
-        for c in range(len(self.compartments)):
-            self.compartments[c].start = R.dot(self.compartments[c].start)
-            self.compartments[c].end = R.dot(self.compartments[c].end)
+    def apply_rotation(self, rotation):
+        """
+        Rotate the points of all branches of the morphology around the origin with a
+        single product of the rotation matrix and the flattened positional vectors.
 
+        :param rotation: 3x3 rotation matrix.
+        :type rotation: :class:`numpy.ndarray`
+        """
+        branches = self.branches
+        if branches:
+            points = self.flatten(vectors=["x", "y", "z"], matrix=True) @ rotation.T
+            splits = np.cumsum([branch.size for branch in branches])[:-1]
+            for branch, branch_points in zip(branches, np.split(points, splits)):
+                branch.x, branch.y, branch.z = branch_points.T
+        if self._compartment_arrays is not None:
+            self._compartment_arrays.rotate(rotation)
+        # Recreate the compartment objects from the rotated arrays when next accessed.
+        self._compartments = None
         self.update_compartment_tree()
 
+    def copy(self):
+        """
+        Return a copy of the morphology with copies of its branches, without voxel
+        cloud. The vectors of the branches are shared until they are replaced.
+
+        :rtype: :class:`.morphologies.Morphology`
+        """
+        branches = self.branches
+        copies = [copy.copy(branch) for branch in branches]
+        index = {id(branch): i for i, branch in enumerate(branches)}
+        for branch, branch_copy in zip(branches, copies):
+            branch_copy._full_labels = branch._full_labels.copy()
+            branch_copy._label_masks = branch._label_masks.copy()
+            branch_copy._children = [copies[index[id(c)]] for c in branch._children]
+            if branch._parent is not None:
+                branch_copy._parent = copies[index[id(branch._parent)]]
+        morphology = copy.copy(self)
+        morphology.roots = [copies[index[id(root)]] for root in self.roots]
+        morphology._compartments = None
+        if self._compartment_arrays is not None:
+            morphology._compartment_arrays = copy.copy(self._compartment_arrays)
+        morphology.cloud = None
+        return morphology
+
+    def rotated(self, rotation):
+        """
+        Return a rotated copy of the morphology.
 
-def _compartment_tree(compartments):
-    return KDTree(np.array([c.end for c in compartments]))
+        :param rotation: 3x3 rotation matrix.
+        :type rotation: :class:`numpy.ndarray`
+        :rtype: :class:`.morphologies.Morphology`
+        """
+        morphology = self.copy()
+        morphology.apply_rotation(rotation)
+        return morphology
 
 
 class Representation(ConfigurableClass):
@@ -477,6 +664,18 @@ class NoGeometry(Representation):
         pass
 
 
+def get_orientation_matrix(phi, theta):
+    """
+    Return the rotation matrix that orients a morphology along the y axis towards the
+    azimuth angle ``phi`` and elevation angle ``theta``, in degrees.
+    """
+    phi_rad = phi * np.pi / 180
+    theta_rad = theta * np.pi / 180
+    start_vector = np.array([0, 1, 0])
+    end_vector = np.array([np.cos(phi_rad), np.sin(phi_rad), np.sin(theta_rad)])
+    return get_rotation_matrix(start_vector, end_vector)
+
+
 def get_rotation_matrix(v0, v):
     I = np.identity(3)
     # Reduce 1-size dimensions
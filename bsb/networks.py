@@ -112,11 +112,56 @@ class Branch:
         self._terminus = compartment
 
     def interpolate(self, resolution):
-        for comp in self._compartments:
-            length_comp = np.linalg.norm(comp.end - comp.start)
-            if length_comp > resolution + 1e-3:
-                num_to_add = math.ceil(length_comp / resolution)
-                added_points = self.split(comp, num_to_add)
+        """
+        Split the compartments that are longer than the resolution into equal pieces
+        that are at most as long as the resolution. The points of all pieces are
+        resampled from the branch at once, and the compartments are reordered in the
+        order they are connected in.
+
+        The partial compartments store a link to the original compartment in the
+        attribute `_original`, like :meth:`split`.
+
+        :param resolution: Maximum length of the compartments.
+        :type resolution: float
+        """
+        compartments = list(self.walk())
+        starts = np.array([c.start for c in compartments], dtype=float)
+        deltas = np.array([c.end for c in compartments], dtype=float) - starts
+        lengths = np.linalg.norm(deltas, axis=1)
+        pieces = np.ones(len(compartments), dtype=int)
+        long = lengths > resolution + 1e-3
+        pieces[long] = np.ceil(lengths[long] / resolution)
+        if not long.any():
+            return
+        # The original compartment of each piece, and the index of the piece in it.
+        owners = np.repeat(np.arange(len(compartments)), pieces)
+        index = np.arange(len(owners)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        steps = deltas[owners] / pieces[owners, np.newaxis]
+        piece_starts = index[:, np.newaxis] * steps + starts[owners]
+        piece_ends = (index[:, np.newaxis] + 1) * steps + starts[owners]
+        last = index == pieces[owners] - 1
+        new_compartments = []
+        for owner, is_last, start, end in zip(owners, last, piece_starts, piece_ends):
+            compartment = compartments[owner]
+            if pieces[owner] == 1:
+                new_compartments.append(compartment)
+                continue
+            # The last piece ends exactly at the end of the original compartment.
+            if is_last:
+                end = compartment.end
+            c = Compartment.from_template(compartment, start=start, end=end)
+            c._original = compartment
+            new_compartments.append(c)
+        # Connect the compartments to each other, and the branch to the parent and child
+        # of the original root and terminus.
+        new_compartments[0]._parent = self._root._parent
+        new_compartments[-1]._child = self._terminus._child
+        for parent, child in zip(new_compartments, new_compartments[1:]):
+            parent._child = child
+            child._parent = parent
+        self._compartments = new_compartments
+        self._root = new_compartments[0]
+        self._terminus = new_compartments[-1]
 
     def split(self, compartment, n):
         """
@@ -195,32 +240,6 @@ class Branch:
             self._compartments.remove(detached_comp)
         return detached_branch
 
-    def voxelize(self, position, bounding_box, voxel_tree, map, voxel_list):
-        v_id = len(voxel_list)
-        for v, comp in enumerate(self._compartments):
-            # Check if the current bounding_box needs to be extended
-            bounding_box[0] = np.minimum(bounding_box[0], comp.end + position)
-            bounding_box[1] = np.maximum(bounding_box[1], comp.end + position)
-
-            # Find the external points of the voxel surrounding the compartment in absolute coordinates
-            voxel_bottom_left = np.minimum(comp.start, comp.end)
-            voxel_top_right = np.maximum(comp.start, comp.end)
-
-            voxel = tuple(
-                np.concatenate((voxel_bottom_left + position, voxel_top_right + position))
-            )
-
-            # Add the voxel to the tree
-            voxel_tree.insert(
-                v_id,
-                voxel,
-            )
-            map.append(comp)
-            voxel_list.append(voxel)
-            v_id += 1
-
-        return bounding_box, voxel_tree, map, voxel_list
-
 
 def _init_child_compartments(compartments):
     # Reset/init child compartments
@@ -1,51 +1,184 @@
 from . import __version__
 from .reporting import warn
 from .helpers import ConfigurableClass, get_qualified_class_name
-from .morphologies import Morphology, Compartment, Branch
+from .morphologies import Morphology, Compartment, Branch, get_orientation_matrix
+from .voxels import VoxelCloud
+from .trees import LazyTree
 from bsb.helpers import suppress_stdout
 from contextlib import contextmanager
+from collections import OrderedDict
 from abc import abstractmethod, ABC
-import h5py, os, time, pickle, random, numpy as np
+import h5py, os, time, pickle, random, weakref, numpy as np
 from numpy import string_
 from .exceptions import *
-from .models import ConnectivitySet, PlacementSet
+from .models import ConnectivitySet, ConnectivityIndex, PlacementSet
 from sklearn.neighbors import KDTree
-import os, sys, functools
+import os, sys, functools, itertools
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "dbbs-models"))
 
 
+def _data_signature(data):
+    # Identify in-memory data by reference and size so that later writes can tell
+    # whether it was replaced or has grown since it was stored.
+    try:
+        ref = weakref.ref(data)
+    except TypeError:
+        ref = lambda: data
+    size = getattr(data, "shape", None)
+    if size is None and hasattr(data, "__len__"):
+        size = len(data)
+    return ref, size
+
+
+def _signature_matches(signature, data):
+    ref, size = signature
+    if ref() is not data:
+        return False
+    return size == _data_signature(data)[1]
+
+
 class ResourceHandler(ABC):
+    """
+    Base class for the handlers of a storage resource. The handler pools a single open
+    handle to its resource: nested :meth:`load` scopes share the handle, read scopes are
+    served by an open write handle and a write scope inside of a read scope upgrades the
+    handle in place. The handle is released when the outermost scope exits, unless
+    ``keep_handles_open`` is set, in which case it stays open until
+    :meth:`close_handle` is called. A ``read_only`` handler refuses to open its resource
+    in a writable mode.
+    """
+
+    keep_handles_open = False
+    read_only = False
+
     def __init__(self):
         self.handle_mode = None
         self._handle = None
+        self._handle_file = None
+        self._handle_scopes = 0
+        self._handle_objects = {}
+        self._stored_signatures = {}
+
+    def is_stored(self, path, *data):
+        """
+        Check whether the given data was stored under ``path`` by this handler and
+        hasn't been replaced or resized since.
+        """
+        signatures = self._stored_signatures.get(path)
+        if signatures is None or len(signatures) != len(data):
+            return False
+        return all(_signature_matches(s, d) for s, d in zip(signatures, data))
+
+    def mark_stored(self, path, *data):
+        """
+        Remember that the given data has been stored under ``path``.
+        """
+        self._stored_signatures[path] = tuple(map(_data_signature, data))
+
+    def forget_stored(self):
+        """
+        Forget everything that was stored, so that the next write stores all data.
+        """
+        self._stored_signatures = {}
 
     @contextmanager
     def load(self, mode="r"):
-        restore_previous = False
-        if mode != self.handle_mode:
-            restore_previous = True
-            previous_mode = self.handle_mode
-            self.handle_mode = mode
-            if self._handle is not None:
-                self.release_handle(self._handle)
-            self._handle = self.get_handle(mode)
-
-        def handler():
-            return self._handle
-
+        """
+        Open the resource for the duration of the context and yield a function that
+        returns the current handle. The handle may be replaced by an upgrade to a
+        writable mode, so it should be retrieved from the function every time.
+
+        :param mode: ``"r"`` to read, ``"a"`` or ``"r+"`` to write or ``"w"`` to
+          truncate the resource.
+        :raises: ResourceError when a writable mode is requested from a ``read_only``
+          handler.
+        """
+        if self.read_only and mode != "r":
+            raise ResourceError(
+                "Can't open read only resource '{}' in mode '{}'.".format(self.file, mode)
+            )
+        truncates = self._acquire_handle(mode)
+        self._handle_scopes += 1
         try:
-            yield handler  # Return the handler that always produces the current handle
+            yield self._get_open_handle
         finally:
-            if restore_previous:
-                self.release_handle(self._handle)
-                self._handle = None
-                if previous_mode is not None:
-                    if previous_mode == "w":
-                        # Continue appending instead of re-overwriting previous write.
-                        previous_mode = "a"
-                    self._handle = self.get_handle(previous_mode)
-                self.handle_mode = previous_mode
+            self._handle_scopes -= 1
+            if mode != "r":
+                # Objects that were written to may have been deleted or replaced.
+                self._handle_objects = {}
+            if truncates and self._handle is not None:
+                # Continue appending instead of re-overwriting previous write.
+                self.handle_mode = "a"
+            if not self._handle_scopes and not self.keep_handles_open:
+                self.close_handle()
+
+    @contextmanager
+    def batch(self, mode="r"):
+        """
+        Keep the resource open for all the reads and writes in the context, so that a
+        whole pass over the resource runs on a single open handle.
+
+        :param mode: Mode to open the resource in. Opening in a writable mode up front
+          avoids the upgrade of the handle by the first write.
+        """
+        with self.load(mode):
+            yield self
+
+    def open_object(self, path):
+        """
+        Return the object under ``path`` in the open resource. The object is cached for
+        as long as the handle stays open, and survives upgrades of the handle.
+
+        :raises: KeyError if there is no object under ``path``.
+        """
+        try:
+            return self._handle_objects[path]
+        except KeyError:
+            obj = self._handle_objects[path] = self._get_open_handle()[path]
+            return obj
+
+    def close_handle(self):
+        """
+        Release the open handle to the resource, if any.
+        """
+        if self._handle is not None:
+            handle, self._handle = self._handle, None
+            self.release_handle(handle)
+        self.handle_mode = None
+        self._handle_file = None
+        self._handle_objects = {}
+
+    def _get_open_handle(self):
+        return self._handle
+
+    def _acquire_handle(self, mode):
+        # Make sure that the pooled handle can serve `mode`, and return whether the
+        # handle was (re)opened to truncate the resource.
+        if self._handle is not None and self._handle_file != self.file:
+            self.close_handle()
+        if self._handle is None:
+            self._open_handle(mode)
+            return mode == "w"
+        if mode == "w":
+            if self.handle_mode == "w":
+                return False
+            self.close_handle()
+            self._open_handle(mode)
+            return True
+        if mode != "r" and self.handle_mode == "r":
+            paths = list(self._handle_objects.keys())
+            self.release_handle(self._handle)
+            self._handle = None
+            self._open_handle(mode)
+            handle = self._handle
+            self._handle_objects = {p: handle[p] for p in paths if p in handle}
+        return False
+
+    def _open_handle(self, mode):
+        self._handle = self.get_handle(mode)
+        self._handle_file = self.file
+        self.handle_mode = mode
 
     @abstractmethod
     def get_handle(self, mode=None):
@@ -68,6 +201,10 @@ class HDF5ResourceHandler(ResourceHandler):
         Open an HDF5 resource.
         """
         # Open a new handle to the resource.
+        if mode == "w":
+            # Persist the free space of new files so that datasets that are rewritten
+            # later on can reuse the space of the data they replace.
+            return h5py.File(self.file, mode, fs_strategy="fsm", fs_persist=True)
         return h5py.File(self.file, mode)
 
     def release_handle(self, handle):
@@ -101,6 +238,10 @@ class HDF5TreeHandler(HDF5ResourceHandler, TreeHandler):
     """
 
     def store_tree_collections(self, tree_collections):
+        if self.read_only:
+            # The trees stay in memory, where the owner of the handler can collect the
+            # trees that weren't stored.
+            return
         with self.load("r+") as f:
             if "trees" not in f():
                 tree_group = f().create_group("trees")
@@ -112,24 +253,52 @@ class HDF5TreeHandler(HDF5ResourceHandler, TreeHandler):
                 else:
                     tree_collection_group = tree_group[tree_collection.name]
                 for tree_name, tree in tree_collection.items():
+                    if tree is None:
+                        continue
+                    path = "/trees/{}/{}".format(tree_collection.name, tree_name)
                     if tree_name in tree_collection_group:
+                        if self.is_stored(path, tree):
+                            continue
                         del tree_collection_group[tree_name]
+                    # Store the points of the tree, it is rebuilt when it is loaded.
                     tree_dataset = tree_collection_group.create_dataset(
-                        tree_name, data=string_(pickle.dumps(tree))
+                        tree_name, data=np.asarray(tree.data)
                     )
+                    tree_dataset.attrs["leaf_size"] = getattr(tree, "leaf_size", 40)
+                    self.mark_stored(path, tree)
 
     def load_tree(self, collection_name, tree_name):
+        """
+        Load a tree as a :class:`.trees.LazyTree`: its points are read and the tree is
+        built when it is first used.
+        """
+        path = "/trees/{}/{}".format(collection_name, tree_name)
         with self.load() as f:
-            try:
-                return pickle.loads(
-                    f()["/trees/{}/{}".format(collection_name, tree_name)][()]
-                )
-            except KeyError as e:
+            if path not in f():
                 raise DatasetNotFoundError(
                     "Tree not found in HDF5 file '{}', path does not exist: '{}'".format(
-                        f().file
+                        self.file, path
                     )
                 )
+            dataset = f()[path]
+            if dataset.shape == ():
+                # Trees used to be stored pickled.
+                return pickle.loads(dataset[()])
+            leaf_size = int(dataset.attrs.get("leaf_size", 40))
+        file = self.file
+        tree = LazyTree(lambda: self._read_tree_points(file, path), leaf_size)
+        # The tree is still stored as is, so it doesn't have to be rewritten.
+        self.mark_stored(path, tree)
+        return tree
+
+    def _read_tree_points(self, file, path):
+        # Read the points from the file the tree was loaded from, even if the handler
+        # has since moved to another file.
+        if file == self.file:
+            with self.load() as f:
+                return f()[path][()]
+        with h5py.File(file, "r") as f:
+            return f[path][()]
 
     def list_trees(self, collection_name):
         with self.load() as f:
@@ -231,9 +400,77 @@ class OutputFormatter(ConfigurableClass, TreeHandler):
         pass
 
 
+class MorphologyLRU:
+    """
+    Size bounded least recently used cache of loaded morphologies and the voxel clouds
+    of their rotations. Entries are stored under a key of the repository file and the
+    morphology name. Repositories :meth:`invalidate` the morphologies that they
+    overwrite, remove or truncate. The least recently used entries are evicted when the
+    size of the cached point data exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes=2 ** 28):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, loader):
+        """
+        Return the morphology cached under ``key``, or load it with ``loader`` and
+        cache it.
+        """
+        try:
+            morphology, size = self._entries[key]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return morphology
+        morphology = loader()
+        size = _cached_bytes(morphology)
+        if size <= self.max_bytes:
+            self._entries[key] = (morphology, size)
+            self.bytes += size
+            self._evict()
+        return morphology
+
+    def invalidate(self, file, name=None):
+        """
+        Remove the morphologies of a repository file, or a single morphology of it,
+        from the cache.
+        """
+        for key in list(self._entries):
+            if key[0] == file and (name is None or key[1] == name):
+                self.bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self):
+        while self.bytes > self.max_bytes:
+            self.bytes -= self._entries.popitem(last=False)[1][1]
+
+
+def _cached_bytes(entry):
+    if isinstance(entry, VoxelCloud):
+        return np.asarray(entry.voxels).nbytes + 8 * sum(map(len, entry.map))
+    return sum(getattr(b, v).nbytes for b in entry.branches for v in Branch.vectors)
+
+
 class MorphologyRepository(HDF5TreeHandler):
 
     defaults = {"file": "morphology_repository.hdf5"}
+    # Process wide cache of the morphologies loaded by `get_cached_morphology`.
+    loaded_morphologies = MorphologyLRU()
 
     def __init__(self, file=None):
         super().__init__()
@@ -245,6 +482,9 @@ class MorphologyRepository(HDF5TreeHandler):
         """
         Open the HDF5 storage resource and initialise the MorphologyRepository structure.
         """
+        if mode == "w":
+            # The morphologies of a truncated file are gone.
+            self._invalidate_cached_morphology()
         # Open a new handle to the HDF5 resource.
         handle = HDF5TreeHandler.get_handle(self, mode)
         if handle.mode != "r":
@@ -367,7 +607,20 @@ class MorphologyRepository(HDF5TreeHandler):
                 print("Importing", n)
                 self.import_arbz(n, c, overwrite=True)
 
-    def save_morphology(self, name, morphology, overwrite=False):
+    def save_morphology(self, name, morphology, overwrite=False, packed=True):
+        """
+        Save a morphology to the repository.
+
+        :param name: Name of the morphology.
+        :type name: str
+        :param morphology: Morphology to save.
+        :type morphology: :class:`.morphologies.Morphology`
+        :param overwrite: Replace any existing morphology with the same name.
+        :type overwrite: bool
+        :param packed: Store the morphology in the packed format, with a single points
+          matrix, branch table and label bitmask, instead of a group per branch.
+        :type packed: bool
+        """
         with self.load("a") as repo:
             if overwrite:  # Do we overwrite previously existing dataset with same name?
                 self.remove_morphology(
@@ -379,7 +632,11 @@ class MorphologyRepository(HDF5TreeHandler):
                         name
                     )
                 )
+            self._invalidate_cached_morphology(name)
             r = repo()["/morphologies"].create_group(name)
+            if packed:
+                _save_packed(r, morphology.branches)
+                return
             b = r.create_group("branches")
             for id, branch in enumerate(morphology.branches):
                 branch._tmp_id = id
@@ -417,6 +674,7 @@ class MorphologyRepository(HDF5TreeHandler):
                     if overwrite or m_key not in m_group:
                         if m_key in m_group:
                             del m_group[m_key]
+                        self._invalidate_cached_morphology(m_key)
                         external_handle().copy("/morphologies/" + m_key, m_group)
                     else:
                         self.scaffold.warn(
@@ -426,6 +684,48 @@ class MorphologyRepository(HDF5TreeHandler):
                             RepositoryWarning,
                         )
 
+    def convert_morphology(self, name, packed=True):
+        """
+        Convert a stored morphology between the packed format and the format with a
+        group per branch. The voxel clouds of the morphology are kept.
+
+        :param name: Name of the morphology.
+        :type name: str
+        :param packed: Convert to the packed format, or to a group per branch.
+        :type packed: bool
+        """
+        with self.load("a") as repo:
+            group = self._raw_morphology(name, repo)
+            if _is_packed(group) == packed:
+                return
+            morphology = _morphology(group)
+            self._invalidate_cached_morphology(name)
+            for key in (*_packed_datasets, "branches"):
+                if key in group:
+                    del group[key]
+            if packed:
+                _save_packed(group, morphology.branches)
+            else:
+                del group.attrs["labels"]
+                group.create_group("branches")
+                for id, branch in enumerate(morphology.branches):
+                    branch._tmp_id = id
+                    if branch._parent is not None:
+                        branch._tmp_parent = branch._parent._tmp_id
+                    self.save_branch(name, id, branch)
+
+    def convert_repository(self, packed=True):
+        """
+        Convert all morphologies in the repository between the packed format and the
+        format with a group per branch.
+
+        :param packed: Convert to the packed format, or to a group per branch.
+        :type packed: bool
+        """
+        with self.load("a"):
+            for name in self.list_morphologies(include_rotations=True):
+                self.convert_morphology(name, packed=packed)
+
     def get_morphology(self, name, scaffold=None):
         """
         Load a morphology from repository data
@@ -433,53 +733,196 @@ class MorphologyRepository(HDF5TreeHandler):
         with self.load() as handler:
             # Check if morphology exists
             if not self.morphology_exists(name):
+                rotation = _parse_rotated_name(name)
+                if rotation is not None and self.morphology_exists(rotation[0]):
+                    # Rotations that weren't stored are rotated on the fly.
+                    name, phi, theta = rotation
+                    return self._rotate(self.get_morphology(name), phi, theta)
                 raise MorphologyRepositoryError(
                     "Attempting to load unknown morphology '{}'".format(name)
                 )
             group = self._raw_morphology(name, handler)
             return _morphology(group)
 
-    def store_voxel_cloud(self, morphology, overwrite=False):
-        raise NotImplementedError("Voxel cloud storage is not yet reimplemented")
+    def get_cached_morphology(self, name):
+        """
+        Load a morphology from repository data, or return it from the process wide
+        cache of loaded morphologies. The morphology is shared with all other callers
+        and should be treated as read only.
+        """
+        return self.loaded_morphologies.get(
+            (os.path.abspath(self.file), name), lambda: self.get_morphology(name)
+        )
+
+    def get_rotated_morphology(self, name, phi, theta):
+        """
+        Return a morphology rotated towards the azimuth angle ``phi`` and elevation
+        angle ``theta``, in degrees. The rotation is applied to the cached morphology
+        on first use and kept in the process wide cache of loaded morphologies, so that
+        rotations don't have to be stored in the repository. The morphology is shared
+        with all other callers and should be treated as read only.
+        """
+        phi, theta = _round(phi), _round(theta)
+        return self.loaded_morphologies.get(
+            (os.path.abspath(self.file), name, phi, theta),
+            lambda: self._rotate(self.get_cached_morphology(name), phi, theta),
+        )
+
+    def get_rotated_voxel_cloud(self, name, phi, theta, N, labels=None):
+        """
+        Return the voxel cloud of the compartments with any of the ``labels`` of a
+        rotated morphology, see :meth:`get_rotated_morphology`. The cloud is kept in the
+        process wide cache of loaded morphologies next to the rotation, so that each
+        rotation is voxelized only once. The cloud is shared with all other callers and
+        should be treated as read only.
+        """
+        phi, theta = _round(phi), _round(theta)
+
+        def voxelize():
+            morphology = self.get_rotated_morphology(name, phi, theta)
+            compartments = morphology.get_compartments(labels)
+            return VoxelCloud.create(morphology, N, compartments=compartments)
+
+        return self.loaded_morphologies.get(
+            (os.path.abspath(self.file), name, phi, theta, _voxel_cloud_name(N, labels)),
+            voxelize,
+        )
+
+    def _rotate(self, morphology, phi, theta):
+        rotated = morphology.rotated(get_orientation_matrix(phi, theta))
+        rotated.morphology_name = _rotated_name(
+            morphology.morphology_name, _round(phi), _round(theta)
+        )
+        return rotated
+
+    def _invalidate_cached_morphology(self, name=None):
+        self.loaded_morphologies.invalidate(os.path.abspath(self.file), name)
+
+    def store_voxel_cloud(self, morphology, N, labels=None, overwrite=False):
+        """
+        Store the voxel cloud of a morphology, so that it can be reused by later
+        voxelizations of the morphology into ``N`` voxels. A ``read_only`` repository
+        keeps the cloud in :attr:`deferred_voxel_clouds` instead.
+
+        :param morphology: A morphology loaded from this repository and voxelized.
+        :type morphology: :class:`.morphologies.Morphology`
+        :param N: The amount of voxels that the morphology was voxelized into.
+        :type N: int
+        :param labels: The labels of the compartments that were voxelized, or ``None``
+          if all compartments were voxelized.
+        :type labels: list
+        """
+        name = morphology.morphology_name
+        if self.read_only:
+            self.deferred_voxel_clouds.append((name, N, labels, morphology.cloud))
+            return
+        cloud_name = _voxel_cloud_name(N, labels)
         with self.load("a") as repo:
-            if self.voxel_cloud_exists(morphology.morphology_name):
+            if self.voxel_cloud_exists(name, N, labels):
                 if not overwrite:
-                    self.scaffold.warn(
-                        "Did not overwrite existing voxel cloud for '{}'".format(
-                            morphology.morphology_name
+                    warn(
+                        "Did not overwrite existing voxel cloud '{}' of '{}'".format(
+                            cloud_name, name
                         ),
                         RepositoryWarning,
                     )
                     return
-                else:
-                    del repo()["/morphologies/voxel_clouds/" + morphology.morphology_name]
-            voxel_cloud_group = repo()["/morphologies/voxel_clouds/"].create_group(
-                morphology.morphology_name
+                del repo()[f"/morphologies/{name}/clouds/{cloud_name}"]
+            self._store_voxel_cloud(repo(), name, morphology.cloud, N, labels)
+
+    @property
+    def deferred_voxel_clouds(self):
+        """
+        List of the ``(morphology_name, N, labels, cloud)`` voxel clouds that were
+        stored while the repository was read only.
+        """
+        try:
+            return self._deferred_voxel_clouds
+        except AttributeError:
+            self._deferred_voxel_clouds = []
+            return self._deferred_voxel_clouds
+
+    def store_deferred_voxel_clouds(self, clouds):
+        """
+        Store the voxel clouds deferred by read only repositories, see
+        :attr:`deferred_voxel_clouds`. Clouds of unknown morphologies and clouds that
+        are stored already are skipped.
+        """
+        with self.load("a") as repo:
+            for name, N, labels, cloud in clouds:
+                if self.morphology_exists(name) and not self.voxel_cloud_exists(
+                    name, N, labels
+                ):
+                    self._store_voxel_cloud(repo(), name, cloud, N, labels)
+
+    def _store_voxel_cloud(self, handle, name, cloud, N, labels):
+        clouds = handle[f"/morphologies/{name}"].require_group("clouds")
+        cloud_group = clouds.create_group(_voxel_cloud_name(N, labels))
+        cloud_group.attrs["N"] = N
+        cloud_group.attrs["labels"] = _voxel_cloud_labels(labels)
+        cloud_group.attrs["bounds"] = cloud.bounds
+        cloud_group.attrs["grid_size"] = cloud.grid_size
+        cloud_group.create_dataset("voxels", data=cloud.voxels)
+        # Store the compartment map as a flat list of compartment ids and the amount of
+        # compartments in each voxel.
+        sizes = np.fromiter(map(len, cloud.map), dtype=int, count=len(cloud.map))
+        ids = np.fromiter(itertools.chain(*cloud.map), dtype=int, count=sizes.sum())
+        cloud_group.create_dataset("map", data=ids)
+        cloud_group.create_dataset("map_sizes", data=sizes)
+
+    def get_voxel_cloud(self, morphology_name, N, labels=None):
+        """
+        Load a stored voxel cloud of a morphology.
+
+        :param morphology_name: Name of the morphology.
+        :type morphology_name: str
+        :param N: The amount of voxels that the morphology was voxelized into.
+        :type N: int
+        :param labels: The labels of the compartments that were voxelized.
+        :type labels: list
+        :rtype: :class:`.voxels.VoxelCloud`
+        """
+        with self.load() as handler:
+            if not self.voxel_cloud_exists(morphology_name, N, labels):
+                raise DataNotFoundError(
+                    "No voxel cloud '{}' stored for '{}'".format(
+                        _voxel_cloud_name(N, labels), morphology_name
+                    )
+                )
+            group = self._raw_voxel_cloud(
+                morphology_name, _voxel_cloud_name(N, labels), handler
             )
-            voxel_cloud_group.attrs["name"] = morphology.morphology_name
-            voxel_cloud_group.attrs["bounds"] = morphology.cloud.bounds
-            voxel_cloud_group.attrs["grid_size"] = morphology.cloud.grid_size
-            voxel_cloud_group.create_dataset("positions", data=morphology.cloud.voxels)
-            voxel_cloud_group.create_dataset(
-                "map", data=string_(pickle.dumps(morphology.cloud.map))
+            ids = group["map"][()].tolist()
+            splits = np.cumsum(group["map_sizes"][()])
+            voxel_map = [
+                ids[start:end] for start, end in zip(np.r_[0, splits[:-1]], splits)
+            ]
+            return VoxelCloud(
+                group.attrs["bounds"],
+                group["voxels"][()],
+                group.attrs["grid_size"],
+                voxel_map,
             )
 
     def morphology_exists(self, name):
         with self.load() as repo:
             return f"/morphologies/{name}" in repo()
 
-    def voxel_cloud_exists(self, morphology_name, cloud_name):
+    def voxel_cloud_exists(self, morphology_name, N, labels=None):
+        cloud_name = _voxel_cloud_name(N, labels)
         with self.load() as repo:
             return f"morphologies/{morphology_name}/clouds/{cloud_name}" in repo()
 
     def remove_morphology(self, name):
         with self.load("a") as repo:
+            self._invalidate_cached_morphology(name)
             if self.morphology_exists(name):
                 del repo()[f"/morphologies/{name}"]
 
-    def remove_voxel_cloud(self, morphology_name, cloud_name):
+    def remove_voxel_cloud(self, morphology_name, N, labels=None):
+        cloud_name = _voxel_cloud_name(N, labels)
         with self.load("a") as repo:
-            if self.voxel_cloud_exists(name):
+            if self.voxel_cloud_exists(morphology_name, N, labels):
                 del repo()[f"morphologies/{morphology_name}/clouds/{cloud_name}"]
 
     def list_morphologies(
@@ -527,7 +970,8 @@ class MorphologyRepository(HDF5TreeHandler):
                 yield from handle["/morphologies"].keys()
 
             def clouds(m):
-                return handle[f"/morphologies/{m}/clouds"].keys()
+                group = handle[f"/morphologies/{m}"]
+                return group["clouds"].keys() if "clouds" in group else ()
 
             return [m for m in morphos() if len(clouds(m)) > 0]
 
@@ -544,6 +988,15 @@ class MorphologyRepository(HDF5TreeHandler):
         return handler()[f"/morphologies/{morphology_name}/clouds/{cloud_name}"]
 
 
+def _voxel_cloud_labels(labels):
+    return "*" if labels is None else ",".join(sorted(set(labels)))
+
+
+def _voxel_cloud_name(N, labels):
+    # Voxel clouds are stored per amount of voxels and set of compartment labels.
+    return "{}:{}".format(int(N), _voxel_cloud_labels(labels))
+
+
 def _is_invalid_order(order):
     # Checks sequential order starting from zero. [] is also valid.
     #
@@ -575,8 +1028,11 @@ def _int_ordered_iter(group):
 
 
 def _morphology(m_root_group):
-    b_root_group = m_root_group["branches"]
-    branches = [_branch(b_group) for b_group in _int_ordered_iter(b_root_group)]
+    if _is_packed(m_root_group):
+        branches = _packed_branches(m_root_group)
+    else:
+        b_root_group = m_root_group["branches"]
+        branches = [_branch(b_group) for b_group in _int_ordered_iter(b_root_group)]
     _attach_branches(branches)
     roots = [b for b in branches if b._parent is None]
     morpho = Morphology(roots)
@@ -604,6 +1060,83 @@ def _branch(b_root_group):
     return branch
 
 
+# Datasets of the packed morphology format: a matrix with the vectors of all points,
+# a table with the offset, parent and NEURON section of each branch and the label
+# bitmasks of the branches and points. The label names are stored in the `labels` attr.
+_packed_datasets = ("points", "branch_table", "branch_labels", "point_labels")
+
+
+def _is_packed(m_root_group):
+    return "points" in m_root_group
+
+
+def _save_packed(m_root_group, branches):
+    ids = {id(branch): i for i, branch in enumerate(branches)}
+    names = {}
+    for branch in branches:
+        for label in itertools.chain(branch._full_labels, branch._label_masks):
+            names.setdefault(label, len(names))
+    if len(names) > 64:
+        raise MorphologyRepositoryError(
+            f"The packed format supports at most 64 labels, found {len(names)}."
+        )
+    sizes = np.fromiter((b.size for b in branches), dtype=int, count=len(branches))
+    table = np.empty((len(branches), 3), dtype=int)
+    table[:, 0] = np.cumsum(sizes) - sizes
+    table[:, 1] = [-1 if b._parent is None else ids[id(b._parent)] for b in branches]
+    table[:, 2] = [getattr(b, "_neuron_sid", -1) for b in branches]
+    points = np.empty((np.sum(sizes), len(Branch.vectors)))
+    branch_labels = np.zeros(len(branches), dtype=np.uint64)
+    point_labels = np.zeros(len(points), dtype=np.uint64)
+    for i, branch in enumerate(branches):
+        sl = slice(table[i, 0], table[i, 0] + sizes[i])
+        points[sl] = branch.points.reshape(-1, len(Branch.vectors))
+        for label in branch._full_labels:
+            branch_labels[i] |= np.uint64(1 << names[label])
+        for label, mask in branch._label_masks.items():
+            bit = np.uint64(1 << names[label])
+            point_labels[sl][np.asarray(mask, dtype=bool)] |= bit
+    m_root_group.attrs["labels"] = [string_(label) for label in names]
+    m_root_group.create_dataset("points", data=points)
+    m_root_group.create_dataset("branch_table", data=table)
+    m_root_group.create_dataset("branch_labels", data=branch_labels)
+    m_root_group.create_dataset("point_labels", data=point_labels)
+
+
+def _packed_branches(m_root_group):
+    try:
+        points, table, branch_labels, point_labels = (
+            m_root_group[key][()] for key in _packed_datasets
+        )
+    except KeyError:
+        missing = [k for k in _packed_datasets if k not in m_root_group]
+        raise MorphologyDataError(
+            f"Missing packed datasets {missing} in '{m_root_group.name}'."
+        )
+    names = [
+        label.decode() if isinstance(label, bytes) else str(label)
+        for label in m_root_group.attrs.get("labels", ())
+    ]
+    # Transpose the points so that the vectors of each branch are contiguous slices.
+    vectors = np.ascontiguousarray(points.T)
+    ends = np.append(table[1:, 0], len(points)) if len(table) else []
+    branches = []
+    for (offset, parent, sid), end, full in zip(table, ends, branch_labels):
+        branch = Branch(*vectors[:, offset:end])
+        branch._tmp_parent = int(parent)
+        if sid >= 0:
+            branch._neuron_sid = sid
+        masks = point_labels[offset:end]
+        used = np.bitwise_or.reduce(masks) if len(masks) else 0
+        for bit, label in enumerate(names):
+            if int(full) >> bit & 1:
+                branch.label(label)
+            if int(used) >> bit & 1:
+                branch.label_points(label, (masks >> np.uint64(bit)) & np.uint64(1) == 1)
+        branches.append(branch)
+    return branches
+
+
 def _attach_branches(branches):
     for branch in branches:
         if branch._tmp_parent < 0:
@@ -621,6 +1154,9 @@ class MorphologyCache:
     Loads and caches :class:`morphologies <.models.Morphology>` so that each
     morphology is loaded only once and its instance is shared among all cells
     with that Morphology. Saves a lot on memory, but the Morphology should be treated as read only.
+
+    Storing rotated morphologies is not required: morphology sets rotate the
+    morphologies on the fly with :meth:`.MorphologyRepository.get_rotated_morphology`.
     """
 
     def __init__(self, morphology_repository):
@@ -698,16 +1234,44 @@ class MorphologyCache:
         end_vector = np.array([np.cos(phi_rad), np.sin(phi_rad), np.sin(theta_rad)])
         morpho.rotate(start_vector, end_vector)
 
-        self.mr.save_morphology(f"{morpho_name}__{phi}_{theta}", morpho)
+        self.mr.save_morphology(_rotated_name(morpho_name, phi, theta), morpho)
 
 
 _round = lambda x: int(round(x))
 
 
+def _rotated_name(name, phi, theta):
+    return f"{name}__{phi}_{theta}"
+
+
+def _parse_rotated_name(name):
+    # Split `name__phi_theta` into the name and angles, or return None.
+    base, sep, angles = name.rpartition("__")
+    try:
+        phi, theta = map(int, angles.split("_"))
+    except ValueError:
+        return None
+    return (base, phi, theta) if sep and base else None
+
+
 class HDF5Formatter(OutputFormatter, MorphologyRepository):
     """
     Stores the output of the scaffold as a single HDF5 file. Is also a MorphologyRepository
     and an HDF5TreeHandler.
+
+    When ``incremental`` is set, consecutive calls to :meth:`create_output` only rewrite
+    the datasets whose data was replaced or resized in the network cache since the
+    previous call. Data that is modified in place should be reassigned to the cache to
+    be picked up. The morphology repository is never rewritten by the output.
+
+    When ``connectivity_index`` is set, the :class:`.models.ConnectivityIndex` of the
+    pre- and postsynaptic cells of each connectivity set is stored next to it.
+
+    Placement and connectivity datasets are contiguous by default, so that they can be
+    memory mapped. When ``chunked`` is set or a ``compression`` (``"gzip"`` or
+    ``"lzf"``) is given they are chunked and resizable along their rows, and compressed
+    after the ``shuffle`` filter. The chunks hold ``chunk_rows`` rows, or if it isn't
+    set as many rows as fit in ``chunk_bytes``.
     """
 
     defaults = {
@@ -716,32 +1280,78 @@ class HDF5Formatter(OutputFormatter, MorphologyRepository):
         ),
         "simulator_output_path": False,
         "morphology_repository": None,
+        "incremental": True,
+        "connectivity_index": True,
+        "chunked": False,
+        "compression": None,
+        "compression_level": 4,
+        "shuffle": True,
+        "chunk_bytes": 2 ** 20,
+        "chunk_rows": None,
+    }
+    casts = {
+        "incremental": bool,
+        "connectivity_index": bool,
+        "chunked": bool,
+        "compression_level": int,
+        "shuffle": bool,
+        "chunk_bytes": int,
+        "chunk_rows": int,
     }
 
     def create_output(self):
+        previous_file = self.file
         was_compiled = self.exists()
-        if was_compiled:
-            with h5py.File("__backup__.hdf5", "w") as backup:
-                with self.load() as repo:
-                    repo().copy("/morphologies", backup)
-
         if self.save_file_as:
             self.file = self.save_file_as
-
+        moved = os.path.abspath(self.file) != os.path.abspath(previous_file)
+        if self.incremental and not moved and self._stored_signatures and was_compiled:
+            self.update_output()
+            return
+
+        self.forget_stored()
+        # Read the lazily loaded trees before their stored points are cleared.
+        for tree_collection in self.scaffold.trees.__dict__.values():
+            tree_collection.load_all()
+        clear_output = was_compiled and not moved
         try:
-            with self.load("w") as output:
+            with self.load("a" if clear_output else "w") as output:
+                if clear_output:
+                    self._clear_output(output())
                 self.store_configuration()
                 self.store_cells()
                 self.store_tree_collections(self.scaffold.trees.__dict__.values())
                 self.store_statistics()
                 self.store_appendices()
-                self.store_morphology_repository(was_compiled)
+                self.store_morphology_repository(
+                    was_compiled, source=previous_file if moved else None
+                )
         except:
-            os.remove(self.file)
+            self.forget_stored()
+            # Only remove files that we created, existing files may hold the only copy
+            # of their morphology repository.
+            if not clear_output:
+                self.close_handle()
+                os.remove(self.file)
             raise
 
-        if was_compiled:
-            os.remove("__backup__.hdf5")
+    def update_output(self):
+        """
+        Store the data of the network cache that changed since the last write.
+        """
+        with self.load("a") as output:
+            self.store_configuration()
+            self.store_cells()
+            self.store_tree_collections(self.scaffold.trees.__dict__.values())
+            self.store_statistics()
+            self.store_appendices()
+
+    def _clear_output(self, handle):
+        # Remove the network data of a previous compilation, but keep the morphologies.
+        self._invalidate_cached_morphology()
+        for key in list(handle.keys()):
+            if key != "morphologies":
+                del handle[key]
 
     def exists(self):
         return os.path.exists(self.file)
@@ -761,7 +1371,59 @@ class HDF5Formatter(OutputFormatter, MorphologyRepository):
             scf._nextId = functools.reduce(max, map(np.max, max_ids), 0)
 
     def validate(self):
-        pass
+        if self.compression not in (None, False, "gzip", "lzf"):
+            raise ConfigurationError(
+                "Unknown output compression '{}', use 'gzip', 'lzf' or null.".format(
+                    self.compression
+                )
+            )
+
+    def get_dataset_options(self, shape, dtype, rows=None):
+        """
+        Return the ``create_dataset`` keyword arguments of the network datasets: none
+        for a contiguous dataset, or those of a chunked, compressed dataset that is
+        resizable along its rows if ``chunked`` or ``compression`` is set.
+
+        :param shape: Shape of the dataset.
+        :param dtype: Data type of the dataset.
+        :param rows: Rows per chunk. Defaults to ``chunk_rows``, or as many rows as fit
+          in ``chunk_bytes``.
+        """
+        row_shape = tuple(shape[1:])
+        if not self.chunked and not self.compression:
+            return {}
+        if not len(shape) or 0 in row_shape:
+            # Scalars and datasets with empty rows can't be chunked.
+            return {}
+        if rows is None:
+            rows = self.get_chunk_rows(shape, dtype)
+        options = dict(chunks=(rows,) + row_shape, maxshape=(None,) + row_shape)
+        if self.compression:
+            options["compression"] = self.compression
+            options["shuffle"] = self.shuffle
+            if self.compression == "gzip":
+                options["compression_opts"] = self.compression_level
+        return options
+
+    def get_chunk_rows(self, shape, dtype):
+        """
+        Return the amount of rows per chunk of a dataset.
+        """
+        if self.chunk_rows is not None:
+            return self.chunk_rows
+        row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape[1:]))
+        rows = max(1, self.chunk_bytes // max(row_bytes, 1))
+        # Don't pad small datasets up to a full chunk.
+        return int(min(rows, max(shape[0], 1)))
+
+    def create_network_dataset(self, group, name, data, dtype=None, rows=None):
+        """
+        Create a dataset with the :meth:`dataset options <get_dataset_options>` of
+        the network data.
+        """
+        data = np.asarray(data, dtype=dtype)
+        options = self.get_dataset_options(data.shape, data.dtype, rows=rows)
+        return group.create_dataset(name, data=data, **options)
 
     def store_configuration(self, config=None):
         config = config if config is not None else self.scaffold.configuration
@@ -780,31 +1442,51 @@ class HDF5Formatter(OutputFormatter, MorphologyRepository):
 
     def store_cells(self):
         with self.load("a") as f:
-            cells_group = f().create_group("cells")
+            cells_group = f().require_group("cells")
             self.store_placement(cells_group)
             self.store_cell_connections(cells_group)
             self.store_labels(cells_group)
 
     def store_placement(self, cells_group):
-        placement = cells_group.create_group("placement")
+        placement = cells_group.require_group("placement")
         for cell_type in self.scaffold.get_cell_types():
+            if cell_type.entity:
+                data = (self.scaffold.entities_by_type.get(cell_type.name),)
+            else:
+                data = (self.scaffold.cells_by_type.get(cell_type.name),)
+            data += (self.scaffold.rotations.get(cell_type.name),)
+            path = "/cells/placement/" + cell_type.name
+            if cell_type.name in placement:
+                if self.is_stored(path, *data):
+                    continue
+                del placement[cell_type.name]
             cell_type_group = placement.create_group(cell_type.name)
-            ids = cell_type_group.create_dataset(
-                "identifiers", data=cell_type._ser_cached_ids(), dtype=np.int32
+            ids = self.create_network_dataset(
+                cell_type_group, "identifiers", cell_type._ser_cached_ids(), np.int32
             )
+            # Chunk the positions and rotations along the same rows.
+            rows = None
             if not cell_type.entity:
-                cell_type_group.create_dataset(
-                    "positions", data=self.scaffold.cells_by_type[cell_type.name][:, 2:5]
+                positions = self.create_network_dataset(
+                    cell_type_group,
+                    "positions",
+                    self.scaffold.cells_by_type[cell_type.name][:, 2:5],
                 )
+                rows = positions.chunks[0] if positions.chunks else None
             if cell_type.name in self.scaffold.rotations.keys():
-                cell_type_group.create_dataset(
-                    "rotations", data=self.scaffold.rotations[cell_type.name]
+                self.create_network_dataset(
+                    cell_type_group,
+                    "rotations",
+                    self.scaffold.rotations[cell_type.name],
+                    rows=rows,
                 )
+            self.mark_stored(path, *data)
 
     def store_cell_connections(self, cells_group):
         connections_group = cells_group.require_group("connections")
         compartments_group = cells_group.require_group("connection_compartments")
         morphologies_group = cells_group.require_group("connection_morphologies")
+        index_group = cells_group.require_group("connection_index")
         for tag, connectome_data in self.scaffold.cell_connections_by_tag.items():
             related_types = list(
                 filter(
@@ -812,9 +1494,29 @@ class HDF5Formatter(OutputFormatter, MorphologyRepository):
                     self.scaffold.configuration.connection_types.values(),
                 )
             )
-            connection_dataset = connections_group.create_dataset(
-                tag, data=connectome_data
+            path = "/cells/connections/" + tag
+            data = (
+                connectome_data,
+                self.scaffold.connection_compartments.get(tag),
+                self.scaffold.connection_morphologies.get(tag),
+                self.scaffold._connectivity_set_meta.get(tag),
+            )
+            if tag in connections_group:
+                if self.is_stored(path, *data):
+                    continue
+                del connections_group[tag]
+            for group in (compartments_group, morphologies_group, index_group):
+                if tag in group:
+                    del group[tag]
+            connection_dataset = self.create_network_dataset(
+                connections_group, tag, connectome_data
             )
+            # Chunk the compartments and morphologies along the same rows.
+            rows = connection_dataset.chunks[0] if connection_dataset.chunks else None
+            if self.connectivity_index:
+                self.store_connectivity_index(
+                    index_group.create_group(tag), connectome_data
+                )
             connection_dataset.attrs["tag"] = tag
             connection_dataset.attrs["connection_types"] = list(
                 map(lambda x: x.name, related_types)
@@ -827,23 +1529,49 @@ class HDF5Formatter(OutputFormatter, MorphologyRepository):
                 for key in meta_dict:
                     connection_dataset.attrs[key] = meta_dict[key]
             if tag in self.scaffold.connection_compartments:
-                compartments_group.create_dataset(
-                    tag, data=self.scaffold.connection_compartments[tag], dtype=int
+                self.create_network_dataset(
+                    compartments_group,
+                    tag,
+                    self.scaffold.connection_compartments[tag],
+                    int,
+                    rows=rows,
                 )
-                morphology_dataset = morphologies_group.create_dataset(
-                    tag, data=self.scaffold.connection_morphologies[tag], dtype=int
+                morphology_dataset = self.create_network_dataset(
+                    morphologies_group,
+                    tag,
+                    self.scaffold.connection_morphologies[tag],
+                    int,
+                    rows=rows,
                 )
                 morphology_dataset.attrs["map"] = self.scaffold.connection_morphologies[
                     tag + "_map"
                 ]
+            self.mark_stored(path, *data)
+
+    def store_connectivity_index(self, group, connectome_data):
+        cells = np.asarray(connectome_data).reshape(-1, 2)
+        for key, column in (("from", 0), ("to", 1)):
+            index = ConnectivityIndex.create(cells[:, column])
+            key_group = group.create_group(key)
+            for name in ("ids", "indptr", "order"):
+                self.create_network_dataset(key_group, name, getattr(index, name))
 
     def store_labels(self, cells_group):
-        labels_group = cells_group.create_group("labels")
+        labels_group = cells_group.require_group("labels")
         for label in self.scaffold.labels.keys():
-            labels_group.create_dataset(label, data=self.scaffold.labels[label])
+            path = "/cells/labels/" + label
+            data = self.scaffold.labels[label]
+            if label in labels_group:
+                if self.is_stored(path, data):
+                    continue
+                del labels_group[label]
+            labels_group.create_dataset(label, data=data)
+            self.mark_stored(path, data)
 
     def store_statistics(self):
         with self.load("a") as f:
+            if "statistics" in f():
+                del f()["statistics"]
             statistics = f().create_group("statistics")
             self.store_placement_statistics(statistics)
 
@@ -856,16 +1584,24 @@ class HDF5Formatter(OutputFormatter, MorphologyRepository):
         # Append extra datasets specified internally or by user.
         with self.load("a") as f:
             for key, data in self.scaffold.appends.items():
+                if key in f():
+                    if self.is_stored(key, data):
+                        continue
+                    del f()[key]
                 dset = f().create_dataset(key, data=data)
+                self.mark_stored(key, data)
 
-    def store_morphology_repository(self, was_compiled=False):
+    def store_morphology_repository(self, was_compiled=False, source=None):
         with self.load("a") as resource:
+            self._invalidate_cached_morphology()
             if was_compiled:  # File already existed?
-                # Copy from the backup of previous version
-                with h5py.File("__backup__.hdf5", "r") as backup:
-                    if "morphologies" in resource():
-                        del resource()["/morphologies"]
-                    backup.copy("/morphologies", resource())
+                # Copy the morphologies over if the output moved to another file,
+                # otherwise they are still in place.
+                if source is not None:
+                    with h5py.File(source, "r") as previous:
+                        if "morphologies" in resource():
+                            del resource()["/morphologies"]
+                        previous.copy("/morphologies", resource())
             else:  # Fresh compilation
                 self.initialise_repo_structure(resource())
                 if self.morphology_repository is not None:  # Repo specified
@@ -933,8 +1669,8 @@ class HDF5Formatter(OutputFormatter, MorphologyRepository):
     def get_connectivity_set(self, tag):
         return ConnectivitySet(self, tag)
 
-    def get_placement_set(self, type):
-        return PlacementSet(self, type)
+    def get_placement_set(self, type, mmap=False):
+        return PlacementSet(self, type, mmap=mmap)
 
     @classmethod
     def reconfigure(cls, hdf5_file, config):
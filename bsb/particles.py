@@ -1,8 +1,13 @@
 import numpy as np
+import os
 from sklearn.neighbors import KDTree
-from rtree import index
+from scipy.spatial import cKDTree
 from random import choice
-from .reporting import report
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from .reporting import report, warn
+from .voxels import box_index
+from .exceptions import *
 
 try:
     import plotly.graph_objects as go
@@ -308,15 +313,10 @@ class ParticleSystem:
             at_risk_particles = self.particles
         if voxels is None:
             voxels = self.voxels
-        # Initialize Rtree index.
-        property = index.Property(dimension=3)
-        idx = index.Index(properties=property, interleaved=True)
-        # Insert voxel bounds in index.
-        for i, voxel in enumerate(self.voxels):
-            idx.insert(
-                i,
-                (*voxel.origin, *(voxel.origin + voxel.size)),
-            )
+        # Bulk load the voxel bounds into an Rtree index.
+        idx = box_index(
+            [(*voxel.origin, *(voxel.origin + voxel.size)) for voxel in self.voxels]
+        )
         # Query index, filter whether the intersection returns any hits, map to id and cell type.
         out_of_bounds_ids = list(
             map(
@@ -352,20 +352,322 @@ class ParticleSystem:
         return tot_number_pruned, number_pruned_per_type
 
 
-class LargeParticleSystem(ParticleSystem):
-    def __init__(self):
-        ParticleSystem.__init__()
+class ArrayParticleSystem(ParticleSystem):
+    """
+    Particle system that stores its particles in arrays instead of :class:`.Particle`
+    objects. Each iteration finds all colliding pairs with a single tree query and
+    displaces every colliding particle at once, using the same repulsion force as
+    :meth:`.Particle.displace_by`.
+    """
+
+    max_iterations = 1000
+    # Source of the random directions that separate particles on the same spot.
+    random_state = np.random
 
-    def placing(self):
-        pass
+    def fill(self, voxels, particles):
+        self.dimensions = len(voxels[0][0])
+        self.particle_types.extend(particles)
+        self.max_radius = max([pt["radius"] for pt in self.particle_types])
+        self.min_radius = min([pt["radius"] for pt in self.particle_types])
+        self.search_radius = self.max_radius * 2
+        self.voxels.extend([ParticleVoxel(v[0], v[1]) for v in voxels])
+        origins = np.array([v.origin for v in self.voxels], dtype=float)
+        sizes = np.array([v.size for v in self.voxels], dtype=float)
+        positions, radii, types = [], [], []
+        for type_id, particle_type in enumerate(self.particle_types):
+            placement_voxels = np.array(particle_type["voxels"], dtype=int)
+            particle_count = particle_type["count"]
+            # Draw the random numbers in the same layout as `ParticleSystem.fill`: a
+            # column to pick the voxel, followed by the position within the voxel.
+            placement_matrix = np.random.rand(particle_count, self.dimensions + 1)
+            voxel_ids = placement_voxels[
+                (placement_matrix[:, 0] * len(placement_voxels)).astype(int)
+            ]
+            positions.append(
+                origins[voxel_ids] + placement_matrix[:, 1:] * sizes[voxel_ids]
+            )
+            radii.append(np.full(particle_count, particle_type["radius"], dtype=float))
+            types.append(np.full(particle_count, type_id, dtype=int))
+        self.set_particles(
+            np.concatenate(positions).reshape(-1, self.dimensions),
+            np.concatenate(radii),
+            np.concatenate(types),
+        )
 
-    def fill(self):
-        super().fill()
+    def set_particles(self, positions, radii, types=None):
+        """
+        Replace the particles of the system.
 
-    def solve_collisions(self):
-        # todo: take smaller particle systems
+        :param positions: (N, D) array of particle positions.
+        :param radii: (N,) array of particle radii.
+        :param types: (N,) array of indices into the particle types of the system.
+        """
+        self._positions = np.array(positions, dtype=float)
+        self.dimensions = self._positions.shape[1]
+        self.radii = np.array(radii, dtype=float)
+        if types is None:
+            types = np.zeros(len(self.radii), dtype=int)
+        self.types = np.array(types, dtype=int)
+        self.colliding = np.zeros(len(self.radii), dtype=bool)
+        if len(self.radii):
+            self.max_radius = np.max(self.radii)
+            self.search_radius = self.max_radius * 2
+
+    def freeze(self):
+        self.tree = KDTree(self._positions)
+
+    @property
+    def positions(self):
+        return self._positions.copy()
+
+    def find_colliding_pairs(self, particles=None):
+        """
+        Return an (N, 2) array of the indices of each pair of colliding particles.
+
+        :param particles: Only look for the collisions of these particles.
+        :type particles: :class:`numpy.ndarray`
+        """
+        n = len(self._positions)
+        if not n:
+            return np.empty((0, 2), dtype=int)
+        tree = cKDTree(self._positions)
+        if particles is None or len(particles) > n // 4:
+            pairs = tree.query_pairs(self.search_radius, output_type="ndarray")
+        else:
+            particles = np.asarray(particles, dtype=int)
+            neighbours = tree.query_ball_point(
+                self._positions[particles], self.search_radius
+            )
+            counts = np.fromiter(map(len, neighbours), dtype=int, count=len(particles))
+            a = np.repeat(particles, counts)
+            b = np.fromiter(chain.from_iterable(neighbours), dtype=int, count=len(a))
+            # Store each pair once, with the lowest index first.
+            keys = np.unique(np.minimum(a, b) * n + np.maximum(a, b))
+            pairs = np.column_stack((keys // n, keys % n))
+            pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        offsets = self._positions[pairs[:, 0]] - self._positions[pairs[:, 1]]
+        collision_radii = self.radii[pairs[:, 0]] + self.radii[pairs[:, 1]]
+        colliding = np.sum(offsets ** 2, axis=1) <= collision_radii ** 2
+        return pairs[colliding]
+
+    def find_colliding_particles(self, freeze=False):
+        pairs = self.find_colliding_pairs()
+        self.colliding[:] = False
+        self.colliding[pairs.ravel()] = True
+        self.colliding_particles = np.nonzero(self.colliding)[0]
+        self.colliding_count = len(self.colliding_particles)
+        return self.colliding_particles
+
+    def solve_collisions(self, particles=None):
+        """
+        Move the colliding particles apart until none of them collide.
 
-        super().solve_collisions()
+        :param particles: Only solve the collisions of these particles, and of the
+          particles that they run into.
+        :type particles: :class:`numpy.ndarray`
+        """
+        pairs = self.find_colliding_pairs(particles)
+        displaced = np.zeros(len(self._positions), dtype=bool)
+        iterations = 0
+        while len(pairs):
+            iterations += 1
+            if iterations > self.max_iterations:
+                warn(
+                    "Could not untangle {} collisions in {} iterations.".format(
+                        len(pairs), self.max_iterations
+                    ),
+                    PlacementWarning,
+                )
+                break
+            report("Untangling {} collisions".format(len(pairs)), level=2)
+            displaced[pairs.ravel()] = True
+            displacements = self.get_displacements(pairs)
+            self._positions += displacements
+            # Only the particles that moved can have run into new collisions.
+            moved = np.nonzero(np.any(displacements != 0, axis=1))[0]
+            pairs = self.find_colliding_pairs(moved)
+        self.find_colliding_particles()
+        self.displaced_particles = np.nonzero(displaced)[0]
+
+    def get_displacements(self, pairs):
+        """
+        Sum up the repulsion of each pair of colliding particles.
+
+        :param pairs: (N, 2) array of the indices of colliding particles.
+        :returns: Displacement of each particle in the system.
+        :rtype: :class:`numpy.ndarray`
+        """
+        a, b = pairs[:, 0], pairs[:, 1]
+        offsets = self._positions[a] - self._positions[b]
+        distances = np.sqrt(np.sum(offsets ** 2, axis=1))
+        collision_radii = self.radii[a] + self.radii[b]
+        overlapping = distances == 0
+        # Particles on the same spot are pushed apart in a random direction.
+        offsets[overlapping] = (
+            self.random_state.rand(np.count_nonzero(overlapping), self.dimensions) - 0.5
+        )
+        distances[overlapping] = np.sqrt(np.sum(offsets[overlapping] ** 2, axis=1))
+        force = np.where(
+            overlapping, 0.9, np.minimum(0.9, 0.3 / ((distances / collision_radii) ** 2))
+        )
+        volumes = sphere_volume(self.radii)
+        inertia = volumes[b] / (volumes[a] + volumes[b])
+        push = (
+            offsets / distances[:, np.newaxis] * (force * collision_radii)[:, np.newaxis]
+        )
+        displacements = np.empty(self._positions.shape)
+        n = len(self._positions)
+        for dim in range(self.dimensions):
+            displacements[:, dim] = np.bincount(
+                a, weights=push[:, dim] * inertia, minlength=n
+            ) - np.bincount(b, weights=push[:, dim] * (1 - inertia), minlength=n)
+        return displacements
+
+    def remove_particles(self, particles_id):
+        keep = np.ones(len(self._positions), dtype=bool)
+        keep[np.asarray(particles_id, dtype=int)] = False
+        self._positions = self._positions[keep]
+        self.radii = self.radii[keep]
+        self.types = self.types[keep]
+        self.colliding = self.colliding[keep]
+
+    def prune(self, at_risk_particles=None, voxels=None):
+        """
+        Remove particles that have been moved outside of the bounds of the voxels.
+
+        :param at_risk_particles: Indices of the particles that might've been moved, if
+          omitted check all particles.
+        :type at_risk_particles: :class:`numpy.ndarray`
+        :param voxels: A subset of the voxels that the particles have to be in bounds
+          of, if omitted all voxels are used.
+        """
+        if at_risk_particles is None:
+            at_risk_particles = np.arange(len(self._positions))
+        if voxels is None:
+            voxels = self.voxels
+        at_risk_particles = np.asarray(at_risk_particles, dtype=int)
+        positions = self._positions[at_risk_particles]
+        in_bounds = np.zeros(len(positions), dtype=bool)
+        for voxel in voxels:
+            in_bounds |= np.all(
+                (positions >= voxel.origin) & (positions <= voxel.origin + voxel.size),
+                axis=1,
+            )
+        out_of_bounds_ids = at_risk_particles[~in_bounds]
+        type_ids, type_counts = np.unique(
+            self.types[out_of_bounds_ids], return_counts=True
+        )
+        number_pruned_per_type = {
+            self.particle_types[t]["name"]: int(c) for t, c in zip(type_ids, type_counts)
+        }
+        self.remove_particles(out_of_bounds_ids)
+        return len(out_of_bounds_ids), number_pruned_per_type
+
+
+class LargeParticleSystem(ArrayParticleSystem):
+    """
+    Particle system that splits its volume into tiles and solves the collisions of
+    each tile in a pool of worker processes. Each tile also contains the particles
+    in a halo around it, so that the particles near its edges are pushed away from
+    their neighbours in the other tiles. The remaining collisions in the seams
+    between the tiles are solved on the whole system afterwards.
+
+    :param tile_size: Approximate edge length of the tiles.
+    :type tile_size: float
+    :param workers: Number of worker processes, defaults to the number of CPUs.
+    :type workers: int
+    """
+
+    def __init__(
+        self, track_displaced=False, scaffold=None, tile_size=100.0, workers=None
+    ):
+        super().__init__(track_displaced=track_displaced, scaffold=scaffold)
+        self.tile_size = tile_size
+        self.workers = workers
+
+    def get_tiles(self):
+        """
+        Divide the bounding box of the voxels into tiles of about ``tile_size``.
+
+        :returns: The indices of the particles in each tile, the indices of the
+          particles in the halo around each tile and the lower and upper corner of each
+          tile.
+        :rtype: list of tuples of :class:`numpy.ndarray`
+        """
+        low = np.min([v.origin for v in self.voxels], axis=0)
+        high = np.max([v.origin + v.size for v in self.voxels], axis=0)
+        shape = np.maximum(np.ceil((high - low) / self.tile_size), 1).astype(int)
+        tile_size = (high - low) / shape
+        # Particles outside of the voxels are added to the nearest tile.
+        tile_coords = np.clip(
+            np.floor((self._positions - low) / tile_size).astype(int), 0, shape - 1
+        )
+        tile_ids = np.ravel_multi_index(tile_coords.T, shape)
+        order = np.argsort(tile_ids, kind="stable")
+        bounds = np.searchsorted(tile_ids[order], np.arange(np.prod(shape) + 1))
+        halo = self.search_radius * 2
+        tiles = []
+        for tile_id, coords in enumerate(np.ndindex(*shape)):
+            core = order[bounds[tile_id] : bounds[tile_id + 1]]
+            if not len(core):
+                continue
+            tile_low = low + np.array(coords) * tile_size
+            tile_high = tile_low + tile_size
+            in_halo = np.all(
+                (self._positions >= tile_low - halo)
+                & (self._positions <= tile_high + halo),
+                axis=1,
+            )
+            in_halo[core] = False
+            tiles.append((core, np.nonzero(in_halo)[0], tile_low, tile_high))
+        return tiles
+
+    def solve_collisions(self):
+        if not len(self._positions):
+            self.displaced_particles = np.empty(0, dtype=int)
+            return
+        tiles = self.get_tiles()
+        # Seed each tile from the global random state so that the result does not
+        # depend on which worker solves which tile.
+        seeds = np.random.randint(np.iinfo(np.int32).max, size=len(tiles))
+        jobs = []
+        for (core, halo, _, _), seed in zip(tiles, seeds):
+            ids = np.concatenate((core, halo))
+            jobs.append((self._positions[ids], self.radii[ids], len(core), seed))
+        workers = self.workers or os.cpu_count() or 1
+        if workers > 1 and len(jobs) > 1:
+            report("Solving {} tiles on {} workers".format(len(jobs), workers), level=2)
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                results = list(pool.map(_solve_tile, jobs))
+        else:
+            results = list(map(_solve_tile, jobs))
+        displaced = np.zeros(len(self._positions), dtype=bool)
+        seam = np.zeros(len(self._positions), dtype=bool)
+        for (core, _, low, high), (positions, tile_displaced) in zip(tiles, results):
+            self._positions[core] = positions
+            displaced[core[tile_displaced]] = True
+            # The collisions within a tile are solved, so of each pair of particles
+            # that collide across tiles at least one is near the edge of its tile.
+            seam[core] = np.any(
+                (positions < low + self.search_radius)
+                | (positions > high - self.search_radius),
+                axis=1,
+            )
+        super().solve_collisions(np.nonzero(seam)[0])
+        displaced[self.displaced_particles] = True
+        self.displaced_particles = np.nonzero(displaced)[0]
+
+
+def _solve_tile(job):
+    # Solve the collisions of a tile and return the positions of its own particles,
+    # without its halo, and which of them were displaced.
+    positions, radii, core_count, seed = job
+    system = ArrayParticleSystem()
+    system.set_particles(positions, radii)
+    system.random_state = np.random.RandomState(seed)
+    system.solve_collisions()
+    displaced = system.displaced_particles
+    return system.positions[:core_count], displaced[displaced < core_count]
 
 
 def plot_particle_system(system):
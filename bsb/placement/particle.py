@@ -1,5 +1,5 @@
 from .strategy import Layered, PlacementStrategy
-from ..particles import ParticleSystem
+from ..particles import ParticleSystem, ArrayParticleSystem, LargeParticleSystem
 from ..exceptions import *
 from ..reporting import report, warn
 
@@ -9,13 +9,45 @@ class ParticlePlacement(Layered, PlacementStrategy):
     casts = {
         "prune": bool,
         "bounded": bool,
+        "backend": str,
+        "tile_size": float,
+        "workers": int,
     }
 
     defaults = {
         "prune": True,
         "bounded": False,
+        "backend": "object",
+        "tile_size": 100.0,
+        "workers": None,
     }
 
+    backends = {
+        "object": ParticleSystem,
+        "array": ArrayParticleSystem,
+        "tiled": LargeParticleSystem,
+    }
+
+    def validate(self):
+        super().validate()
+        if self.backend not in self.backends:
+            raise ConfigurationError(
+                "Unknown particle system backend '{}' in {}, choose from: {}".format(
+                    self.backend, self.name, ", ".join(self.backends)
+                )
+            )
+
+    def get_particle_system(self):
+        backend = self.backends[self.backend]
+        if backend is LargeParticleSystem:
+            return backend(
+                track_displaced=True,
+                scaffold=self.scaffold,
+                tile_size=self.tile_size,
+                workers=self.workers,
+            )
+        return backend(track_displaced=True, scaffold=self.scaffold)
+
     def place(self):
         cell_type = self.cell_type
         layer = self.layer_instance
@@ -36,10 +68,11 @@ class ParticlePlacement(Layered, PlacementStrategy):
             }
         ]
         # Create and fill the particle system.
-        system = ParticleSystem(track_displaced=True, scaffold=self.scaffold)
+        system = self.get_particle_system()
         system.fill(voxels, particles)
+        particle_positions = system.positions
         # Raise a warning if no cells could be placed in the volume
-        if len(system.particles) == 0:
+        if len(particle_positions) == 0:
             warn(
                 "Did not place any {} cell in the {}!".format(cell_type.name, layer.name),
                 PlacementWarning,
@@ -61,5 +94,5 @@ class ParticlePlacement(Layered, PlacementStrategy):
                         int((number_pruned / self.get_placement_count()) * 100),
                     )
                 )
-        particle_positions = system.positions
+            particle_positions = system.positions
         self.scaffold.place_cells(cell_type, layer, particle_positions)
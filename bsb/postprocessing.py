@@ -263,8 +263,9 @@ class SpoofDetails(PostProcessingHook):
         morphologies = np.column_stack((_from, _to))
         # Generate the map
         morpho_map = [from_morphologies[0], to_morphologies[0]]
-        from_m = self.scaffold.morphology_repository.get_morphology(from_morphologies[0])
-        to_m = self.scaffold.morphology_repository.get_morphology(to_morphologies[0])
+        mr = self.scaffold.morphology_repository
+        from_m = mr.get_cached_morphology(from_morphologies[0])
+        to_m = mr.get_cached_morphology(to_morphologies[0])
         # Select random axons and dendrites to connect
         axons = np.array(from_m.get_compartment_submask(["axon"]))
         dendrites = np.array(from_m.get_compartment_submask(["dendrites"]))
@@ -314,8 +315,12 @@ class MissingAxon(PostProcessingHook):
                                 ConnectivityWarning,
                             )
                             continue
-                        compartment_matrix = self.scaffold.connection_compartments[tag]
+                        compartment_matrix = self.scaffold.connection_compartments[
+                            tag
+                        ].copy()
                         compartment_matrix[:, 0] = np.zeros(len(compartment_matrix))
+                        # Reassign the matrix so that the output picks up the change.
+                        self.scaffold.connection_compartments[tag] = compartment_matrix
 
 
 class BidirectionalContact(PostProcessingHook):
@@ -1016,22 +1016,26 @@ class SpikeRecorder(SimulationRecorder):
         files = glob("*" + self.device_model.parameters["label"] + "*.gdf")
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            spikes = np.zeros((0, 2), dtype=float)
+            spikes = [np.zeros((0, 2), dtype=float)]
             for file in files:
                 file_spikes = np.loadtxt(file)
                 if len(file_spikes):
                     scaffold_ids = np.array(
                         self.device_model.adapter.get_scaffold_ids(file_spikes[:, 0])
                     )
-                    self.cell_types = list(
-                        set(
-                            self.device_model.adapter.scaffold.get_gid_types(scaffold_ids)
-                        )
-                    )
                     times = file_spikes[:, 1]
-                    scaffold_spikes = np.column_stack((scaffold_ids, times))
-                    spikes = np.concatenate((spikes, scaffold_spikes))
+                    spikes.append(np.column_stack((scaffold_ids, times)))
                 os.remove(file)
+        spikes = np.concatenate(spikes)
+        if len(spikes):
+            # Look up the cell types of the unique gids that spiked, in a single pass.
+            self.cell_types = list(
+                set(
+                    self.device_model.adapter.scaffold.get_gid_types(
+                        np.unique(spikes[:, 0])
+                    )
+                )
+            )
         return spikes
 
     def get_meta(self):
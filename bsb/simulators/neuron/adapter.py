@@ -7,7 +7,7 @@ from ...simulation import (
     SimulationResult,
     SimulationRecorder,
 )
-from ...helpers import get_configurable_class
+from ...helpers import get_configurable_class, ContinuityIndex
 from ...reporting import report, warn
 from ...models import ConnectivitySet
 from ...exceptions import *
@@ -425,15 +425,15 @@ class NeuronAdapter(SimulatorAdapter):
         alloc = np.empty((total, 2), dtype=int)
         ptr = 0
         for connectivity_set in sets:
-            # Get the connectivity set's intersection and slice them into the array.
-            inter = connectivity_set.intersections
-            if not len(inter):
+            # Get the presynaptic cells and sections of the connectivity set's
+            # intersections and slice them into the array.
+            n = len(connectivity_set)
+            if not n:
                 continue
-            alloc[ptr : (ptr + len(inter))] = [
-                (i.from_id, i.from_compartment.section_id) for i in inter
-            ]
+            alloc[ptr : (ptr + n), 0] = connectivity_set.from_identifiers
+            alloc[ptr : (ptr + n), 1] = connectivity_set.get_sections()[:, 0]
             # Move up the pointer for the next slice.
-            ptr += len(inter)
+            ptr += n
         unique_transmitters = np.unique(alloc, axis=0)
         self.transmitter_map = dict(zip(map(tuple, unique_transmitters), range(total)))
         tcount = 0
@@ -458,12 +458,13 @@ class NeuronAdapter(SimulatorAdapter):
                 continue
             source = connection_model.source
             set = self._model_to_set(connection_model)
-            for inter in set.intersections:
-                cell_id = inter.from_id
+            sections = set.get_sections()[:, 0]
+            for cell_id, section_id in zip(
+                set.from_identifiers.tolist(), sections.tolist()
+            ):
                 if cell_id not in self.node_cells:
                     continue
                 cell = self.cells[cell_id]
-                section_id = inter.from_compartment.section_id
                 section = cell.sections[section_id]
                 gid = self.transmitter_map[(cell_id, section_id)]
                 cell.create_transmitter(cell.sections[section_id], gid, source)
@@ -500,17 +501,13 @@ class NeuronAdapter(SimulatorAdapter):
                 # .get_locations() should offer some insights
             else:
                 synapse_types = connection_model.resolve_synapses()
-                for intersection in connectivity_set.intersections:
-                    if intersection.to_id in self.node_cells:
-                        cell = self.cells[int(intersection.to_id)]
-                        section_id = int(intersection.to_compartment.section_id)
-                        section = cell.sections[section_id]
-                        gid = self.transmitter_map[
-                            (
-                                intersection.from_id,
-                                intersection.from_compartment.section_id,
-                            )
-                        ]
+                cells = connectivity_set.get_connections().tolist()
+                sections = connectivity_set.get_sections().tolist()
+                for (from_id, to_id), (from_section, to_section) in zip(cells, sections):
+                    if to_id in self.node_cells:
+                        cell = self.cells[to_id]
+                        section = cell.sections[to_section]
+                        gid = self.transmitter_map[(from_id, from_section)]
                         for synapse_type in synapse_types:
                             try:
                                 cell.create_receiver(section, gid, synapse_type)
@@ -586,19 +583,14 @@ class NeuronAdapter(SimulatorAdapter):
         intermediate_relays = {}
         output_handler = self.scaffold.output_formatter
         cell_types = self.scaffold.get_cell_types()
-        type_lookup = {
-            ct.name: range(min(ids), max(ids) + 1)
-            for ct, ids in zip(
-                cell_types, (ct.get_placement_set().identifiers for ct in cell_types)
-            )
-        }
+        type_index = ContinuityIndex(
+            ct.get_placement_set().identifier_set.get_dataset() for ct in cell_types
+        )
+        # Gids without a cell type are looked up at index -1 and map onto `None`.
+        type_names = np.array([ct.name for ct in cell_types] + [None], dtype=object)
 
         def lookup(i):
-            for n, t in type_lookup.items():
-                if i in t:
-                    return n
-            else:
-                return None
+            return type_names[type_index.lookup(i)]
 
         for connection_model in self.connection_models.values():
             name = connection_model.name
@@ -619,8 +611,8 @@ class NeuronAdapter(SimulatorAdapter):
                     level=3,
                 )
                 bin = intermediate_relays
-                connections = connectivity_set.connections
-                target = lambda c: c.to_id
+                cells = connectivity_set.get_connections()
+                targets = cells[:, 1].tolist()
             else:
                 report(
                     "Adding",
@@ -630,18 +622,17 @@ class NeuronAdapter(SimulatorAdapter):
                     level=3,
                 )
                 bin = terminal_relays
-                connections = connectivity_set.intersections
-                target = lambda c: (
-                    c.to_id,
-                    c.to_compartment.section_id,
-                    connection_model,
-                )
+                cells = connectivity_set.get_connections()
+                sections = connectivity_set.get_sections()[:, 1]
+                targets = [
+                    (to_id, section_id, connection_model)
+                    for to_id, section_id in zip(cells[:, 1].tolist(), sections.tolist())
+                ]
             for id in self.scaffold.get_placement_set(from_cell_type.name).identifiers:
                 if id not in bin:
                     bin[id] = []
-            for connection in connections:
-                fid = connection.from_id
-                bin[fid].append(target(connection))
+            for fid, target in zip(cells[:, 0].tolist(), targets):
+                bin[fid].append(target)
 
         report("Relays indexed, resolving intermediates.")
 
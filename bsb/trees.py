@@ -1,5 +1,6 @@
 from sklearn.neighbors import KDTree
 import re, abc, numpy as np
+from .exceptions import *
 
 TREE_NAME_REGEX = re.compile(r"^[^\:\+\(\)]+$")
 
@@ -13,6 +14,60 @@ def is_valid_tree_name(name):
     return not not TREE_NAME_REGEX.match(name)
 
 
+class LazyTree:
+    """
+    KDTree that is built from its points on first use. Queries and other attributes of
+    the KDTree are forwarded to the built tree, while the points are available as
+    ``data`` without building it. Stored trees are loaded as lazy trees whose points
+    are read on first use, so that only the trees that are used are read and built.
+
+    :param points: (N, D) array of the points, or a function that returns them.
+    :param leaf_size: Leaf size of the KDTree.
+    """
+
+    def __init__(self, points, leaf_size=40):
+        if callable(points):
+            self._points, self._loader = None, points
+        else:
+            self._points, self._loader = np.asarray(points), None
+        self.leaf_size = leaf_size
+        self._tree = None
+
+    @property
+    def data(self):
+        """
+        (N, D) array of the points of the tree.
+        """
+        if self._points is None:
+            self._points = np.asarray(self._loader())
+            self._loader = None
+        return self._points
+
+    @property
+    def tree(self):
+        """
+        The KDTree of the points, built on first access.
+        """
+        if self._tree is None:
+            self._tree = KDTree(self.data, leaf_size=self.leaf_size)
+        return self._tree
+
+    @property
+    def is_loaded(self):
+        return self._points is not None
+
+    def __getattr__(self, attr):
+        # Forward the KDTree's public attributes to the KDTree. Other attributes are not
+        # forwarded, so that looking them up doesn't build the tree, and so that private
+        # attributes raise when they're looked up before `__init__` ran.
+        if attr.startswith("_") or not hasattr(KDTree, attr):
+            raise AttributeError(attr)
+        return getattr(self.tree, attr)
+
+    def __reduce__(self):
+        return (self.__class__, (self.data, self.leaf_size))
+
+
 class TreeCollection:
     """
     Keeps track of a collection of KDTrees in cooperation with a TreeHandler.
@@ -34,7 +89,7 @@ class TreeCollection:
             raise TreeError("Tree names must not contain any : or + signs.")
         if len(nodes) == 0:
             return
-        self.add_tree(name, KDTree(nodes))
+        self.add_tree(name, LazyTree(nodes))
 
     def add_tree(self, name, tree):
         self.trees[name] = tree
@@ -87,7 +142,7 @@ class TreeCollection:
             raise TreeError("Cannot make planar tree from unknown tree '{}'".format(name))
         dimensions = ["x", "y", "z"]
         selected_dimensions = [e in plane for e in dimensions]
-        planar_tree = KDTree(np.array(full_tree.get_arrays()[0])[:, selected_dimensions])
+        planar_tree = LazyTree(np.asarray(full_tree.data)[:, selected_dimensions])
         self.trees["{}:{}".format(plane, name)] = planar_tree
         self.save()
         return planar_tree
@@ -105,11 +160,20 @@ class TreeCollection:
             def closure(node):
                 return set_filter(subset, node)
 
-            data = np.array(list(filter(closure, full_tree.get_arrays()[0])))
-        sub_tree = KDTree(data)
+            data = np.array(list(filter(closure, np.asarray(full_tree.data))))
+        sub_tree = LazyTree(data)
         self.trees["{}({})".format(name, subset)] = sub_tree
         self.save()
         return sub_tree
 
+    def load_all(self):
+        """
+        Read the points of all the lazily loaded trees of the collection, so that they
+        no longer depend on the stored resource.
+        """
+        for tree in self.trees.values():
+            if isinstance(tree, LazyTree):
+                tree.data
+
     def save(self):
         self.handler.store_tree_collections([self])
@@ -1,30 +1,39 @@
 from bsb.helpers import dimensions, origin
 import numpy as np
+import itertools
 from scipy import ndimage
 from time import sleep
 from sklearn.neighbors import KDTree
 from .functions import get_distances
 
+# Relative margin on the sweep of the box intersections, the exact criterion is applied
+# to the candidates afterwards.
+_MARGIN = 1e-9
+
 
 class VoxelCloud:
     def __init__(self, bounds, voxels, grid_size, map, occupancies=None):
-        from rtree import index
-
         self.bounds = bounds
         self.grid_size = grid_size
         self.voxels = voxels
         self.voxel_cache = None
         self.map = map
         self.occupancies = occupancies
-        p = index.Property(dimension=3)
-        voxel_tree = index.Index(properties=p)
-        voxel_positions = self.get_voxels()
-        # Add each voxel box to an Rtree index
-        for v, voxel_position in enumerate(voxel_positions):
-            av = np.add(voxel_position, grid_size)
-            bv = np.concatenate((voxel_position, av))
-            voxel_tree.insert(v, tuple(bv))
-        self.tree = voxel_tree
+        self._build_tree()
+
+    def __getstate__(self):
+        # Rtree indices can't be pickled, rebuild the tree after unpickling instead.
+        state = self.__dict__.copy()
+        del state["tree"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_tree()
+
+    def _build_tree(self):
+        # Bulk load each voxel box into an Rtree index
+        self.tree = box_index(self.get_voxel_boxes())
 
     def get_boxes(self):
         return m_grid(self.bounds, self.grid_size)
@@ -58,25 +67,18 @@ class VoxelCloud:
 
     @staticmethod
     def create(morphology, N, compartments=None):
-        from rtree import index
-        from rtree.index import Rtree
-
-        p = index.Property(dimension=3)
-        tree = index.Index(properties=p)
         if compartments is None:
-            compartments = morphology.compartments
-        N = min(len(compartments), N)
-        for compartment in compartments:
-            tree.insert(
-                int(compartment.id), tuple([*compartment.midpoint, *compartment.midpoint])
-            )
-        hit_detector = HitDetector.for_rtree(tree)
+            arrays = morphology.compartment_arrays
+            points, ids = arrays.midpoints, arrays.ids
+        else:
+            points = [compartment.midpoint for compartment in compartments]
+            ids = [int(compartment.id) for compartment in compartments]
+        N = min(len(ids), N)
+        hit_detector = HitDetector.for_points(points, ids=ids)
         bounds, voxels, length, error = voxelize(
             N, morphology.get_bounding_box(compartments=compartments), hit_detector
         )
-        voxel_map = morphology.create_compartment_map(
-            tree, m_grid(bounds, length), voxels, length
-        )
+        voxel_map = hit_detector.map_voxels(bounds, length, voxels)
         if error == 0:
             return VoxelCloud(bounds, voxels, length, voxel_map)
         else:
@@ -88,8 +90,29 @@ class VoxelCloud:
                 )
             )
 
-    def intersect(self, other):
-        raise NotImplementedError("Intersecting 2 voxel clouds is a to do")
+    def get_voxel_boxes(self, translation=None):
+        """
+        Return an (N, 6) array with the lower and upper corner of each voxel, optionally
+        translated.
+        """
+        lower = self.get_voxels(cache=True)
+        if translation is not None:
+            lower = np.add(lower, translation)
+        return np.column_stack((lower, np.add(lower, self.grid_size)))
+
+    def intersect(self, other, translation=None):
+        """
+        Find the pairs of intersecting voxels between this and another voxel cloud.
+        Voxels that touch each other intersect.
+
+        :param other: The other voxel cloud.
+        :type other: :class:`.VoxelCloud`
+        :param translation: Position of the other cloud relative to this cloud.
+        :returns: The voxel indices of the other cloud and the voxel indices of this
+          cloud of each intersecting pair, sorted by the other and then this voxel.
+        :rtype: tuple
+        """
+        return intersect_boxes(self.get_voxel_boxes(), other.get_voxel_boxes(translation))
 
     def get_voxel_box(self):
         """
@@ -141,6 +164,86 @@ class Box(dimensions, origin):
         )
 
 
+def intersect_boxes(boxes, queries):
+    """
+    Find the boxes that intersect with each query box by sweeping along the x axis and
+    pruning on the other axes. Boxes that touch each other intersect.
+
+    :param boxes: (N, 6) array with the lower and upper corners of the boxes.
+    :param queries: (M, 6) array with the lower and upper corners of the query boxes.
+    :returns: The query index and box index of each intersecting pair, sorted by query
+      and then box index.
+    :rtype: tuple
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 6)
+    queries = np.asarray(queries, dtype=float).reshape(-1, 6)
+    if not len(boxes) or not len(queries):
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    order = np.argsort(boxes[:, 0], kind="stable")
+    sorted_lower = boxes[order, 0]
+    # Boxes that start after the end of a query box can't intersect it, and boxes that
+    # start further before it than the widest box can't reach it. The margin keeps
+    # rounding errors out of the sweep, the exact criterion is applied afterwards.
+    width = np.max(boxes[:, 3] - boxes[:, 0])
+    margin = _MARGIN * (width + np.abs(queries[:, 0]))
+    start = np.searchsorted(sorted_lower, queries[:, 0] - width - margin, side="left")
+    end = np.searchsorted(sorted_lower, queries[:, 3], side="right")
+    counts = np.maximum(end - start, 0)
+    rows = np.repeat(np.arange(len(queries)), counts)
+    offsets = np.repeat(start - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    candidates = order[np.arange(len(rows)) + offsets]
+    hit = np.all(
+        (boxes[candidates, :3] <= queries[rows, 3:])
+        & (queries[rows, :3] <= boxes[candidates, 3:]),
+        axis=1,
+    )
+    rows, candidates = rows[hit], candidates[hit]
+    # The candidates of each query are sorted on their lower bound, sort them by index.
+    sort = np.lexsort((candidates, rows))
+    return rows[sort], candidates[sort]
+
+
+def box_index(boxes, ids=None):
+    """
+    Bulk load boxes into an Rtree index. Bulk loading builds a packed and balanced
+    tree, much faster than inserting the boxes one by one.
+
+    :param boxes: (N, 6) array with the lower and upper corners of the boxes.
+    :param ids: Id of each box, by default the index of the box.
+    :rtype: :class:`rtree.index.Index`
+    """
+    from rtree import index
+
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 6)
+    properties = index.Property(dimension=3)
+    if not len(boxes):
+        # Rtree can't bulk load an empty stream.
+        return index.Index(properties=properties)
+    if ids is None:
+        ids = range(len(boxes))
+    stream = ((int(id), tuple(box), None) for id, box in zip(ids, boxes.tolist()))
+    return index.Index(stream, properties=properties)
+
+
+def group_pairs(rows, indices, n):
+    """
+    Group sorted pairs of row and index into a list that contains, for each of the
+    ``n`` rows, a list of its indices.
+    """
+    splits = np.searchsorted(rows, np.arange(1, n))
+    return [group.tolist() for group in np.split(np.asarray(indices), splits)]
+
+
+def tree_boxes(tree):
+    """
+    Return the ids and an (N, 6) array of the boxes of all the entries of an Rtree
+    index, sorted by id.
+    """
+    entries = sorted(tree.intersection(tree.bounds, objects=True), key=lambda e: e.id)
+    ids = np.fromiter((entry.id for entry in entries), dtype=int, count=len(entries))
+    return ids, np.array([entry.bbox for entry in entries], dtype=float).reshape(-1, 6)
+
+
 def m_grid(bounds, size):
     return np.mgrid[
         bounds[0, 0] : bounds[0, 1] : size,
@@ -151,6 +254,9 @@ def m_grid(bounds, size):
 
 def voxelize(N, box_data, hit_detector, max_iterations=80, precision_iterations=30):
     # Initialise
+    if not isinstance(hit_detector, HitDetector):
+        # Wrap custom detector functions to check the boxes of the grid one by one.
+        hit_detector = HitDetector(hit_detector)
     bounds = box_data.bounds()
     box_length = np.max(
         box_data.dimensions
@@ -172,25 +278,9 @@ def voxelize(N, box_data, hit_detector, max_iterations=80, precision_iterations=
             crossed_treshold
         ):  # Are we doing these iterations just to increase precision, or still trying to find a solution?
             precision_i += 1
-        box_count = 0  # Reset box count
-        boxes_x, boxes_y, boxes_z = m_grid(bounds, box_length)  # Create box counting grid
         # Create a voxel grid where voxels are switched on if they trigger the hit_detector
-        voxels = np.zeros(
-            (boxes_x.shape[0], boxes_x.shape[1], boxes_x.shape[2]), dtype=bool
-        )
-        # Iterate over all the boxes in the total grid.
-        for x_i in range(boxes_x.shape[0]):
-            for y_i in range(boxes_x.shape[1]):
-                for z_i in range(boxes_x.shape[2]):
-                    # Get the lower corner of the query box
-                    x = boxes_x[x_i, y_i, z_i]
-                    y = boxes_y[x_i, y_i, z_i]
-                    z = boxes_z[x_i, y_i, z_i]
-                    hit = hit_detector(
-                        np.array([x, y, z]), box_length
-                    )  # Is this box a hit? (Does it cover some part of the object?)
-                    voxels[x_i, y_i, z_i] = hit  # If its a hit, turn on the voxel
-                    box_count += int(hit)  # If its a hit, increase the box count
+        voxels = hit_detector.detect_grid(bounds, box_length)
+        box_count = np.count_nonzero(voxels)
         if last_box_count < N and box_count >= N:
             # We've crossed the treshold from overestimating to underestimating
             # the box_length. A solution is found, but more precise values lie somewhere in between,
@@ -327,6 +417,21 @@ class HitDetector:
     def __call__(self, position, size):
         return self.detector(position, size)
 
+    def detect_grid(self, bounds, box_size):
+        """
+        Check each box of a box counting grid for a hit.
+
+        :param bounds: Lower and upper bound of the grid along each axis.
+        :param box_size: Edge length of the boxes.
+        :returns: A boolean grid that is ``True`` for the boxes that are hit.
+        :rtype: :class:`numpy.ndarray`
+        """
+        boxes = m_grid(bounds, box_size)
+        voxels = np.zeros(boxes.shape[1:], dtype=bool)
+        for index in np.ndindex(*voxels.shape):
+            voxels[index] = self(boxes[(slice(None), *index)], box_size)
+        return voxels
+
     @classmethod
     def for_rtree(cls, tree):
         """
@@ -344,3 +449,101 @@ class HitDetector:
 
         # Return the tree detector function as the factory product
         return cls(tree_detector)
+
+    @staticmethod
+    def for_points(points, ids=None):
+        """
+        Factory function that creates a hit detector for a set of points.
+
+        :param points: (N, 3) array of points, such as compartment midpoints.
+        :param ids: Identifier of each point, defaults to their index.
+        :returns: A hit detector
+        :rtype: :class:`PointHitDetector`
+        """
+        return PointHitDetector(points, ids=ids)
+
+
+class PointHitDetector(HitDetector):
+    """
+    Hit detector that reports a hit for the boxes that contain any of a set of points.
+    It bins all the points into a box counting grid at once instead of querying each
+    box of the grid.
+    """
+
+    def __init__(self, points, ids=None):
+        self.points = np.array(points, dtype=float).reshape(len(points), -1)
+        if ids is None:
+            ids = np.arange(len(self.points))
+        self.ids = np.array(ids, dtype=int)
+        super().__init__(self._detect_box)
+
+    def _detect_box(self, box_origin, box_size):
+        return np.any(
+            np.all(
+                (self.points >= box_origin) & (self.points <= box_origin + box_size),
+                axis=1,
+            )
+        )
+
+    def get_hits(self, bounds, box_size):
+        """
+        Find the boxes of a box counting grid that contain each point. Like
+        :func:`detect_box_compartments` the boxes include their faces, so a point on
+        the face between boxes hits each of them.
+
+        :param bounds: Lower and upper bound of the grid along each axis.
+        :param box_size: Edge length of the boxes.
+        :returns: The index of the point and the flat grid index of the box of each
+          hit, and the shape of the grid.
+        :rtype: tuple
+        """
+        axes = [np.mgrid[lower:upper:box_size] for lower, upper in bounds]
+        shape = tuple(len(axis) for axis in axes)
+        # Along each axis a point falls in the box of its integer division, or on
+        # the face that it shares with one of the neighbouring boxes.
+        candidates, inside = [], []
+        for coords, axis in zip(self.points.T, axes):
+            bins = np.floor((coords - axis[0]) / box_size).astype(int)
+            bins = bins[:, np.newaxis] + np.arange(-1, 2)
+            valid = (bins >= 0) & (bins < len(axis))
+            bins = np.where(valid, bins, 0)
+            lower = axis[bins]
+            coords = coords[:, np.newaxis]
+            candidates.append(bins)
+            inside.append(valid & (coords >= lower) & (coords <= lower + box_size))
+        point_ids, box_ids = [], []
+        for offsets in itertools.product(range(3), repeat=len(axes)):
+            hit = np.logical_and.reduce([m[:, o] for m, o in zip(inside, offsets)])
+            hit_points = np.nonzero(hit)[0]
+            point_ids.append(hit_points)
+            box_ids.append(
+                np.ravel_multi_index(
+                    [c[hit_points, o] for c, o in zip(candidates, offsets)], shape
+                )
+            )
+        return np.concatenate(point_ids), np.concatenate(box_ids), shape
+
+    def detect_grid(self, bounds, box_size):
+        _, box_ids, shape = self.get_hits(bounds, box_size)
+        voxels = np.zeros(np.prod(shape), dtype=bool)
+        voxels[box_ids] = True
+        return voxels.reshape(shape)
+
+    def map_voxels(self, bounds, box_size, voxels):
+        """
+        List the sorted identifiers of the points in each voxel, with the voxels in
+        the order of ``m_grid(bounds, box_size)[:, voxels]``.
+
+        :param voxels: Boolean grid of the voxels to map.
+        :rtype: list of lists
+        """
+        point_ids, box_ids, shape = self.get_hits(bounds, box_size)
+        voxel_boxes = np.flatnonzero(voxels)
+        if not len(voxel_boxes):
+            return []
+        voxel_ids = np.searchsorted(voxel_boxes, box_ids)
+        in_voxel = voxel_boxes[np.minimum(voxel_ids, len(voxel_boxes) - 1)] == box_ids
+        voxel_ids, point_ids = voxel_ids[in_voxel], point_ids[in_voxel]
+        order = np.lexsort((self.ids[point_ids], voxel_ids))
+        splits = np.cumsum(np.bincount(voxel_ids, minlength=len(voxel_boxes)))[:-1]
+        return [ids.tolist() for ids in np.split(self.ids[point_ids[order]], splits)]
@@ -0,0 +1,46 @@
+"""
+Compare the particle system backends of the ParticlePlacement on granular layers of
+increasing size and density. The tiled backend uses a worker process per CPU.
+
+Run with ``python tests/profiling/particle_placement.py``
+"""
+
+import numpy as np
+import os, sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from bsb.particles import ParticleSystem, ArrayParticleSystem, LargeParticleSystem
+
+# Granule cell radius and the packing factors of a regular and a dense granular layer.
+radius = 2.5
+packing_factors = [0.35, 0.5]
+counts = [1000, 4000, 16000, 64000]
+# The object backend is too slow to run on the larger layers.
+backends = {
+    "object": (ParticleSystem, 4000),
+    "array": (ArrayParticleSystem, None),
+    "tiled": (LargeParticleSystem, None),
+}
+
+for packing_factor in packing_factors:
+    for count in counts:
+        side = (count * 4 / 3 * np.pi * radius ** 3 / packing_factor) ** (1 / 3)
+        voxels = [[[0.0, 0.0, 0.0], [side, side, side]]]
+        particles = [{"name": "granule", "voxels": [0], "radius": radius, "count": count}]
+        for name, (backend, max_count) in backends.items():
+            if max_count is not None and count > max_count:
+                continue
+            np.random.seed(0)
+            system = backend(track_displaced=True)
+            system.fill(voxels, particles)
+            start = time()
+            system.find_colliding_particles()
+            system.solve_collisions()
+            pruned, _ = system.prune(at_risk_particles=system.displaced_particles)
+            print(
+                "{:>6} backend, packing factor {}, {:>5} particles: {:.2f}s, {} pruned".format(
+                    name, packing_factor, count, time() - start, pruned
+                )
+            )
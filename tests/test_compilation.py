@@ -1,10 +1,12 @@
-import unittest, os, sys, numpy as np, h5py
+import unittest, os, sys, random, numpy as np, h5py
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 from bsb.core import Scaffold, from_hdf5
 from bsb.config import JSONConfig
 from bsb.models import Layer, CellType
 from bsb.placement import Satellite
+from bsb.morphologies import Morphology, Branch
+from bsb.output import MorphologyRepository
 from test_setup import get_test_network
 
 
@@ -13,6 +15,10 @@ def relative_to_tests_folder(path):
 
 
 single_neuron_config = relative_to_tests_folder("configs/test_single_neuron.json")
+heterosyn_config = relative_to_tests_folder(
+    "configs/test_double_neuron_network_heterosyn.json"
+)
+voxel_config = relative_to_tests_folder("configs/test_parallel_voxel_intersection.json")
 
 
 class TestSingleTypeCompilation(unittest.TestCase):
@@ -49,6 +55,74 @@ class TestSingleTypeCompilation(unittest.TestCase):
         self.assertEqual(scaffold_copy.get_cell_total(), 4)
         self.assertRaises(OSError, from_hdf5, "doesntexist")
 
+    def test_gid_types(self):
+        cell_type = self.scaffold.get_cell_type("test_cell")
+        ids = self.scaffold.get_placement_set("test_cell").identifiers
+        types = self.scaffold.get_gid_types(np.concatenate((ids, [ids.max() + 1, -1])))
+        self.assertEqual(list(types), [cell_type] * len(ids) + [None, None])
+        self.assertEqual(len(self.scaffold.get_gid_types([])), 0)
+
+    def test_incremental_output(self):
+        formatter = self.scaffold.output_formatter
+        cells = self.scaffold.cells_by_type["test_cell"]
+        with h5py.File(formatter.file, "a") as f:
+            f["morphologies"].attrs["marker"] = True
+        moved = cells.copy()
+        moved[:, 2:5] += 1
+        self.scaffold.cells_by_type["test_cell"] = moved
+        try:
+            self.scaffold.compile_output()
+            with h5py.File(formatter.file, "r") as f:
+                # The morphology repository should be left untouched
+                self.assertTrue(f["morphologies"].attrs["marker"])
+                positions = f["cells/placement/test_cell/positions"][()]
+                self.assertTrue(np.allclose(positions, moved[:, 2:5]))
+        finally:
+            self.scaffold.cells_by_type["test_cell"] = cells
+            self.scaffold.compile_output()
+        with h5py.File(formatter.file, "r") as f:
+            positions = f["cells/placement/test_cell/positions"][()]
+            self.assertTrue(np.allclose(positions, cells[:, 2:5]))
+
+
+class TestIncrementalOutput(unittest.TestCase):
+    """
+    Check that only the changed placement and connectivity sets are rewritten.
+    """
+
+    def setUp(self):
+        self.scaffold = Scaffold(JSONConfig(file=heterosyn_config))
+        self.scaffold.compile_network()
+
+    def tearDown(self):
+        os.remove(self.scaffold.output_formatter.file)
+
+    def test_unchanged_datasets(self):
+        unchanged = [
+            "cells/placement/from_cell/identifiers",
+            "cells/placement/from_cell/positions",
+            "cells/placement/teaching_cell/positions",
+            "cells/connections/from_cell_to_cell",
+            "cells/connections/teaching_cell_to_cell",
+        ]
+        changed = "cells/placement/to_cell/positions"
+        formatter = self.scaffold.output_formatter
+        with h5py.File(formatter.file, "a") as f:
+            offsets = {path: f[path].id.get_offset() for path in unchanged}
+            for path in unchanged + [changed]:
+                f[path].attrs["marker"] = True
+        moved = self.scaffold.cells_by_type["to_cell"].copy()
+        moved[:, 2:5] += 1
+        self.scaffold.cells_by_type["to_cell"] = moved
+        self.scaffold.compile_output()
+        with h5py.File(formatter.file, "r") as f:
+            for path in unchanged:
+                with self.subTest(dataset=path):
+                    self.assertIn("marker", f[path].attrs, "Unchanged dataset rewritten")
+                    self.assertEqual(offsets[path], f[path].id.get_offset())
+            self.assertNotIn("marker", f[changed].attrs, "Changed dataset not rewritten")
+            self.assertTrue(np.allclose(f[changed][()], moved[:, 2:5]))
+
 
 _using_morphologies = True
 
@@ -152,3 +226,177 @@ class TestPlacement(unittest.TestCase):
         self.assertAlmostEqual(
             overlapDend_whichPairs.shape[0] / 2, 0, delta=pcCount * 4 / 100
         )
+
+
+class TestNetworkCache(unittest.TestCase):
+    """
+    Check that the network cache accumulates data correctly.
+    """
+
+    @classmethod
+    def setUpClass(self):
+        super(TestNetworkCache, self).setUpClass()
+        config = JSONConfig(file=single_neuron_config)
+        self.scaffold = Scaffold(config)
+
+    def setUp(self):
+        self.scaffold.reset_network_cache()
+
+    def test_connect_cells_appends(self):
+        connection_type = type("FakeConnectionType", (), {"name": "fake", "tags": []})
+        chunks = [np.random.randint(0, 100, size=(n, 2)) for n in range(20)]
+        for chunk in chunks:
+            self.scaffold.connect_cells(connection_type, chunk)
+        self.scaffold._finalize_buffers()
+        connections = self.scaffold.cell_connections_by_tag["fake"]
+        self.assertTrue(np.array_equal(connections, np.concatenate(chunks)))
+        self.assertEqual(connection_type.tags, ["fake"])
+
+    def test_replaced_cache_array(self):
+        connection_type = type("FakeConnectionType", (), {"name": "fake", "tags": []})
+        self.scaffold.connect_cells(connection_type, np.ones((5, 2)))
+        # Replacing the array in the cache should discard the previous data.
+        self.scaffold.cell_connections_by_tag["fake"] = np.empty((0, 2))
+        self.scaffold.connect_cells(connection_type, np.zeros((3, 2)))
+        self.assertTrue(
+            np.array_equal(
+                self.scaffold.cell_connections_by_tag["fake"], np.zeros((3, 2))
+            )
+        )
+
+    def test_place_cells_appends(self):
+        cell_type = self.scaffold.get_cell_type("test_cell")
+        layer = cell_type.placement.layer_instance
+        positions = np.random.rand(10, 3)
+        rotations = np.random.rand(10, 2)
+        for i in range(0, 10, 3):
+            self.scaffold.place_cells(
+                cell_type, layer, positions[i : i + 3], rotations[i : i + 3]
+            )
+        cells = self.scaffold.cells_by_type["test_cell"]
+        self.assertEqual(cells.shape, (10, 5))
+        self.assertTrue(np.array_equal(cells[:, 2:5], positions))
+        self.assertTrue(np.array_equal(self.scaffold.rotations["test_cell"], rotations))
+        self.assertEqual(len(np.unique(cells[:, 0])), 10)
+
+
+class TestParallelConnectivity(unittest.TestCase):
+    """
+    Check that connecting in parallel gives the same results as connecting serially.
+    """
+
+    def compile(self, workers):
+        np.random.seed(0)
+        random.seed(0)
+        scaffold = Scaffold(JSONConfig(file=heterosyn_config))
+        scaffold.compile_network(workers=workers, seed=42)
+        return scaffold
+
+    def test_parallel_without_output(self):
+        np.random.seed(0)
+        random.seed(0)
+        scaffold = Scaffold(JSONConfig(file=heterosyn_config))
+        file = scaffold.output_formatter.file
+        if os.path.exists(file):
+            os.remove(file)
+        scaffold.compile_network(output=False, workers=2, seed=42)
+        self.assertFalse(os.path.exists(file), "Output written with output=False")
+        serial = self.compile(1)
+        try:
+            for tag, connections in serial.cell_connections_by_tag.items():
+                self.assertTrue(
+                    np.array_equal(connections, scaffold.cell_connections_by_tag[tag])
+                )
+        finally:
+            os.remove(serial.output_formatter.file)
+
+    def test_parallel_connect(self):
+        serial = self.compile(1)
+        parallel = self.compile(2)
+        try:
+            for name, connection_type in serial.configuration.connection_types.items():
+                with self.subTest(connection_type=name):
+                    parallel_type = parallel.get_connection_type(name)
+                    self.assertEqual(connection_type.tags, parallel_type.tags)
+                    for tag in connection_type.tags:
+                        connections = serial.cell_connections_by_tag[tag]
+                        self.assertGreater(len(connections), 0)
+                        self.assertTrue(
+                            np.array_equal(
+                                connections, parallel.cell_connections_by_tag[tag]
+                            )
+                        )
+        finally:
+            os.remove(parallel.output_formatter.file)
+
+
+def _labelled_morphology(seed):
+    # A soma with a random axon and dendrite branch.
+    random = np.random.RandomState(seed)
+    soma = Branch(*np.array([[0, 0], [0, 0], [0, 0], [5, 5]], dtype=float))
+    soma.label("soma")
+    for label in ("axon", "dendrites"):
+        branch = Branch(*(random.rand(4, 10) * [[40], [40], [40], [1]]))
+        branch.label(label)
+        soma.attach_child(branch)
+    return Morphology([soma])
+
+
+class TestParallelVoxelIntersection(unittest.TestCase):
+    """
+    Check that workers that voxelize morphologies don't write to the shared output file,
+    and that their voxel clouds are stored by the main process.
+    """
+
+    def setUp(self):
+        self.repository = MorphologyRepository("parallel_voxel_morphologies.hdf5")
+        with self.repository.load("w"):
+            self.repository.save_morphology("from_morphology", _labelled_morphology(0))
+            self.repository.save_morphology("to_morphology", _labelled_morphology(1))
+
+    def tearDown(self):
+        for file in (self.repository.file, "parallel_voxel_intersection_test.hdf5"):
+            if os.path.exists(file):
+                os.remove(file)
+
+    def compile(self, workers):
+        np.random.seed(0)
+        random.seed(0)
+        scaffold = Scaffold(JSONConfig(file=voxel_config))
+        scaffold.compile_network(workers=workers, seed=42)
+        return scaffold
+
+    def test_parallel_voxel_intersection(self):
+        serial = self.compile(1)
+        # The configured morphology repository is input and isn't written to.
+        self.assertFalse(
+            self.repository.voxel_cloud_exists("from_morphology", 20, ["axon"])
+        )
+        parallel = self.compile(2)
+        for name, connection_type in serial.configuration.connection_types.items():
+            with self.subTest(connection_type=name):
+                for tag in connection_type.tags:
+                    connections = serial.cell_connections_by_tag[tag]
+                    self.assertGreater(len(connections), 0)
+                    self.assertTrue(
+                        np.array_equal(connections, parallel.cell_connections_by_tag[tag])
+                    )
+                    self.assertTrue(
+                        np.array_equal(
+                            serial.connection_compartments[tag],
+                            parallel.connection_compartments[tag],
+                        )
+                    )
+                    serial_map = serial.connection_morphologies[tag + "_map"]
+                    parallel_map = parallel.connection_morphologies[tag + "_map"]
+                    self.assertEqual(
+                        np.array(serial_map)[
+                            serial.connection_morphologies[tag]
+                        ].tolist(),
+                        np.array(parallel_map)[
+                            parallel.connection_morphologies[tag]
+                        ].tolist(),
+                    )
+        output = parallel.output_formatter
+        self.assertTrue(output.voxel_cloud_exists("from_morphology", 20, ["axon"]))
+        self.assertTrue(output.voxel_cloud_exists("to_morphology", 20, ["dendrites"]))
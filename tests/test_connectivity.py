@@ -3,6 +3,16 @@ import unittest, os, sys, numpy as np, h5py, importlib
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 from bsb.core import Scaffold
 from bsb.models import Layer, CellType
+from bsb.connectivity.candidates import (
+    radius_candidates,
+    box_candidates,
+    slab_candidates,
+)
+from bsb.connectivity.connectome.gap_junctions import (
+    ConnectomeGapJunctions,
+    ConnectomeGapJunctionsGolgi,
+)
+from types import SimpleNamespace
 from test_setup import get_test_network
 
 
@@ -121,3 +131,138 @@ class TestConnectivity(unittest.TestCase):
                     _ = cs.divergence
                 with self.subTest(name="convergence"):
                     _ = cs.convergence
+
+
+class TestCandidates(unittest.TestCase):
+    """
+    Compare the spatial candidate queries to brute force searches.
+    """
+
+    def setUp(self):
+        self.points = np.random.rand(300, 3) * 100
+        self.queries = np.random.rand(40, 3) * 100
+
+    def assertCandidates(self, candidates, brute_force):
+        self.assertEqual(len(candidates), len(self.queries))
+        for found, mask in zip(candidates, brute_force):
+            self.assertTrue(np.array_equal(found, np.nonzero(mask)[0]))
+
+    def test_radius(self):
+        candidates = radius_candidates(self.points, self.queries, 15)
+        distances = np.linalg.norm(self.points - self.queries[:, None], axis=2)
+        self.assertCandidates(candidates, distances <= 15)
+        pairs = candidates.pairs()
+        self.assertEqual(len(pairs), np.count_nonzero(distances <= 15))
+        self.assertTrue(np.all(distances[pairs[:, 0], pairs[:, 1]] <= 15))
+
+    def test_box(self):
+        half_widths = np.array([10, 5, 20])
+        candidates = box_candidates(self.points, self.queries, half_widths, strict=True)
+        offsets = np.abs(self.points - self.queries[:, None])
+        self.assertCandidates(candidates, np.all(offsets < half_widths, axis=2))
+
+    def test_box_per_axis(self):
+        # Points on a grid lie exactly on the faces of the boxes.
+        points = np.random.randint(5, size=(300, 3)) * 5.0
+        queries = points[:40]
+        half_widths = np.array([10, 5, 0])
+        strict = [False, True, False]
+        candidates = box_candidates(points, queries, half_widths, strict=strict)
+        offsets = np.abs(points - queries[:, None])
+        inside = (offsets[..., 0] <= 10) & (offsets[..., 1] < 5) & (offsets[..., 2] == 0)
+        for found, mask in zip(candidates, inside):
+            self.assertTrue(np.array_equal(found, np.nonzero(mask)[0]))
+        self.assertRaises(ValueError, box_candidates, points, queries, [1, -1, 1])
+
+    def test_slab(self):
+        candidates = slab_candidates(self.points[:, 0], self.queries[:, 0], 7.5)
+        offsets = np.abs(self.points[:, 0] - self.queries[:, 0, None])
+        self.assertCandidates(candidates, offsets <= 7.5)
+
+    def test_empty(self):
+        candidates = radius_candidates(np.empty((0, 3)), self.queries, 15)
+        self.assertEqual(len(candidates), len(self.queries))
+        self.assertEqual(len(candidates.indices), 0)
+        candidates = slab_candidates(self.points[:, 0], [], 7.5)
+        self.assertEqual(len(candidates), 0)
+
+
+def _baseline_golgi_gap_junctions(golgicells, half_widths):
+    # The loop of `ConnectomeGapJunctionsGolgi` before it used candidate queries.
+    gj_goc = []
+    for self_index, i in enumerate(golgicells):
+        bool_vector = np.all(np.abs(golgicells[:, 2:5] - i[2:5]) <= half_widths, axis=1)
+        bool_vector[self_index] = False
+        for j in np.where(bool_vector)[0]:
+            gj_goc.append([i[0], golgicells[j, 0]])
+    return np.array(gj_goc).reshape(-1, 2)
+
+
+def _baseline_gap_junctions(cells, d_xy, d_z, dc_gj):
+    # The loop of `ConnectomeGapJunctions` before it used candidate queries.
+    gj_sc = []
+    for id, type, x, y, z in cells:
+        dz = np.abs(cells[:, 4] - z)
+        dxy = np.sqrt((cells[:, 2] - x) ** 2 + (cells[:, 3] - y) ** 2)
+        good_sc = np.where((dz < d_z) & (dz != 0) & (dxy < d_xy))[0]
+        idx = 1
+        for j in cells[np.random.permutation(good_sc)]:
+            if idx <= dc_gj:
+                ra = np.random.random()
+                if ra > abs(j[4] - z) / d_z and ra > np.hypot(j[2] - x, j[3] - y) / d_xy:
+                    idx += 1
+                    gj_sc.append([id, j[0]])
+    return np.array(gj_sc).reshape(-1, 2)
+
+
+class TestGapJunctions(unittest.TestCase):
+    """
+    Compare the gap junction connectomes to the loops they replaced, on a small fixed
+    population with cells on the edges of each other's boxes.
+    """
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        # Positions on a grid, so that some cells are exactly on the edge of the box
+        # around other cells, and two distinct cells at the same position.
+        positions = random.randint(6, size=(40, 3)) * 10.0
+        positions[1] = positions[0]
+        self.cells = np.column_stack((np.arange(100, 140), np.zeros(40), positions))
+
+    def connect(self, strategy, **attributes):
+        cell_type = SimpleNamespace(name="cell", **attributes)
+        connections = []
+        strategy.scaffold = SimpleNamespace(
+            cells_by_type={"cell": self.cells},
+            connect_cells=lambda strategy, result: connections.append(result),
+        )
+        strategy.from_cell_types = [cell_type]
+        strategy.connect()
+        return connections[0]
+
+    def test_golgi(self):
+        morphology = SimpleNamespace(dendrite_radius=5, axon_x=30, axon_y=10, axon_z=50)
+        result = self.connect(ConnectomeGapJunctionsGolgi(), morphology=morphology)
+        half_widths = np.array([20, 10, 30])
+        offsets = np.abs(self.cells[:, None, 2:5] - self.cells[None, :, 2:5])
+        in_box = np.all(offsets <= half_widths, axis=2)
+        np.fill_diagonal(in_box, False)
+        self.assertEqual(np.count_nonzero(in_box), len(result))
+        self.assertFalse(np.any(result[:, 0] == result[:, 1]), "Self connection")
+        # The two cells at the same position connect to each other.
+        self.assertIn([100, 101], result.tolist())
+        self.assertTrue(
+            np.array_equal(_baseline_golgi_gap_junctions(self.cells, half_widths), result)
+        )
+
+    def test_gap_junctions(self):
+        strategy = ConnectomeGapJunctions()
+        strategy.limit_xy, strategy.limit_z, strategy.divergence = 30.0, 20.0, 2
+        np.random.seed(0)
+        result = self.connect(strategy)
+        np.random.seed(0)
+        baseline = _baseline_gap_junctions(self.cells, 30.0, 20.0, 2)
+        self.assertGreater(len(result), 0)
+        self.assertTrue(np.array_equal(baseline, result))
+        self.assertFalse(np.any(result[:, 0] == result[:, 1]), "Self connection")
+        self.assertLessEqual(np.bincount(result[:, 0].astype(int)).max(), 2)
@@ -0,0 +1,189 @@
+import unittest, os, sys, numpy as np, h5py
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bsb.models import ConnectivitySet, ConnectivityIndex, Resource
+from bsb.morphologies import Morphology, Branch
+from bsb.output import MorphologyRepository, HDF5Formatter
+from bsb.exceptions import MissingMorphologyError, ConfigurationError
+
+
+def sectioned_morphology(seed):
+    random = np.random.RandomState(seed)
+    branches = [Branch(*random.rand(len(Branch.vectors), 5)) for _ in range(3)]
+    for sid, branch in enumerate(branches):
+        branch._neuron_sid = sid + seed
+    branches[0].attach_child(branches[1])
+    branches[0].attach_child(branches[2])
+    return Morphology(branches[:1])
+
+
+class _Repository:
+    # Serve the morphologies from memory.
+    def __init__(self):
+        self.morphologies = {"A": sectioned_morphology(0), "B": sectioned_morphology(10)}
+
+    def get_cached_morphology(self, name):
+        return self.morphologies[name]
+
+
+class TestConnectivitySet(unittest.TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.cells = np.column_stack(
+            (random.randint(10, size=200), random.randint(100, 120, size=200))
+        ).astype(float)
+        self.compartments = random.randint(12, size=(200, 2))
+        self.morphologies = random.randint(2, size=(200, 2))
+        with h5py.File("tmp.h5", "w") as f:
+            f.create_dataset("/cells/connections/plain", data=self.cells)
+            f.create_dataset("/cells/connections/detailed", data=self.cells)
+            f.create_dataset(
+                "/cells/connection_compartments/detailed", data=self.compartments
+            )
+            morphologies = f.create_dataset(
+                "/cells/connection_morphologies/detailed", data=self.morphologies
+            )
+            morphologies.attrs["map"] = ["A", "B"]
+            group = f.create_group("/cells/connection_index/detailed")
+            formatter = HDF5Formatter()
+            formatter.cast_config()
+            formatter.store_connectivity_index(group, self.cells)
+        self.handler = MorphologyRepository("tmp.h5")
+        self.handler.scaffold = type("Scaffold", (), {})()
+        self.handler.scaffold.morphology_repository = _Repository()
+        self.plain = ConnectivitySet(self.handler, "plain")
+        self.detailed = ConnectivitySet(self.handler, "detailed")
+
+    def tearDown(self):
+        os.remove("tmp.h5")
+
+    def test_index(self):
+        index = ConnectivityIndex.create([3, 1, 3, 3, 7, 1])
+        self.assertEqual([1, 3, 7], index.ids.tolist())
+        self.assertEqual([2, 3, 1], index.degrees.tolist())
+        self.assertEqual([0, 2, 3], index.get_rows(3).tolist())
+        self.assertEqual([], index.get_rows(4).tolist())
+        self.assertEqual([], index.get_rows(8).tolist())
+        self.assertEqual([], ConnectivityIndex.create([]).get_rows(0).tolist())
+
+    def test_queries(self):
+        for cs in (self.plain, self.detailed):
+            for id in range(-1, 11):
+                rows = np.flatnonzero(self.cells[:, 0] == id)
+                self.assertEqual(rows.tolist(), cs.get_outgoing(id).tolist())
+                self.assertEqual(
+                    self.cells[rows, 1].tolist(), cs.get_targets(id).tolist()
+                )
+            for id in range(100, 121):
+                rows = np.flatnonzero(self.cells[:, 1] == id)
+                self.assertEqual(rows.tolist(), cs.get_incoming(id).tolist())
+                self.assertEqual(
+                    self.cells[rows, 0].tolist(), cs.get_sources(id).tolist()
+                )
+        stored, built = self.detailed.get_index("to"), self.plain.get_index("to")
+        for attr in ("ids", "indptr", "order"):
+            self.assertTrue(np.array_equal(getattr(stored, attr), getattr(built, attr)))
+        self.assertRaises(ValueError, self.plain.get_index, "both")
+
+    def test_arrays(self):
+        cs = self.detailed
+        self.assertTrue(np.array_equal(self.compartments[:, 1], cs.to_compartments))
+        self.assertTrue(np.array_equal(self.morphologies[:, 0], cs.from_morphologies))
+        self.assertEqual(["A", "B"], cs.morphology_names)
+        rows = [5, 2, 2]
+        self.assertTrue(np.array_equal(self.cells[rows], cs.get_connections(rows)))
+        self.assertTrue(
+            np.array_equal(self.compartments[rows], cs.get_compartments(rows))
+        )
+        self.assertRaises(MissingMorphologyError, self.plain.get_compartments)
+        self.assertRaises(MissingMorphologyError, lambda: self.plain.morphology_names)
+
+    def test_sections(self):
+        sections = self.detailed.get_sections()
+        for intersection, section_ids in zip(self.detailed.intersections, sections):
+            self.assertEqual(
+                [
+                    intersection.from_compartment.section_id,
+                    intersection.to_compartment.section_id,
+                ],
+                section_ids.tolist(),
+            )
+        self.assertEqual(sorted({0, 1, 2, 10, 11, 12}), sorted(np.unique(sections)))
+        connections = self.plain.connections
+        self.assertEqual(200, len(connections))
+        self.assertEqual(
+            self.cells[7].tolist(), [connections[7].from_id, connections[7].to_id]
+        )
+
+
+class TestDatasetOptions(unittest.TestCase):
+    def setUp(self):
+        self.formatter = HDF5Formatter()
+        self.formatter.cast_config()
+
+    def test_chunk_rows(self):
+        formatter = self.formatter
+        self.assertEqual(2 ** 20 // 24, formatter.get_chunk_rows((10 ** 6, 3), float))
+        self.assertEqual(2 ** 20 // 8, formatter.get_chunk_rows((10 ** 6, 2), np.int32))
+        self.assertEqual(10, formatter.get_chunk_rows((10, 3), float))
+        self.assertEqual(1, formatter.get_chunk_rows((0, 3), float))
+        formatter.chunk_rows = 100
+        self.assertEqual(100, formatter.get_chunk_rows((10, 3), float))
+
+    def test_options(self):
+        formatter = self.formatter
+        # Contiguous by default.
+        self.assertEqual({}, formatter.get_dataset_options((10 ** 6, 3), float))
+        formatter.chunked = True
+        options = formatter.get_dataset_options((10 ** 6, 3), float)
+        self.assertEqual((2 ** 20 // 24, 3), options["chunks"])
+        self.assertNotIn("compression", options)
+        formatter.chunked = False
+        formatter.compression = "gzip"
+        options = formatter.get_dataset_options((10 ** 6, 3), float)
+        self.assertEqual((2 ** 20 // 24, 3), options["chunks"])
+        self.assertEqual((None, 3), options["maxshape"])
+        self.assertEqual(
+            ("gzip", 4, True),
+            (options["compression"], options["compression_opts"], options["shuffle"]),
+        )
+        self.assertEqual({}, formatter.get_dataset_options((10, 0), float))
+        formatter.compression = "lzf"
+        self.assertNotIn(
+            "compression_opts", formatter.get_dataset_options((10, 3), float)
+        )
+        formatter.compression = None
+        self.assertNotIn("compression", formatter.get_dataset_options((10, 3), float))
+        formatter.compression = "zip"
+        self.assertRaises(ConfigurationError, formatter.validate)
+
+    def test_create(self):
+        data = np.random.RandomState(0).rand(1000, 2)
+        self.formatter.compression = "gzip"
+        with h5py.File("tmp.h5", "w") as f:
+            dataset = self.formatter.create_network_dataset(f, "data", data, rows=64)
+            self.assertEqual((64, 2), dataset.chunks)
+            self.assertEqual("gzip", dataset.compression)
+            dataset.resize(1500, axis=0)
+            dataset[1000:] = 1
+            self.assertTrue(np.array_equal(data, dataset[:1000]))
+            empty = self.formatter.create_network_dataset(f, "empty", [], int)
+            self.assertEqual((0,), empty.shape)
+        os.remove("tmp.h5")
+
+    def test_memmap(self):
+        data = np.random.RandomState(0).rand(1000, 3)
+        with h5py.File("tmp.h5", "w") as f:
+            dataset = self.formatter.create_network_dataset(f, "data", data)
+            self.assertIsNone(dataset.chunks)
+            self.formatter.compression = "gzip"
+            self.formatter.create_network_dataset(f, "compressed", data)
+        try:
+            handler = MorphologyRepository("tmp.h5")
+            memmap = Resource(handler, "/data").get_memmap()
+            self.assertIsNotNone(memmap, "Contiguous dataset not mapped")
+            self.assertTrue(np.array_equal(data, memmap))
+            del memmap
+            self.assertIsNone(Resource(handler, "/compressed").get_memmap())
+        finally:
+            os.remove("tmp.h5")
@@ -5,6 +5,10 @@ from bsb.core import Scaffold
 from bsb.config import JSONConfig
 from bsb.models import Layer, CellType, ConnectivitySet
 from bsb.output import MorphologyRepository
+from bsb.connectivity import QuiverTransform, FiberIntersection
+from bsb.voxels import tree_boxes
+from bsb.morphologies import Compartment
+from bsb.networks import FiberMorphology
 import test_setup
 
 
@@ -91,3 +95,118 @@ class TestFiberIntersection(unittest.TestCase):
 
 class TestBranching(unittest.TestCase):
     pass
+
+
+def bend_compartments(transform, compartments, offset, branch_dir, transversal):
+    # Bend the compartments one by one along the quiver field.
+    for i, comp in enumerate(compartments):
+        length = np.linalg.norm(comp.end - comp.start)
+        if i:
+            comp.start = compartments[i - 1].end
+        voxel = ((comp.start + offset - transform.vol_start) / transform.vol_res).astype(
+            int
+        ) - [1, 1, 1]
+        orientation = transform.quivers[:, voxel[0], voxel[1], voxel[2]]
+        if np.isnan(orientation).any():
+            return i
+        direction = np.cross(orientation, transversal)
+        comp.end = comp.start + direction / np.linalg.norm(direction) * length
+    return len(compartments)
+
+
+class TestQuiverTransform(unittest.TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.transform = QuiverTransform()
+        self.transform.shared = False
+        self.transform.vol_res = 25.0
+        self.transform.vol_start = [-50.0, -50.0, -50.0]
+        quivers = (
+            random.rand(3, 30, 30, 30) * 0.2 + np.array([0, 1.0, 0])[:, None, None, None]
+        )
+        # Cut the fibers that reach the 8th voxel along x.
+        quivers[:, 8:] = np.nan
+        self.transform.quivers = quivers
+        self.compartments = []
+        start = np.zeros(3)
+        for i in range(300):
+            end = start + np.array([1.0, 0, 0]) * random.rand() * 3 + random.rand(3) * 0.3
+            parent = self.compartments[-1] if self.compartments else None
+            self.compartments.append(Compartment(start, end, 1, id=i, parent=parent))
+            start = end
+
+    def test_transform_branch(self):
+        offset = np.array([3.0, 4.0, 5.0])
+        fiber = FiberMorphology(self.compartments, None)
+        branch = fiber.root_branches[0]
+        branch_dir = self.transform.get_branch_direction(branch)
+        reference = FiberMorphology(self.compartments, None).flatten()
+        kept = bend_compartments(
+            self.transform, reference, offset, branch_dir, np.cross(branch_dir, [0, 1, 0])
+        )
+        self.transform.transform_branch(branch, offset)
+        self.assertEqual(1, self.transform._branch_cut_num)
+        transformed = fiber.flatten()
+        self.assertEqual(kept, len(transformed))
+        for comp, ref in zip(transformed, reference):
+            self.assertTrue(np.array_equal(ref.start, comp.start))
+            self.assertTrue(np.array_equal(ref.end, comp.end))
+
+
+class TestFiberVoxelization(unittest.TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.compartments = []
+        start = np.zeros(3)
+        for i in range(30):
+            end = start + random.rand(3) * 60
+            parent = self.compartments[-1] if self.compartments else None
+            self.compartments.append(Compartment(start, end, 1, id=i, parent=parent))
+            start = end
+        self.fiber = FiberMorphology(self.compartments, None)
+
+    def test_interpolate(self):
+        branch = self.fiber.root_branches[0]
+        branch.interpolate(20.0)
+        walk = list(branch.walk())
+        self.assertEqual(walk, branch._compartments, "Compartments out of order")
+        pieces = []
+        for c in self.compartments:
+            n = max(int(np.ceil(np.linalg.norm(c.end - c.start) / 20.0)), 1)
+            points = np.column_stack(
+                [np.linspace(*bounds, n + 1) for bounds in zip(c.start, c.end)]
+            )
+            pieces.extend((c.id, points[i], points[i + 1]) for i in range(n))
+        self.assertEqual(len(pieces), len(walk))
+        for comp, (id, start, end) in zip(walk, pieces):
+            self.assertEqual(id, comp.id)
+            self.assertTrue(np.array_equal(start, comp.start))
+            self.assertTrue(np.array_equal(end, comp.end))
+        # Interpolating again has no effect.
+        branch.interpolate(20.0)
+        self.assertEqual(walk, branch._compartments)
+
+    def test_voxelize(self):
+        position = np.array([1.0, 2.0, 3.0])
+        self.fiber.root_branches[0].interpolate(20.0)
+        strategy = FiberIntersection()
+        box, tree, voxel_map, voxels = strategy.voxelize_branches(
+            self.fiber.root_branches, position
+        )
+        compartments = self.fiber.flatten()
+        self.assertEqual(compartments, voxel_map)
+        starts = np.array([c.start for c in compartments]) + position
+        ends = np.array([c.end for c in compartments]) + position
+        self.assertTrue(np.allclose(voxels[:, :3], np.minimum(starts, ends)))
+        self.assertTrue(np.allclose(voxels[:, 3:], np.maximum(starts, ends)))
+        self.assertTrue(np.allclose(box[0], np.minimum(ends.min(axis=0), position)))
+        self.assertTrue(np.allclose(box[1], ends.max(axis=0)))
+        ids, tree_voxels = tree_boxes(tree)
+        self.assertTrue(np.array_equal(np.arange(len(compartments)), ids))
+        self.assertTrue(np.allclose(voxels, tree_voxels))
+        # Without a tree only the voxel boxes are returned.
+        _, no_tree, _, tree_less = strategy.voxelize_branches(
+            self.fiber.root_branches, position, tree=False
+        )
+        self.assertIsNone(no_tree)
+        self.assertTrue(np.array_equal(voxels, tree_less))
@@ -4,6 +4,8 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 import bsb.output, test_setup
 from bsb.morphologies import Morphology, Branch
 from bsb.exceptions import *
+from bsb.voxels import voxelize, HitDetector, Box, m_grid, detect_box_compartments
+from bsb.voxels import VoxelCloud
 
 
 class TestRepositories(unittest.TestCase):
@@ -334,6 +336,162 @@ class TestMorphologyLabels(unittest.TestCase):
         )
 
 
+class TestPackedMorphologies(unittest.TestCase):
+    def setUp(self):
+        root = Branch(*np.random.rand(len(Branch.vectors), 3))
+        root.label("soma")
+        root._neuron_sid = 0
+        child = Branch(*np.random.rand(len(Branch.vectors), 5))
+        child.label("dendrites")
+        child.label_points("spines", [True, False, True, False, False])
+        empty = Branch(*(np.empty(0) for v in Branch.vectors))
+        root.attach_child(child)
+        root.attach_child(empty)
+        self.morphology = Morphology([root])
+        self.mr = bsb.output.MorphologyRepository("tmp.h5")
+        self.mr.get_handle("w")
+
+    def assertSameMorphology(self, morphology):
+        branches = self.morphology.branches
+        self.assertEqual(len(branches), len(morphology.branches))
+        for branch, loaded in zip(branches, morphology.branches):
+            self.assertTrue(np.array_equal(branch.points, loaded.points))
+            self.assertEqual(branch._full_labels, loaded._full_labels)
+            self.assertEqual(
+                list(map(list, branch.label_walk())), list(map(list, loaded.label_walk()))
+            )
+            self.assertEqual(
+                getattr(branch, "_neuron_sid", None), getattr(loaded, "_neuron_sid", None)
+            )
+            parent = branch._parent and branches.index(branch._parent)
+            loaded_parent = loaded._parent and morphology.branches.index(loaded._parent)
+            self.assertEqual(parent, loaded_parent)
+
+    def test_formats(self):
+        self.mr.save_morphology("packed", self.morphology)
+        self.mr.save_morphology("branches", self.morphology, packed=False)
+        with self.mr.load() as repo:
+            self.assertIn("points", repo()["morphologies/packed"])
+            self.assertNotIn("branches", repo()["morphologies/packed"])
+            self.assertIn("branches", repo()["morphologies/branches"])
+        self.assertSameMorphology(self.mr.get_morphology("packed"))
+        self.assertSameMorphology(self.mr.get_morphology("branches"))
+
+    def test_convert(self):
+        self.mr.save_morphology("test", self.morphology, packed=False)
+        m = self.mr.get_morphology("test")
+        m.voxelize(5)
+        self.mr.store_voxel_cloud(m, 5)
+        self.mr.convert_repository()
+        with self.mr.load() as repo:
+            self.assertIn("points", repo()["morphologies/test"])
+        self.assertSameMorphology(self.mr.get_morphology("test"))
+        self.assertTrue(self.mr.voxel_cloud_exists("test", 5))
+        self.mr.convert_morphology("test", packed=False)
+        with self.mr.load() as repo:
+            self.assertNotIn("points", repo()["morphologies/test"])
+        self.assertSameMorphology(self.mr.get_morphology("test"))
+        self.assertTrue(self.mr.voxel_cloud_exists("test", 5))
+
+
+class TestMorphologyLRU(unittest.TestCase):
+    def setUp(self):
+        self.mr = bsb.output.MorphologyRepository("tmp.h5")
+        self.mr.get_handle("w")
+        # 10 points of 4 vectors of 8 bytes per morphology
+        self.mr.loaded_morphologies = bsb.output.MorphologyLRU(max_bytes=640)
+        for name in ("A", "B", "C"):
+            branch = Branch(*np.random.rand(len(Branch.vectors), 10))
+            self.mr.save_morphology(name, Morphology([branch]))
+
+    def test_hits(self):
+        cache = self.mr.loaded_morphologies
+        m = self.mr.get_cached_morphology("A")
+        self.assertIs(m, self.mr.get_cached_morphology("A"))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(320, cache.bytes)
+        self.assertRaises(MorphologyRepositoryError, self.mr.get_cached_morphology, "D")
+
+    def test_eviction(self):
+        cache = self.mr.loaded_morphologies
+        a = self.mr.get_cached_morphology("A")
+        self.mr.get_cached_morphology("B")
+        self.mr.get_cached_morphology("A")
+        # Loading C should evict the least recently used morphology, B.
+        self.mr.get_cached_morphology("C")
+        self.assertEqual(2, len(cache))
+        self.assertEqual(640, cache.bytes)
+        self.assertIs(a, self.mr.get_cached_morphology("A"))
+        self.mr.get_cached_morphology("B")
+        self.assertEqual((2, 4), (cache.hits, cache.misses))
+
+    def test_invalidation(self):
+        a = self.mr.get_cached_morphology("A")
+        branch = Branch(*np.random.rand(len(Branch.vectors), 5))
+        self.mr.save_morphology("A", Morphology([branch]), overwrite=True)
+        loaded = self.mr.get_cached_morphology("A")
+        self.assertIsNot(a, loaded)
+        self.assertEqual(5, loaded.roots[0].size)
+        self.mr.remove_morphology("A")
+        self.assertEqual(0, len(self.mr.loaded_morphologies))
+
+    def test_unrelated_writes(self):
+        # Writes that don't touch a morphology keep it cached.
+        b = self.mr.get_cached_morphology("B")
+        with self.mr.load("a") as f:
+            f().create_dataset("other", data=np.arange(10))
+        self.assertIs(b, self.mr.get_cached_morphology("B"))
+        self.mr.close_handle()
+        self.mr.get_handle("w").close()
+        self.assertEqual(0, len(self.mr.loaded_morphologies))
+
+
+class TestRotatedMorphologies(unittest.TestCase):
+    def setUp(self):
+        self.mr = bsb.output.MorphologyRepository("tmp.h5")
+        self.mr.get_handle("w")
+        self.mr.loaded_morphologies = bsb.output.MorphologyLRU()
+        branch = Branch(*np.random.rand(len(Branch.vectors), 10))
+        self.mr.save_morphology("A", Morphology([branch]))
+
+    def test_rotated(self):
+        m = self.mr.get_cached_morphology("A")
+        rotated = self.mr.get_rotated_morphology("A", 0, 90)
+        self.assertIs(rotated, self.mr.get_rotated_morphology("A", 0.0, 90))
+        self.assertEqual("A__0_90", rotated.morphology_name)
+        # The canonical morphology is not modified, rotations are not stored.
+        self.assertEqual(["A"], self.mr.list_morphologies(include_rotations=True))
+        stored = m.compartment_arrays
+        expected = stored.starts @ bsb.morphologies.get_orientation_matrix(0, 90).T
+        self.assertTrue(np.allclose(expected, rotated.compartment_arrays.starts))
+        self.assertFalse(np.allclose(stored.starts, rotated.compartment_arrays.starts))
+        self.assertTrue(
+            np.allclose(
+                rotated.compartment_tree.get_arrays()[0], rotated.compartment_arrays.ends
+            )
+        )
+        # Rotated names resolve to fresh rotations when they aren't stored.
+        loaded = self.mr.get_morphology("A__0_90")
+        self.assertIsNot(rotated, loaded)
+        self.assertTrue(np.allclose(expected, loaded.compartment_arrays.starts))
+        self.assertRaises(MorphologyRepositoryError, self.mr.get_morphology, "B__0_90")
+
+    def test_rotated_voxel_cloud(self):
+        cloud = self.mr.get_rotated_voxel_cloud("A", 0, 90, 5)
+        self.assertIs(cloud, self.mr.get_rotated_voxel_cloud("A", 0.0, 90, 5))
+        self.assertIsNot(cloud, self.mr.get_rotated_voxel_cloud("A", 0, 90, 6))
+        expected = VoxelCloud.create(self.mr.get_rotated_morphology("A", 0, 90), 5)
+        self.assertTrue(np.array_equal(expected.voxels, cloud.voxels))
+        self.assertEqual(expected.map, cloud.map)
+        self.mr.remove_morphology("A")
+        self.assertEqual(0, len(self.mr.loaded_morphologies))
+
+    def test_invalidation(self):
+        rotated = self.mr.get_rotated_morphology("A", 0, 90)
+        self.mr.remove_morphology("A")
+        self.assertEqual(0, len(self.mr.loaded_morphologies))
+
+
 class TestLegacy(unittest.TestCase):
     def test_legacy_runs_without_errors(self):
         import random
@@ -365,3 +523,167 @@ class TestLegacy(unittest.TestCase):
         m.get_compartments(labels=["A"])
         m.get_branches()
         m.get_branches(labels=["B"])
+
+
+class TestVoxelization(unittest.TestCase):
+    def _rtree_detector(self, points, ids):
+        from rtree import index
+
+        tree = index.Index(properties=index.Property(dimension=3))
+        for id, point in zip(ids, points):
+            tree.insert(int(id), tuple([*point, *point]))
+        return tree, HitDetector.for_rtree(tree)
+
+    def test_point_hit_detector(self):
+        # Compare the binned hits against the Rtree detector, rounded points fall on
+        # the faces between boxes.
+        for points in (
+            np.random.normal(size=(150, 3)) * [20, 5, 40],
+            np.round(np.random.normal(size=(150, 3)) * 10),
+        ):
+            ids = np.random.permutation(len(points)) + 10
+            tree, tree_detector = self._rtree_detector(points, ids)
+            detector = HitDetector.for_points(points, ids=ids)
+            box = Box()
+            box.dimensions = np.max(points, axis=0) - np.min(points, axis=0)
+            box.origin = np.min(points, axis=0) + box.dimensions / 2
+            for N in (1, 20, 100):
+                with self.subTest(N=N):
+                    expected = voxelize(N, box, tree_detector)
+                    result = voxelize(N, box, detector)
+                    self.assertTrue(np.array_equal(expected[0], result[0]))
+                    self.assertTrue(np.array_equal(expected[1], result[1]))
+                    self.assertEqual(expected[2:], result[2:])
+                    bounds, voxels, length, _ = result
+                    boxes = np.column_stack(m_grid(bounds, length)[:, voxels])
+                    expected_map = [
+                        sorted(detect_box_compartments(tree, origin, length))
+                        for origin in boxes
+                    ]
+                    self.assertEqual(
+                        expected_map, detector.map_voxels(bounds, length, voxels)
+                    )
+
+    def test_custom_hit_detector(self):
+        # Plain functions are still accepted as hit detectors.
+        points = np.random.rand(50, 3) * 20
+        detector = HitDetector.for_points(points)
+        box = Box()
+        box.dimensions = np.max(points, axis=0) - np.min(points, axis=0)
+        box.origin = np.min(points, axis=0) + box.dimensions / 2
+        expected = voxelize(10, box, detector)
+        result = voxelize(10, box, lambda origin, size: detector(origin, size))
+        self.assertTrue(np.array_equal(expected[1], result[1]))
+        self.assertEqual(expected[2:], result[2:])
+
+
+class TestVoxelClouds(unittest.TestCase):
+    def setUp(self):
+        branches = []
+        for i in range(5):
+            branch = Branch(*np.random.rand(len(Branch.vectors), 10) * 20)
+            branch.label("A" if i % 2 else "B")
+            if branches:
+                branches[-1].attach_child(branch)
+            branches.append(branch)
+        self.mr = bsb.output.MorphologyRepository("tmp.h5")
+        self.mr.get_handle("w")
+        self.mr.save_morphology("test", Morphology(branches[:1]))
+
+    def test_store_voxel_cloud(self):
+        mr = self.mr
+        m = mr.get_morphology("test")
+        self.assertFalse(mr.voxel_cloud_exists("test", 10, ["A"]))
+        self.assertEqual([], mr.list_all_voxelized())
+        m.voxelize(10, compartments=m.get_compartments(["A"]))
+        mr.store_voxel_cloud(m, 10, labels=["A"])
+        self.assertTrue(mr.voxel_cloud_exists("test", 10, ["A"]))
+        self.assertFalse(mr.voxel_cloud_exists("test", 10))
+        self.assertFalse(mr.voxel_cloud_exists("test", 20, ["A"]))
+        self.assertEqual(["test"], mr.list_all_voxelized())
+        cloud = mr.get_voxel_cloud("test", 10, ["A"])
+        self.assertTrue(np.array_equal(m.cloud.bounds, cloud.bounds))
+        self.assertTrue(np.array_equal(m.cloud.voxels, cloud.voxels))
+        self.assertEqual(m.cloud.grid_size, cloud.grid_size)
+        self.assertEqual(m.cloud.map, cloud.map)
+        self.assertRaises(DataNotFoundError, mr.get_voxel_cloud, "test", 10)
+        mr.remove_voxel_cloud("test", 10, ["A"])
+        self.assertFalse(mr.voxel_cloud_exists("test", 10, ["A"]))
+
+
+class TestCompartmentArrays(unittest.TestCase):
+    def setUp(self):
+        self.root = Branch(*np.arange(12, dtype=float).reshape(4, 3))
+        self.root.label("soma")
+        # An empty branch between the root and its child should be skipped
+        self.empty = Branch(*np.empty((4, 0)))
+        self.child = Branch(*np.arange(16, dtype=float).reshape(4, 4) * 2)
+        self.child.label("dendrites")
+        self.child.label_points("spine", [False, False, True, True])
+        self.child._neuron_sid = 3
+        self.root.attach_child(self.empty)
+        self.empty.attach_child(self.child)
+        self.morphology = Morphology([self.root])
+
+    def test_arrays(self):
+        arrays = self.morphology.compartment_arrays
+        self.assertEqual(len(arrays), 5)
+        self.assertTrue(np.array_equal(arrays.starts[0], [0, 3, 6]))
+        self.assertTrue(np.array_equal(arrays.ends[0], [1, 4, 7]))
+        self.assertTrue(np.array_equal(arrays.ends[2], [2, 10, 18]))
+        self.assertTrue(np.array_equal(arrays.radii, [10, 11, 26, 28, 30]))
+        self.assertTrue(np.array_equal(arrays.parents, [-1, 0, 1, 2, 3]))
+        self.assertTrue(np.array_equal(arrays.section_ids, [-1, -1, 3, 3, 3]))
+        self.assertTrue(np.array_equal(arrays.get_label_mask(["spine"]), [0, 0, 0, 1, 1]))
+        self.assertEqual(arrays.get_labels(4), ["dendrites", "spine"])
+        self.assertEqual(self.morphology.get_compartment_submask(["soma"]), [0, 1])
+        self.assertEqual(self.morphology.get_compartment_submask(["other"]), [])
+        # No labels select all compartments.
+        self.assertTrue(np.all(arrays.get_label_mask(None)))
+        self.assertEqual(self.morphology.get_compartment_submask(None), list(range(5)))
+
+    def test_compartments_view(self):
+        arrays = self.morphology.compartment_arrays
+        compartments = self.morphology.compartments
+        self.assertEqual([c.id for c in compartments], list(range(5)))
+        self.assertIsNone(compartments[0].parent)
+        self.assertIs(compartments[2].parent, compartments[1])
+        self.assertIsNone(compartments[0].section_id)
+        self.assertEqual(compartments[2].section_id, 3)
+        for c, midpoint in zip(compartments, arrays.midpoints):
+            self.assertTrue(np.allclose(c.midpoint, midpoint))
+        self.assertEqual(
+            [c.id for c in self.morphology.get_compartments(["dendrites"])], [2, 3, 4]
+        )
+
+    def test_rotate(self):
+        ends = self.morphology.compartment_arrays.ends.copy()
+        self.morphology.rotate([0, 1, 0], [1, 0, 0])
+        rotated = self.morphology.compartment_arrays.ends
+        # A quarter turn around the z axis
+        self.assertTrue(np.allclose(rotated[:, 0], ends[:, 1]))
+        self.assertTrue(np.allclose(rotated[:, 1], -ends[:, 0]))
+        self.assertTrue(np.allclose(rotated[:, 2], ends[:, 2]))
+        self.assertTrue(np.allclose(self.morphology.compartments[0].end, rotated[0]))
+        tree_points = np.array(self.morphology.compartment_tree.get_arrays()[0])
+        self.assertTrue(np.allclose(tree_points, rotated))
+        # The branches are rotated along with the compartments.
+        self.assertTrue(np.allclose(self.child.x, [8, 10, 12, 14]))
+        self.assertTrue(np.allclose(self.child.y, [0, -2, -4, -6]))
+        self.assertEqual(self.child.size, 4)
+        arrays = bsb.morphologies.CompartmentArrays.from_branches(
+            self.morphology.branches
+        )
+        self.assertTrue(np.allclose(arrays.ends, rotated))
+
+    def test_rotated(self):
+        rotation = bsb.morphologies.get_orientation_matrix(30, 60)
+        rotated = self.morphology.rotated(rotation)
+        self.assertTrue(np.array_equal(self.child.x, np.arange(4) * 2))
+        self.assertEqual(3, len(rotated.branches))
+        self.assertIsNot(self.child, rotated.branches[2])
+        self.assertEqual(["dendrites"], rotated.branches[2]._full_labels)
+        self.assertEqual(3, rotated.branches[2]._neuron_sid)
+        self.assertIs(rotated.branches[1], rotated.branches[2]._parent)
+        expected = self.morphology.compartment_arrays.starts @ rotation.T
+        self.assertTrue(np.array_equal(expected, rotated.compartment_arrays.starts))
@@ -0,0 +1,91 @@
+import unittest, os, sys, numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bsb.particles import ParticleSystem, ArrayParticleSystem, LargeParticleSystem
+
+
+def fill_system(system, count=500, radius=2.5, packing_factor=0.4):
+    side = (count * 4 / 3 * np.pi * radius ** 3 / packing_factor) ** (1 / 3)
+    voxels = [[[0.0, 0.0, 0.0], [side, side, side]]]
+    particles = [{"name": "test", "voxels": [0], "radius": radius, "count": count}]
+    system.fill(voxels, particles)
+    return system
+
+
+class TestArrayParticleSystem(unittest.TestCase):
+    """
+    Check that the array particle system untangles particles like the object system.
+    """
+
+    def test_fill(self):
+        np.random.seed(0)
+        objects = fill_system(ParticleSystem())
+        np.random.seed(0)
+        arrays = fill_system(ArrayParticleSystem())
+        self.assertTrue(np.array_equal(objects.positions, arrays.positions))
+
+    def test_colliding_pairs(self):
+        system = fill_system(ArrayParticleSystem())
+        pairs = system.find_colliding_pairs()
+        positions = system.positions
+        distances = np.sqrt(
+            np.sum((positions[:, np.newaxis] - positions[np.newaxis]) ** 2, axis=2)
+        )
+        expected = np.column_stack(np.nonzero(np.triu(distances <= 5.0, k=1)))
+        pairs = pairs[np.lexsort(pairs.T[::-1])]
+        self.assertTrue(np.array_equal(pairs, expected))
+        colliding = system.find_colliding_particles()
+        self.assertTrue(np.array_equal(colliding, np.unique(expected)))
+
+    def test_solve_collisions(self):
+        system = fill_system(ArrayParticleSystem(track_displaced=True))
+        colliding = system.find_colliding_particles()
+        system.solve_collisions()
+        self.assertEqual(system.colliding_count, 0)
+        self.assertEqual(len(system.find_colliding_pairs()), 0)
+        self.assertTrue(np.all(np.isin(colliding, system.displaced_particles)))
+        voxel = system.voxels[0]
+        pruned, per_type = system.prune(at_risk_particles=system.displaced_particles)
+        self.assertEqual(len(system.positions), 500 - pruned)
+        self.assertEqual(per_type, {"test": pruned} if pruned else {})
+        positions = system.positions
+        self.assertTrue(np.all(positions >= voxel.origin))
+        self.assertTrue(np.all(positions <= voxel.origin + voxel.size))
+
+
+class TestLargeParticleSystem(unittest.TestCase):
+    """
+    Check that the tiled particle system solves the collisions across its tiles.
+    """
+
+    def solve(self, workers):
+        np.random.seed(0)
+        system = LargeParticleSystem(track_displaced=True, tile_size=15, workers=workers)
+        fill_system(system, count=1000)
+        system.solve_collisions()
+        return system
+
+    def test_tiles(self):
+        np.random.seed(0)
+        system = fill_system(LargeParticleSystem(tile_size=15), count=1000)
+        tiles = system.get_tiles()
+        self.assertGreater(len(tiles), 1)
+        cores = np.concatenate([core for core, _, _, _ in tiles])
+        self.assertTrue(np.array_equal(np.sort(cores), np.arange(1000)))
+        for core, halo, low, high in tiles:
+            self.assertEqual(len(np.intersect1d(core, halo)), 0)
+            positions = system.positions[core]
+            self.assertTrue(
+                np.all((positions >= low - 1e-9) & (positions <= high + 1e-9))
+            )
+
+    def test_solve_collisions(self):
+        system = self.solve(workers=1)
+        self.assertEqual(system.colliding_count, 0)
+        self.assertEqual(len(system.find_colliding_pairs()), 0)
+        # The result should not depend on the amount of workers.
+        pooled = self.solve(workers=2)
+        self.assertTrue(np.array_equal(system.positions, pooled.positions))
+        self.assertTrue(
+            np.array_equal(system.displaced_particles, pooled.displaced_particles)
+        )
@@ -3,8 +3,9 @@ import unittest, os, sys, numpy as np, h5py, test_setup
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 from bsb.core import Scaffold, from_hdf5
 from bsb.config import JSONConfig
-from bsb.models import PlacementSet, Cell
-from bsb.exceptions import DatasetNotFoundError
+from bsb.models import PlacementSet, Cell, Resource
+from bsb.output import MorphologyRepository
+from bsb.exceptions import DatasetNotFoundError, ResourceError
 
 
 def relative_to_tests_folder(path):
@@ -96,3 +97,158 @@ class TestPlacementSets(unittest.TestCase):
                 (3,),
                 "PlacementSet.cells positions wrong shape",
             )
+
+
+class _CountingRepository(MorphologyRepository):
+    # Count how often the resource is opened.
+    opened = 0
+
+    def get_handle(self, mode="r"):
+        self.opened += 1
+        return super().get_handle(mode)
+
+
+class TestHandlePool(unittest.TestCase):
+    def setUp(self):
+        with h5py.File("tmp.h5", "w") as f:
+            f.create_dataset("data", data=np.arange(10))
+            f["data"].attrs["map"] = ["A", "B"]
+        self.handler = _CountingRepository("tmp.h5")
+        self.resource = Resource(self.handler, "/data")
+
+    def tearDown(self):
+        self.handler.close_handle()
+        os.remove("tmp.h5")
+
+    def test_scopes(self):
+        self.resource.get_dataset()
+        self.resource.get_attribute("map")
+        self.assertEqual(2, self.handler.opened)
+        self.assertIsNone(self.handler.handle_mode, "Handle not released")
+        with self.handler.batch() as handler:
+            self.assertIs(self.handler, handler)
+            for _ in range(5):
+                self.assertEqual(10, len(self.resource.get_dataset()))
+                self.assertEqual(2, len(self.resource.get_attribute("map")))
+                self.assertEqual((10,), self.resource.shape)
+        self.assertEqual(3, self.handler.opened)
+        self.assertRaises(DatasetNotFoundError, Resource(self.handler, "/x").get_dataset)
+
+    def test_upgrade(self):
+        with self.handler.batch() as handler:
+            dataset = handler.open_object("/data")
+            with handler.load("a") as f:
+                self.assertEqual("a", handler.handle_mode)
+                upgraded = handler.open_object("/data")
+                self.assertIsNot(dataset, upgraded, "Object of closed handle cached")
+                self.assertFalse(dataset.id.valid)
+                self.assertEqual("r+", upgraded.file.mode)
+                f().create_dataset("more", data=np.ones(3))
+            # Reads are served by the upgraded handle.
+            with handler.load("r") as f:
+                self.assertEqual("r+", f().mode)
+                self.assertEqual(3, len(Resource(handler, "/more").get_dataset()))
+        self.assertEqual(2, self.handler.opened)
+        self.assertIsNone(self.handler.handle_mode)
+
+    def test_keep_open(self):
+        self.handler.keep_handles_open = True
+        for _ in range(3):
+            self.resource.get_dataset()
+        self.assertEqual(1, self.handler.opened)
+        self.assertEqual("r", self.handler.handle_mode)
+        self.handler.close_handle()
+        self.assertIsNone(self.handler.handle_mode)
+        self.resource.get_dataset()
+        self.assertEqual(2, self.handler.opened)
+
+    def test_read_only(self):
+        self.handler.read_only = True
+        self.assertEqual(10, len(self.resource.get_dataset()))
+        with self.assertRaises(ResourceError):
+            with self.handler.load("a"):
+                pass
+        self.assertIsNone(self.handler.handle_mode)
+        # Trees aren't stored by read only handlers.
+        self.handler.store_tree_collections([None])
+
+
+class TestPlacementSetSelection(unittest.TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.ids = np.concatenate((np.arange(5), np.arange(10, 13), np.arange(100, 107)))
+        self.positions = random.rand(15, 3)
+        self.rotations = random.rand(15, 2)
+        with h5py.File("tmp.h5", "w") as f:
+            group = f.create_group("/cells/placement/cell")
+            group.create_dataset("identifiers", data=[0, 5, 10, 3, 100, 0, 100, 7])
+            group.create_dataset("positions", data=self.positions)
+            group.create_dataset(
+                "rotations",
+                data=self.rotations,
+                chunks=(4, 2),
+                maxshape=(None, 2),
+                compression="gzip",
+                shuffle=True,
+            )
+        cell_type = type("CellType", (), {"name": "cell"})()
+        self.handler = MorphologyRepository("tmp.h5")
+        self.ps = PlacementSet(self.handler, cell_type)
+
+    def tearDown(self):
+        os.remove("tmp.h5")
+
+    def test_selection(self):
+        ps = self.ps
+        self.assertEqual(15, len(ps))
+        self.assertTrue(np.array_equal(self.ids, ps.identifiers))
+        self.assertTrue(np.array_equal(self.positions, ps.positions))
+        selectors = [
+            slice(None),
+            slice(3, 11, 2),
+            slice(None, None, -3),
+            slice(20, 30),
+            [14, 0, 3, 3, -1],
+            np.array([[1, 2], [13, 5]]),
+            self.ids % 2 == 0,
+            [],
+            7,
+        ]
+        for selector in selectors:
+            self.assertTrue(
+                np.array_equal(self.ids[selector], ps.get_identifiers(selector))
+            )
+            self.assertTrue(
+                np.array_equal(self.positions[selector], ps.get_positions(selector))
+            )
+            self.assertTrue(
+                np.array_equal(self.rotations[selector], ps.get_rotations(selector))
+            )
+        self.assertRaises(IndexError, ps.get_positions, [15])
+        self.assertRaises(IndexError, ps.get_identifiers, [True, False])
+        cells = ps[[2, 6]]
+        self.assertEqual([2, 11], [c.id for c in cells])
+        self.assertTrue(np.array_equal(self.rotations[6], cells[1].rotation))
+        self.assertEqual(104, ps[-3].id)
+
+    def test_iter_chunks(self):
+        chunks = list(self.ps.iter_chunks(4))
+        self.assertEqual([4, 4, 4, 3], [len(c[0]) for c in chunks])
+        for i, data in enumerate((self.ids, self.positions, self.rotations)):
+            self.assertTrue(np.array_equal(data, np.concatenate([c[i] for c in chunks])))
+        self.assertRaises(ValueError, next, self.ps.iter_chunks(0))
+        cells = self.ps.cells
+        self.assertEqual(self.ids.tolist(), [c.id for c in cells])
+        self.assertTrue(np.array_equal(self.positions[-1], cells[-1].position))
+
+    def test_mmap(self):
+        positions = self.ps.positions_set.get_memmap()
+        self.assertIsInstance(positions, np.memmap)
+        self.assertTrue(np.array_equal(self.positions, positions))
+        self.assertIsNone(self.ps.rotation_set.get_memmap(), "Chunked data mapped")
+        self.ps.mmap = True
+        self.assertIsInstance(self.ps.positions, np.memmap)
+        self.assertTrue(
+            np.array_equal(self.positions[[3, 1]], self.ps.get_positions([3, 1]))
+        )
+        self.assertTrue(np.array_equal(self.rotations, self.ps.rotations))
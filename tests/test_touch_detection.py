@@ -0,0 +1,115 @@
+import unittest, os, sys, numpy as np
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bsb.connectivity import TouchDetector
+from bsb.connectivity.detailed import touch_detection
+from bsb.connectivity.detailed.touch_detection import TouchInformation
+from bsb.morphologies import Morphology, Branch
+from bsb.helpers import DistributionConfiguration
+
+
+def random_morphology(name, seed):
+    random = np.random.RandomState(seed)
+    root = Branch(*random.rand(len(Branch.vectors), 20) * 40)
+    root.label("dendrites")
+    axon = Branch(*random.rand(len(Branch.vectors), 20) * 40)
+    axon.label("axon")
+    root.attach_child(axon)
+    morphology = Morphology([root])
+    morphology.morphology_name = name
+    return morphology
+
+
+class _TouchDetector(TouchDetector):
+    # Pick the morphologies round robin instead of from a repository.
+    def get_random_morphology(self, cell_type):
+        morphologies = self.morphologies[cell_type.name]
+        self.picks = getattr(self, "picks", 0) + 1
+        return morphologies[self.picks % len(morphologies)]
+
+
+class TestTouchDetection(unittest.TestCase):
+    def setUp(self):
+        self.detector = _TouchDetector()
+        self.detector.compartment_intersection_radius = 5.0
+        self.detector.allow_zero_synapses = False
+        self.detector.morphologies = {
+            "from": [random_morphology("A", 0), random_morphology("B", 1)],
+            "to": [random_morphology("C", 2), random_morphology("D", 3)],
+        }
+        random = np.random.RandomState(4)
+        from_type = type("CellType", (), {"name": "from"})()
+        to_type = type("CellType", (), {"name": "to"})()
+        info = TouchInformation(from_type, ["axon"], to_type, ["dendrites"])
+        info.from_positions = list(random.rand(10, 3) * 40)
+        info.to_positions = list(random.rand(15, 3) * 40)
+        info.from_identifiers = list(range(10))
+        info.to_identifiers = list(range(100, 115))
+        self.info = info
+        self.candidates = [random.choice(15, 5, replace=False) for _ in range(10)]
+
+    def reference_intersections(self, from_cells, to_cells, from_morphos, to_morphos):
+        info = self.info
+        intersections = []
+        for pair, (i, j, fm, tm) in enumerate(
+            zip(from_cells, to_cells, from_morphos, to_morphos)
+        ):
+            from_m = info.from_morphologies[fm]
+            to_m = info.to_morphologies[tm]
+            from_points = from_m.get_compartment_positions(["axon"])
+            to_points = (
+                to_m.get_compartment_positions(["dendrites"])
+                + info.to_positions[j]
+                - info.from_positions[i]
+            )
+            from_map = from_m.get_compartment_submask(["axon"])
+            to_map = to_m.get_compartment_submask(["dendrites"])
+            dist = np.linalg.norm(from_points[:, None] - to_points[None], axis=2)
+            for f, t in zip(*np.nonzero(dist <= 5.0)):
+                intersections.append((pair, from_map[f], to_map[t]))
+        return sorted(intersections)
+
+    def test_intersections(self):
+        picked = self.detector.pick_morphologies(self.info, self.candidates)
+        self.assertEqual(50, len(picked[0]))
+        self.assertEqual(2, len(self.info.to_morphologies))
+        intersections = self.detector.get_compartment_intersections(self.info, *picked)
+        self.assertTrue(np.all(np.diff(intersections[0]) >= 0), "Not sorted by pair")
+        self.assertEqual(
+            self.reference_intersections(*picked),
+            sorted(zip(*(a.tolist() for a in intersections))),
+        )
+
+    def test_tree_per_morphology(self):
+        # One tree is built per presynaptic morphology, not per pair of morphologies.
+        picked = self.detector.pick_morphologies(self.info, self.candidates)
+        KDTree = touch_detection.KDTree
+        with mock.patch.object(touch_detection, "KDTree", side_effect=KDTree) as tree:
+            self.detector.get_compartment_intersections(self.info, *picked)
+        self.assertEqual(len(self.info.from_morphologies), tree.call_count)
+
+    def test_synapses(self):
+        self.detector.synapses = DistributionConfiguration.cast(1)
+        cells, names, compartments = self.detector.intersect_compartments(
+            self.info, self.candidates
+        )
+        self.assertGreater(len(cells), 0)
+        self.assertEqual((len(cells), 2), compartments.shape)
+        self.assertEqual((len(cells), 2), names.shape)
+        self.assertEqual(len(cells), len(np.unique(cells, axis=0)), "1 synapse per pair")
+        self.assertTrue(set(names[:, 0]) <= {b"A", b"B"})
+        # Enough synapses to select every intersection
+        self.detector.synapses = DistributionConfiguration.cast(10000)
+        self.detector.picks = 0
+        picked = self.detector.pick_morphologies(self.info, self.candidates)
+        reference = self.reference_intersections(*picked)
+        self.detector.picks = 0
+        cells, names, compartments = self.detector.intersect_compartments(
+            self.info, self.candidates
+        )
+        self.assertEqual(len(reference), len(cells))
+        self.assertEqual(
+            sorted((p[1], p[2]) for p in reference),
+            sorted(map(tuple, compartments.tolist())),
+        )
@@ -0,0 +1,71 @@
+import unittest, os, sys, pickle, numpy as np, h5py
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bsb.trees import TreeCollection, LazyTree
+from bsb.output import MorphologyRepository
+from sklearn.neighbors import KDTree
+
+
+class TestLazyTree(unittest.TestCase):
+    def test_lazy(self):
+        points = np.random.RandomState(0).rand(100, 3)
+        loads = []
+        tree = LazyTree(lambda: loads.append(1) or points)
+        self.assertFalse(tree.is_loaded)
+        self.assertFalse(hasattr(tree, "shape"))
+        self.assertEqual([], loads, "Points loaded without use")
+        self.assertTrue(np.array_equal(points, tree.data))
+        self.assertIsNone(tree._tree, "Tree built without query")
+        reference = KDTree(points)
+        self.assertEqual(
+            [sorted(r) for r in reference.query_radius(points[:10], 0.2)],
+            [sorted(r) for r in tree.query_radius(points[:10], 0.2)],
+        )
+        self.assertEqual([1], loads)
+        unpickled = pickle.loads(pickle.dumps(tree))
+        self.assertTrue(np.array_equal(points, unpickled.data))
+        self.assertTrue(
+            np.array_equal(reference.query(points[:5])[1], unpickled.query(points[:5])[1])
+        )
+
+
+class TestTreeStorage(unittest.TestCase):
+    def setUp(self):
+        self.handler = MorphologyRepository("tmp.h5")
+        self.handler.get_handle("w").close()
+        self.points = np.random.RandomState(0).rand(50, 3)
+        self.collection = TreeCollection("cells", self.handler)
+        self.collection.create_tree("A", self.points)
+        self.collection.add_tree("B", KDTree(self.points[:10], leaf_size=5))
+        self.collection.save()
+
+    def tearDown(self):
+        os.remove("tmp.h5")
+
+    def test_storage(self):
+        with h5py.File("tmp.h5", "r") as f:
+            self.assertTrue(np.array_equal(self.points, f["trees/cells/A"][()]))
+            self.assertEqual(40, f["trees/cells/A"].attrs["leaf_size"])
+        collection = TreeCollection("cells", self.handler)
+        self.assertEqual(["A", "B"], sorted(collection.list_trees()))
+        tree = collection.get_tree("A")
+        self.assertIsInstance(tree, LazyTree)
+        self.assertFalse(tree.is_loaded)
+        # Unchanged lazy trees are not rewritten.
+        collection.save()
+        self.assertFalse(tree.is_loaded)
+        self.assertEqual(3, tree.query(self.points[3:4], k=1)[1][0, 0])
+        self.assertIsNone(collection.get_tree("C"))
+        planar = collection.get_planar_tree("B", plane="xz")
+        self.assertTrue(np.array_equal(self.points[:10, [0, 2]], planar.data))
+        with h5py.File("tmp.h5", "r") as f:
+            self.assertEqual(["A", "B", "xz:B"], sorted(f["trees/cells"].keys()))
+
+    def test_legacy(self):
+        tree = KDTree(self.points)
+        with h5py.File("tmp.h5", "a") as f:
+            del f["trees/cells/A"]
+            f["trees/cells"].create_dataset("A", data=np.string_(pickle.dumps(tree)))
+        loaded = TreeCollection("cells", self.handler).get_tree("A")
+        self.assertIsInstance(loaded, KDTree)
+        self.assertTrue(np.array_equal(self.points, np.asarray(loaded.data)))
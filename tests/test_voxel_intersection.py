@@ -0,0 +1,177 @@
+import unittest, os, sys, pickle, numpy as np
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from bsb.connectivity import VoxelIntersection
+from bsb.morphologies import Morphology, Branch
+from bsb.helpers import DistributionConfiguration
+from bsb.voxels import VoxelCloud, intersect_boxes, tree_boxes, box_index
+from bsb.connectivity.detailed import voxel_intersection
+from bsb.connectivity.detailed.voxel_intersection import intersect_clouds
+from rtree import index
+
+
+def random_cloud(seed):
+    random = np.random.RandomState(seed)
+    branches = [Branch(*random.rand(len(Branch.vectors), 20) * 60) for _ in range(3)]
+    branches[0].attach_child(branches[1])
+    branches[1].attach_child(branches[2])
+    return VoxelCloud.create(Morphology(branches[:1]), 20)
+
+
+def tree_intersect_clouds(from_cloud, to_cloud, translation):
+    # Query the voxel tree of the from cloud for each voxel of the to cloud.
+    return [
+        sorted(from_cloud.tree.intersection(tuple(box)))
+        for box in to_cloud.get_voxel_boxes(translation)
+    ]
+
+
+class TestCloudIntersection(unittest.TestCase):
+    def test_intersect_clouds(self):
+        for seed in range(10):
+            from_cloud, to_cloud = random_cloud(seed), random_cloud(seed + 10)
+            translation = np.random.RandomState(seed).rand(3) * 30
+            self.assertEqual(
+                tree_intersect_clouds(from_cloud, to_cloud, translation),
+                intersect_clouds(from_cloud, to_cloud, np.zeros(3), translation),
+            )
+
+    def test_touching_voxels(self):
+        cloud = random_cloud(0)
+        translation = np.array([cloud.grid_size, 0, 0])
+        to_voxels, from_voxels = cloud.intersect(cloud, translation)
+        self.assertGreater(len(to_voxels), 0)
+        self.assertEqual(
+            tree_intersect_clouds(cloud, cloud, translation),
+            intersect_clouds(cloud, cloud, np.zeros(3), translation),
+        )
+        # Beyond touching distance the clouds no longer intersect.
+        to_voxels, from_voxels = cloud.intersect(cloud, [1000, 0, 0])
+        self.assertEqual(0, len(to_voxels))
+
+    def test_tree_boxes(self):
+        random = np.random.RandomState(0)
+        lower = random.rand(100, 3) * 100
+        boxes = np.column_stack((lower, lower + random.rand(100, 3) * 10))
+        tree = index.Index(properties=index.Property(dimension=3))
+        for i, box in enumerate(boxes):
+            tree.insert(i, tuple(box))
+        ids, tree_data = tree_boxes(tree)
+        self.assertTrue(np.array_equal(np.arange(100), ids))
+        self.assertTrue(np.allclose(boxes, tree_data))
+        queries = boxes[:20] + [2, 2, 2, 5, 5, 5]
+        rows, indices = intersect_boxes(boxes, queries)
+        self.assertEqual(
+            sorted(
+                (q, i)
+                for q, query in enumerate(queries)
+                for i in tree.intersection(tuple(query))
+            ),
+            list(zip(rows.tolist(), indices.tolist())),
+        )
+
+
+class TestBoxIndex(unittest.TestCase):
+    def test_box_index(self):
+        random = np.random.RandomState(0)
+        lower = random.rand(500, 3) * 100
+        boxes = np.column_stack((lower, lower + random.rand(500, 3) * 10))
+        tree = index.Index(properties=index.Property(dimension=3))
+        for i, box in enumerate(boxes):
+            tree.insert(i, tuple(box))
+        bulk = box_index(boxes)
+        self.assertEqual(500, bulk.count(bulk.bounds))
+        for query in boxes[:50] + [2, 2, 2, 5, 5, 5]:
+            self.assertEqual(
+                sorted(tree.intersection(tuple(query))),
+                sorted(bulk.intersection(tuple(query))),
+            )
+
+    def test_ids(self):
+        ids, boxes = tree_boxes(box_index(np.ones((3, 6)), ids=[4, 5, 6]))
+        self.assertEqual([4, 5, 6], ids.tolist())
+        empty = box_index([])
+        self.assertEqual([], list(empty.intersection((0, 0, 0, 1, 1, 1))))
+        empty.insert(0, (0, 0, 0, 1, 1, 1))
+        self.assertEqual([0], list(empty.intersection((0, 0, 0, 1, 1, 1))))
+
+
+class TestVoxelIntersection(unittest.TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.strategy = VoxelIntersection()
+        self.strategy.affinity = 1
+        self.strategy.contacts = DistributionConfiguration.cast(3)
+        self.strategy.chunk_size = None
+        self.strategy.workers = 1
+        self.cells = (
+            np.arange(40),
+            random.rand(40, 3) * 200,
+            random.randint(2, size=40),
+            [random_cloud(1), random_cloud(2)],
+            np.arange(100, 140),
+            random.rand(40, 3) * 200,
+            random.randint(2, size=40),
+            [random_cloud(3), random_cloud(4)],
+        )
+
+    def intersect(self, chunk_size=None, workers=1, seed=0):
+        self.strategy.chunk_size = chunk_size
+        self.strategy.workers = workers
+        np.random.seed(seed)
+        return self.strategy.intersect_cells(*self.cells)
+
+    def test_pickle_cloud(self):
+        cloud = self.cells[3][0]
+        unpickled = pickle.loads(pickle.dumps(cloud))
+        box = tuple(cloud.get_voxel_box())
+        self.assertEqual(
+            sorted(cloud.tree.intersection(box)), sorted(unpickled.tree.intersection(box))
+        )
+        self.assertEqual(
+            len(cloud.get_voxels()), len(list(unpickled.tree.intersection(box)))
+        )
+
+    def test_chunks(self):
+        positions = self.cells[1]
+        self.strategy.chunk_size = 50
+        chunks = self.strategy.get_chunks(positions)
+        self.assertEqual(list(range(40)), sorted(np.concatenate(chunks)))
+        for chunk in chunks:
+            keys = np.floor(positions[chunk] / 50)
+            self.assertTrue(np.all(keys == keys[0]), "Chunk spans multiple cubes")
+
+    def test_chunked_intersection(self):
+        connections, morphologies, compartments = self.intersect()
+        self.assertGreater(len(connections), 0)
+        self.assertEqual(0, len(connections) % 3, "Each touching pair has 3 contacts")
+        self.assertEqual(connections.shape, morphologies.shape)
+        self.assertEqual(connections.shape, compartments.shape)
+        chunked = self.intersect(chunk_size=50)
+        # Chunking changes the random draws, but not which cells touch.
+        self.assertEqual(
+            set(map(tuple, connections)), set(map(tuple, chunked[0].tolist()))
+        )
+        # The result of a seed does not depend on the amount of workers.
+        parallel = self.intersect(chunk_size=50, workers=2)
+        for data, parallel_data in zip(chunked, parallel):
+            self.assertTrue(np.array_equal(data, parallel_data))
+        self.assertTrue(np.array_equal(chunked[0], self.intersect(chunk_size=50)[0]))
+
+    def test_chunk_clouds(self):
+        # Each chunk is only sent the clouds of the cells it intersects.
+        jobs = []
+
+        def intersect_chunk(job):
+            jobs.append(job)
+            return original(job)
+
+        original = voxel_intersection._intersect_chunk
+        with mock.patch.object(voxel_intersection, "_intersect_chunk", intersect_chunk):
+            chunked = self.intersect(chunk_size=50)
+        self.assertTrue(np.array_equal(chunked[0], self.intersect(chunk_size=50)[0]))
+        self.assertGreater(len(jobs), 1)
+        for (from_cells, to_cells, *_, from_clouds, to_clouds, _, _, _) in jobs:
+            self.assertEqual(set(from_cells[2].tolist()), set(from_clouds))
+            self.assertEqual(set(to_cells[2].tolist()), set(to_clouds))